@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import pty
+import resource
+import time
+
+import latency
+
+
+class NullSerialLink:
+    """Serial sink that only counts what would have been sent, so the benchmark needs no hardware."""
+
+    port = 'null'
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+
+    def write_line(self, line):
+        data = f"{line}\n".encode()
+        self.lines += 1
+        self.bytes += len(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'lines': self.lines, 'bytes': self.bytes}
+
+
+class PtySerialLink:
+    """Real SerialLink on a pty whose master side is drained, to include serial write cost."""
+
+    def __init__(self):
+        from serial_link import SerialLink
+
+        self._master, self._slave = pty.openpty()
+        self._link = SerialLink(os.ttyname(self._slave))
+        self.port = self._link.port
+
+    def write_line(self, line):
+        written = self._link.write_line(line)
+        os.read(self._master, 1024)
+        return written
+
+    def close(self):
+        self._link.close()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def stats(self):
+        return self._link.stats()
+
+
+def load_corpus(intent_csv='commands.csv', ner_csv='ner_commands.csv'):
+    sentences = []
+    for path in (intent_csv, ner_csv):
+        with open(path, newline='') as f:
+            sentences.extend(row['sentence'] for row in csv.DictReader(f))
+    return sentences
+
+
+def run_benchmark(repeat=1, serial='null', cache=False, phrase_index='off'):
+    """
+    Replay the shipped corpora through process_command (intent, NER, mapping, serial sink).
+    The phrase index is built from these same corpora, so with it 'on' most commands never reach
+    the models; it is 'off' by default so that the stage latencies are those of the models.
+    Returns:
+        dict: Throughput, per-stage latency percentiles, peak RSS and model load times.
+    """
+    os.environ['PHRASE_INDEX_MODE'] = phrase_index
+    import control_motor
+    from phrase_index import PhraseIndex
+
+    if control_motor.PHRASE_INDEX_MODE != phrase_index:  # Already imported by an earlier run
+        control_motor.PHRASE_INDEX_MODE = phrase_index
+        control_motor.phrase_index = PhraseIndex() if phrase_index != 'off' else None
+
+    errors = control_motor.warm_up(calibrate_microphone=False)
+    if errors:
+        raise RuntimeError(f"Model loading failed: {errors}")
+    if not cache:
+        control_motor.command_cache.maxsize = 0
+    motor = control_motor.motors.default
+    motor.link = NullSerialLink() if serial == 'null' else PtySerialLink()
+    motor.port = motor.link.port
+
+    sentences = load_corpus()
+    latency.enable()
+    latency.reset()
+    failed = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            for sentence in sentences:
+                if not control_motor.process_command(sentence):
+                    failed += 1
+    elapsed = time.perf_counter() - start
+    motor.link.close()
+
+    commands = repeat * len(sentences)
+    stages = {name: {k: v for k, v in summary.items() if k != 'buckets'}
+              for name, summary in latency.snapshot().items()}
+    index = control_motor.phrase_index
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'config': {
+            'repeat': repeat,
+            'serial': serial,
+            'cache': cache,
+            'phrase_index': control_motor.PHRASE_INDEX_MODE,
+            'intent_backend': control_motor.INTENT_BACKEND,
+        },
+        'commands': commands,
+        'failed': failed,
+        'elapsed_s': elapsed,
+        'commands_per_s': commands / elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'load_times_s': dict(control_motor.startup_times),
+        'stages': stages,
+        'serial': motor.link.stats(),
+        'phrase_index': index.stats() if index else None,
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{results['commands']} commands in {results['elapsed_s']:.2f} s: "
+          f"{results['commands_per_s']:.1f} commands/s, {results['failed']} failed "
+          f"(phrase index {results['config']['phrase_index']})")
+    index = results.get('phrase_index')
+    if index:
+        print(f"Answered by the phrase index instead of the models: {index['intent_hit_ratio']:.0%} of intents, "
+              f"{index['entity_hit_ratio']:.0%} of entities")
+    if baseline:
+        change = 100 * (results['commands_per_s'] / baseline['commands_per_s'] - 1)
+        print(f"  vs baseline {baseline['timestamp']}: {baseline['commands_per_s']:.1f} commands/s ({change:+.1f}%)")
+    print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB")
+    for name, seconds in results['load_times_s'].items():
+        print(f"Load {name}: {1000 * seconds:.1f} ms")
+    print(f"{'stage':<20} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}" + (f" {'base p50':>9} {'base p99':>9}" if baseline else ""))
+    for name, s in results['stages'].items():
+        line = f"{name:<20} {s['count']:>7} {s['p50_ms']:>9.3f} {s['p99_ms']:>9.3f}"
+        if baseline and name in baseline['stages']:
+            b = baseline['stages'][name]
+            line += f" {b['p50_ms']:>9.3f} {b['p99_ms']:>9.3f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark process_command end to end on commands.csv and ner_commands.csv."
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the corpora")
+    parser.add_argument("--serial", choices=['null', 'pty'], default='null',
+                        help="Serial sink: in-memory counter or a real SerialLink on a pty")
+    parser.add_argument("--cache", action="store_true", help="Keep the command cache enabled")
+    parser.add_argument("--phrase-index", choices=['on', 'off', 'verify'], default='off',
+                        help="PHRASE_INDEX_MODE for the run (default off: the index holds these corpora)")
+    parser.add_argument("--index-run", action="store_true",
+                        help="Also replay with the phrase index on and report that run separately")
+    parser.add_argument("-o", "--output", help="Write results JSON here (default: bench_results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeat, args.serial, args.cache, args.phrase_index)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.index_run and args.phrase_index != 'on':
+        results['index_run'] = run_benchmark(args.repeat, args.serial, args.cache, 'on')
+        print("\nWith the phrase index on (mostly dictionary lookups, since it holds the replayed corpora):")
+        print_results(results['index_run'], baseline.get('index_run') if baseline else None)
+
+    output = args.output or os.path.join('bench_results', f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
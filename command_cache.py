@@ -0,0 +1,130 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+_THOUSANDS = re.compile(r'(?<=\d),(?=\d{3}\b)')
+_TRAILING_ZEROS = re.compile(r'\b(\d+)\.0+\b')
+_PERCENT = re.compile(r'\s*(?:%|\bper\s?cent\b)')
+_TRAILING_PUNCT = re.compile(r'[.!?]+$')
+
+
+def normalize_text(text):
+    """
+    Fold an utterance to its cache key: lowercase, collapse whitespace, drop trailing
+    punctuation and fold number formats ("1,000" -> "1000", "50.0" -> "50",
+    "50%" / "50 percent" / "50 per cent" -> "50 %").
+    """
+    text = _WHITESPACE.sub(' ', text.lower()).strip()
+    text = _TRAILING_PUNCT.sub('', text)
+    text = _THOUSANDS.sub('', text)
+    text = _TRAILING_ZEROS.sub(r'\1', text)
+    text = _PERCENT.sub(' %', text)
+    return text.strip()
+
+
+def model_fingerprint(*model_dirs):
+    """Hash of (path, size, mtime) for every file under the given model directories."""
+    digest = hashlib.sha1()
+    for model_dir in model_dirs:
+        for root, _, files in sorted(os.walk(model_dir)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+class CommandCache:
+    """
+    Bounded LRU cache of (intent, entities) keyed on normalize_text(text).
+
+    Only the model outputs are cached. map_to_command still runs fresh against the
+    current speed and direction. The cache is cleared whenever the fingerprint of
+    the model directories changes; the fingerprint is rechecked at most every
+    `fingerprint_interval` seconds. maxsize=0 disables caching.
+    """
+
+    def __init__(self, maxsize=256, model_dirs=(), fingerprint_interval=5.0):
+        self.maxsize = maxsize
+        self.model_dirs = tuple(model_dirs)
+        self.fingerprint_interval = fingerprint_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = model_fingerprint(*self.model_dirs)
+        self._fingerprint_checked = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.hit_time_s = 0.0
+        self.miss_time_s = 0.0
+
+    def _check_fingerprint_locked(self):
+        now = time.monotonic()
+        if now - self._fingerprint_checked < self.fingerprint_interval:
+            return
+        self._fingerprint_checked = now
+        fingerprint = model_fingerprint(*self.model_dirs)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, text):
+        """Return a copy of the cached (intent, entities) for text, or None on a miss."""
+        if self.maxsize <= 0:
+            return None
+        start = time.perf_counter()
+        key = normalize_text(text)
+        with self._lock:
+            self._check_fingerprint_locked()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            intent, entities = entry
+            self.hit_time_s += time.perf_counter() - start
+        return intent, copy.copy(entities)
+
+    def put(self, text, intent, entities, compute_s=0.0):
+        """Store model outputs for text. compute_s is the model time this miss cost, for the stats."""
+        if self.maxsize <= 0:
+            return
+        key = normalize_text(text)
+        with self._lock:
+            self.miss_time_s += compute_s
+            self._entries[key] = (intent, copy.copy(entities))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'mean_hit_ms': 1000 * self.hit_time_s / self.hits if self.hits else 0.0,
+                'mean_miss_ms': 1000 * self.miss_time_s / self.misses if self.misses else 0.0,
+            }
@@ -1,239 +1,549 @@
-import torch
-import serial
 import time
+_import_start = time.perf_counter()
+import os
+import sys
+import argparse
+import functools
+import atexit
 import logging
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from extract_entities import extract_entities
-from voice_to_text import voice_to_text
-
-# Setup logging
-logging.basicConfig(
-    filename='motor_control.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Device detection
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-logging.info(f"Using device: {device}")
-print(f"Using device: {device}")
-
-# Load intent model and tokenizer (offline)
-try:
-    model = AutoModelForSequenceClassification.from_pretrained('./fine_tuned_intent_model').to(device)
-    tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
-except Exception as e:
-    logging.error(f"Failed to load intent model: {e}")
-    print(f"Error: Could not load intent model: {e}")
-    exit(1)
-
-# Intent label mapping
-label_map = {0: "increase", 1: "decrease", 2: "stop", 3: "set_speed", 4: "change_direction"}
-
-# Motor state
-current_speed = 0  # PWM 0-255
-current_direction = 'clc'  # Default: clockwise
-MAX_PWM = 255
+import threading
+import latency
+from intent_backends import INTENT_MODEL_DIR, label_map, load_backend
+from concurrent.futures import ThreadPoolExecutor
+from extract_entities import SPACY_MODEL_DIR, ENTITY_ENGINE, extract_entities, apply_intent_fallback, load_nlp
+from command_cache import CommandCache
+from phrase_index import PhraseIndex
+from voice_to_text import calibrate
+from transcribers import TRANSCRIBERS, make_transcriber
+from serial_protocol import PROTOCOLS
+from ramp_scheduler import PROFILES as RAMP_PROFILES
+from motor_controller import MAX_PWM, MotorRegistry, map_to_command  # map_to_command/MAX_PWM re-exported for existing callers
+from structured_logging import setup_logging, log_command
+
+# Setup logging: queue-backed, written by background threads; one JSON line per command in motor_commands.jsonl
+setup_logging('motor_control.log', 'motor_commands.jsonl')
+
+# Startup timings (seconds) for the startup report; torch, transformers and spaCy are imported by the loaders
+startup_times = {'import': time.perf_counter() - _import_start}
+startup_errors = {}
+ready = threading.Event()  # Set once warm_up() has finished every loader
+
+# Intent inference backend: eager (fp32 PyTorch), torchscript or int8 (see intent_backends.py),
+# or student (distilled hashed n-gram model, NumPy only, see intent_student.py)
+INTENT_BACKEND = os.environ.get('INTENT_BACKEND', 'eager')
+
+# Intent model and tokenizer, loaded on first use (or by warm_up)
+intent_forward = None
+intent_student = None
+tokenizer = None
+device = None
+pad_to_max_length = False
+_intent_lock = threading.Lock()
+
+def load_intent_model():
+    """Load the intent backend and tokenizer once (offline). Safe to call from several threads."""
+    global intent_forward, intent_student, tokenizer, device, pad_to_max_length
+    with _intent_lock:
+        if intent_forward is not None or intent_student is not None:
+            return
+        if INTENT_BACKEND == 'student':
+            from intent_student import IntentStudent, STUDENT_FILE
+            start = time.perf_counter()
+            try:
+                intent_student = IntentStudent.load(os.path.join(INTENT_MODEL_DIR, STUDENT_FILE))
+            except Exception as e:
+                logging.error(f"Failed to load intent student: {e}")
+                print(f"Error: Could not load intent student (run: python intent_student.py): {e}")
+                raise
+            device = 'cpu'
+            startup_times['intent_model_load'] = time.perf_counter() - start
+            logging.info("Loaded intent backend 'student' (NumPy, no torch)")
+            return
+        start = time.perf_counter()
+        import torch
+        from transformers import AutoTokenizer
+        startup_times['torch_import'] = time.perf_counter() - start
+
+        # Device detection
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        logging.info(f"Using device: {device}")
+        print(f"Using device: {device}")
+
+        start = time.perf_counter()
+        try:
+            forward, device, pad_to_max_length = load_backend(INTENT_BACKEND, INTENT_MODEL_DIR, device)
+            tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
+        except Exception as e:
+            logging.error(f"Failed to load intent model: {e}")
+            print(f"Error: Could not load intent model: {e}")
+            raise
+        intent_forward = forward
+        startup_times['intent_model_load'] = time.perf_counter() - start
+        logging.info(f"Loaded intent backend '{INTENT_BACKEND}' on {device}")
+
+# Motors, each with its own speed/direction state and serial link (opened on first send, kept for the session).
+# MOTOR_PORTS lists them as "name=port,..." (e.g. "left=/dev/ttyACM0,right=/dev/ttyACM1"); the first is the default.
+SERIAL_PORT = '/dev/ttyACM0'  # Change to your ESP32 serial port
+MOTOR_PORTS = os.environ.get('MOTOR_PORTS', SERIAL_PORT)
+# Wire format: 'ascii' "{speed},{direction}" lines, or 'binary' frames acknowledged by the board (serial_protocol.py)
+SERIAL_PROTOCOL = os.environ.get('SERIAL_PROTOCOL', 'ascii')
+# Speed ramping: 'off' sends each command's speed at once; 'linear', 'exponential' or 'step' send setpoints at
+# RAMP_TICK_HZ toward the latest command only (linear at RAMP_RATE PWM units/s), see ramp_scheduler.py
+RAMP_PROFILE = os.environ.get('RAMP_PROFILE', 'off')
+
+def _ramp_config(profile):
+    if profile == 'off':
+        return None
+    return {'profile': profile, 'rate': float(os.environ.get('RAMP_RATE', 510)),
+            'tick_hz': float(os.environ.get('RAMP_TICK_HZ', 50))}
+
+motors = MotorRegistry.from_spec(MOTOR_PORTS, SERIAL_PROTOCOL, _ramp_config(RAMP_PROFILE))
+atexit.register(lambda: motors.close())
+
+# Intent and entity models run side by side; both release the GIL in their native kernels
+nlp_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="nlp")
+
+# Cache of (intent, entities) per normalized utterance, cleared when either model directory changes
+COMMAND_CACHE_SIZE = int(os.environ.get('COMMAND_CACHE_SIZE', 256))
+command_cache = CommandCache(COMMAND_CACHE_SIZE, model_dirs=(INTENT_MODEL_DIR, SPACY_MODEL_DIR))
+
+# Fast path for phrases already in the training corpora: 'on', 'off', or 'verify' (also run the models and log drift)
+PHRASE_INDEX_MODE = os.environ.get('PHRASE_INDEX_MODE', 'on')
+phrase_index = PhraseIndex() if PHRASE_INDEX_MODE != 'off' else None
+
+def _load_spacy_model():
+    if ENTITY_ENGINE == 'rules':
+        return  # The rule engine never touches spaCy
+    start = time.perf_counter()
+    load_nlp()
+    startup_times['spacy_model_load'] = time.perf_counter() - start
+
+def _calibrate_microphone():
+    start = time.perf_counter()
+    if not calibrate():
+        raise RuntimeError("Microphone setup or noise adjustment failed")
+    startup_times['microphone_calibration'] = time.perf_counter() - start
+
+def warm_up(calibrate_microphone=True, wait=True):
+    """
+    Load the intent model, the spaCy model and calibrate the microphone in parallel background threads.
+    `ready` is set when all of them have finished, whether or not they succeeded.
+    Args:
+        calibrate_microphone (bool): Skip calibration when commands do not come from the microphone.
+        wait (bool): Block until everything is loaded.
+    Returns:
+        dict: Loader name -> exception for every loader that failed (filled in once `ready` is set).
+    """
+    loaders = {'intent_model': load_intent_model, 'spacy_model': _load_spacy_model}
+    if calibrate_microphone:
+        loaders['microphone'] = _calibrate_microphone
+    start = time.perf_counter()
+
+    def run(name, loader):
+        try:
+            loader()
+        except Exception as e:
+            startup_errors[name] = e
+
+    threads = [threading.Thread(target=run, args=item, name=f"warm-up-{item[0]}", daemon=True)
+               for item in loaders.items()]
+    for thread in threads:
+        thread.start()
+
+    def finish():
+        for thread in threads:
+            thread.join()
+        startup_times['warm_up_wall'] = time.perf_counter() - start
+        ready.set()
+
+    if wait:
+        finish()
+    else:
+        threading.Thread(target=finish, name="warm-up", daemon=True).start()
+    return startup_errors
+
+def startup_report():
+    """Format startup_times as a human-readable breakdown."""
+    lines = ["Startup time breakdown:"]
+    for name, seconds in startup_times.items():
+        lines.append(f"  {name:<24} {1000 * seconds:9.1f} ms")
+    serial_time = sum(v for k, v in startup_times.items() if k not in ('import', 'warm_up_wall'))
+    if 'warm_up_wall' in startup_times:
+        lines.append(f"  {'sum of loaders':<24} {1000 * serial_time:9.1f} ms (run in parallel)")
+    for name, error in startup_errors.items():
+        lines.append(f"  {name} failed: {error}")
+    return "\n".join(lines)
 
 def predict_intent(text):
-    """Predict intent using fine-tuned DistilBERT model."""
+    """Predict intent using fine-tuned DistilBERT model (or its distilled student)."""
+    intent, _ = predict_intents([text])[0]
+    if intent:
+        logging.debug("Predicted intent for '%s': %s", text, intent)
+    return intent
+
+def predict_intents(texts):
+    """
+    Predict intents for a list of texts in one padded forward pass.
+    Args:
+        texts (list[str]): Input commands.
+    Returns:
+        list[tuple]: (intent, confidence) per text, or (None, 0.0) for every text if inference fails.
+    """
+    if not texts:
+        return []
     try:
-        inputs = tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=32).to(device)
-        with torch.no_grad():
-            outputs = model(**inputs)
-        intent_id = torch.argmax(outputs.logits, dim=1).item()
-        intent = label_map[intent_id]
-        logging.info(f"Predicted intent for '{text}': {intent}")
-        return intent
+        load_intent_model()
+        if intent_student is not None:
+            with latency.stage('intent.forward'):
+                return intent_student.predict(list(texts))
+        import torch
+        padding = 'max_length' if pad_to_max_length else True
+        with latency.stage('intent.tokenize'):
+            inputs = tokenizer(list(texts), return_tensors='pt', padding=padding, truncation=True, max_length=32).to(device)
+        with latency.stage('intent.forward'), torch.no_grad():
+            logits = intent_forward(inputs['input_ids'], inputs['attention_mask'])
+        confidences, intent_ids = torch.softmax(logits, dim=1).max(dim=1)
+        return [(label_map[intent_id], confidence)
+                for intent_id, confidence in zip(intent_ids.tolist(), confidences.tolist())]
     except Exception as e:
-        logging.error(f"Intent prediction failed for '{text}': {e}")
+        logging.error("Intent prediction failed for %s text(s) %r: %s", len(texts), texts, e)
         print(f"Error: Intent prediction failed: {e}")
-        return None
+        return [(None, 0.0)] * len(texts)
+
+def configure_motors(spec, protocol=None, ramp_profile=None):
+    """Replace the motor registry, e.g. configure_motors("left=/dev/ttyACM0,right=/dev/ttyACM1")."""
+    global motors
+    old, motors = motors, MotorRegistry.from_spec(spec, protocol or SERIAL_PROTOCOL,
+                                                  _ramp_config(ramp_profile or RAMP_PROFILE))
+    old.close()
+    logging.info(f"Motors: {[(c.name, c.port) for c in motors.controllers]}")
+    return motors
 
-def map_to_command(intent, entities, current_speed, current_direction):
+def _timed(fn, *args):
+    """Run fn(*args) and return (result, start, end) perf_counter timestamps."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, start, time.perf_counter()
+
+def _run_nlp(text):
     """
-    Map intent and entities to ESP32 command (speed 0-255, direction clc/anticlc).
-    Returns: (new_speed, new_direction)
+    Predict intent and extract entities concurrently; the intent-dependent fallback runs once both finish.
+    Returns: (intent, entities, timings), or None if either model failed.
     """
+    start = time.perf_counter()
+    indexed_intent, indexed_entities = phrase_index.lookup(text) if phrase_index else (None, None)
+    intent_hit = PHRASE_INDEX_MODE == 'on' and indexed_intent is not None
+    entities_hit = PHRASE_INDEX_MODE == 'on' and indexed_entities is not None
+
+    # Only what the index could not resolve goes to the models
+    intent_future = None if intent_hit else nlp_pool.submit(_timed, predict_intent, text)
+    entities_future = None if entities_hit else nlp_pool.submit(_timed, extract_entities, text)
+    if intent_future:
+        intent, intent_start, intent_end = intent_future.result()
+    else:
+        intent, intent_start, intent_end = indexed_intent, start, start
+    if entities_future:
+        try:
+            entities, entities_start, entities_end = entities_future.result()
+        except Exception as e:
+            logging.error("Entity extraction failed for '%s': %s", text, e)
+            print(f"Error: Entity extraction failed: {e}")
+            return None
+    else:
+        entities, entities_start, entities_end = indexed_entities, start, start
+    if PHRASE_INDEX_MODE == 'verify' and (indexed_intent, indexed_entities) != (None, None):
+        phrase_index.record_check(text, (indexed_intent, indexed_entities), (intent, entities))
     if not intent:
-        logging.warning("No intent provided, returning current state")
-        return current_speed, current_direction
-    
-    value = entities.get('value')
-    unit = entities.get('unit')
-    direction = entities.get('direction')
-    
-    new_speed = current_speed
-    new_direction = current_direction
-    
-    # Validate entities
-    if value is not None and not isinstance(value, (int, float)):
-        logging.warning(f"Invalid value '{value}' for intent '{intent}'")
-        value = None
-    if direction not in [None, 'clc', 'anticlc', 'reverse']:
-        logging.warning(f"Invalid direction '{direction}' for intent '{intent}'")
-        direction = None
-    
-    logging.info(f"Input - intent: {intent}, entities: {entities}, current_speed: {current_speed}, current_direction: {current_direction}")
-
-    if intent in ['increase', 'decrease']:
-        # Incremental change based on current_speed
-        delta = 0
-        if unit == '%' and value is not None:
-            delta = int(MAX_PWM * (value / 100))
-            logging.info(f"Percent unit detected, value={value}, delta={delta}")
-        elif unit == 'half':
-            delta = current_speed // 2
-            logging.info(f"Half unit detected, delta={delta}")
-        elif unit == 'quarter':
-            delta = current_speed // 4
-            logging.info(f"Quarter unit detected, delta={delta}")
-        elif unit == 'double':
-            delta = current_speed
-            logging.info(f"Double unit detected, delta={delta}")
-        elif unit in ['max', 'maximum']:
-            delta = MAX_PWM - current_speed
-            logging.info(f"Max/maximum unit detected, delta={delta}")
-        elif unit in ['min', 'minimum']:
-            delta = current_speed
-            logging.info(f"Min/minimum unit detected, delta={delta}")
-        elif unit == 'default':
-            delta = int(MAX_PWM * (10 / 100))  # Default 10%
-            logging.info(f"Default unit detected, delta={delta}")
-        else:
-            logging.warning(f"Unknown unit '{unit}' for intent '{intent}', no change")
-        
-        # Apply delta
-        if intent == 'increase':
-            new_speed = min(current_speed + delta, MAX_PWM)
-        else:  # decrease
-            new_speed = max(current_speed - delta, 0)
-    
-    elif intent == 'set_speed':
-        # Set absolute speed
-        if unit == '%' and value is not None:
-            new_speed = min(int(MAX_PWM * (value / 100)), MAX_PWM)
-            logging.info(f"Set percent speed, value={value}, new_speed={new_speed}")
-        elif unit == 'half':
-            new_speed = MAX_PWM // 2
-            logging.info(f"Set half speed, new_speed={new_speed}")
-        elif unit == 'quarter':
-            new_speed = MAX_PWM // 4
-            logging.info(f"Set quarter speed, new_speed={new_speed}")
-        elif unit == 'double':
-            new_speed = MAX_PWM  # Full speed for double
-            logging.info(f"Set double speed, new_speed={new_speed}")
-        elif unit in ['max', 'maximum']:
-            new_speed = MAX_PWM
-            logging.info(f"Set max/maximum speed, new_speed={new_speed}")
-        elif unit in ['min', 'minimum']:
-            new_speed = 0
-            logging.info(f"Set min/minimum speed, new_speed={new_speed}")
-        elif unit == 'default':
-            new_speed = int(MAX_PWM * 0.1)  # Default 10%
-            logging.info(f"Set default speed, new_speed={new_speed}")
-        else:
-            logging.warning(f"Unknown unit '{unit}' for intent '{intent}', no change")
-    
-    elif intent == 'stop':
-        new_speed = 0
-        logging.info("Stop command, new_speed=0")
-    
-    elif intent == 'change_direction':
-        if direction == 'clc':
-            new_direction = 'clc'
-        elif direction == 'anticlc':
-            new_direction = 'anticlc'
-        elif direction == 'reverse':
-            new_direction = 'anticlc' if current_direction == 'clc' else 'clc'
-        else:
-            logging.warning(f"No valid direction for 'change_direction', toggling direction")
-            new_direction = 'anticlc' if current_direction == 'clc' else 'clc'
-        logging.info(f"Direction set to: {new_direction}")
+        return None
+    apply_intent_fallback(entities, intent)
+    nlp_end = time.perf_counter()
+    logging.debug("Extracted entities: %s", entities)
+    timings = {
+        'intent_ms': 1000 * (intent_end - intent_start),
+        'entities_ms': 1000 * (entities_end - entities_start),
+        'overlap_ms': 1000 * max(0.0, min(intent_end, entities_end) - max(intent_start, entities_start)),
+        'nlp_ms': 1000 * (nlp_end - start),
+        'index_intent': intent_hit,
+        'index_entities': entities_hit,
+    }
+    logging.debug("NLP stage timings for '%s': %s", text, timings)
+    return intent, entities, timings
+
+def interpret_command(text, use_cache=True):
+    """
+    Route text to its motor(s) and get intent and entities from the cache, the phrase index or the
+    models, without touching the motors.
+    Args:
+        text (str): Command, optionally addressing motors.
+        use_cache (bool): Read and fill the command cache (speculative partial transcripts skip it).
+    Returns:
+        tuple: (controllers, routed_text, intent, entities, timings), or None if the models failed.
+    """
+    controllers, text = motors.route(text)
+    logging.debug("Processing command: '%s' for motors %s", text, [c.name for c in controllers])
     
-    logging.info(f"Output - new_speed={new_speed}, new_direction={new_direction}")
-    return new_speed, new_direction
+    # Model outputs depend only on the text, so repeated phrases skip both models
+    cached = command_cache.get(text) if use_cache else None
+    if cached:
+        intent, entities = cached
+        timings = {'cache_hit': True}
+        logging.debug("Cache hit for '%s': intent=%s, entities=%s", text, intent, entities)
+    else:
+        nlp_result = _run_nlp(text)
+        if nlp_result is None:
+            return None
+        intent, entities, timings = nlp_result
+        timings['cache_hit'] = False
+        if use_cache:
+            command_cache.put(text, intent, entities, compute_s=timings['nlp_ms'] / 1000)
+    return controllers, text, intent, entities, timings
 
-def send_to_esp32(speed, direction):
-    """Send command to ESP32 via serial."""
-    port = '/dev/ttyACM0'  # Manually set port
-    try:
-        with serial.Serial(port, 115200, timeout=1) as ser:
-            ser.reset_input_buffer()  # Clear any stale data
-            command = f"{speed},{direction}\n".encode()
-            ser.write(command)
-            time.sleep(0.1)  # Serial stability
-            logging.info(f"Sent to ESP32 on {port}: {command.decode().strip()}")
-            print(f"Motor set to speed {speed}, direction {direction}")
-            return True
-    except serial.SerialException as e:
-        logging.error(f"Serial error on {port}: {e}")
-        print(f"Error: Could not send to ESP32: {e}")
-        return False
-    except Exception as e:
-        logging.error(f"Unexpected error on {port}: {e}")
-        print(f"Error: Unexpected serial error: {e}")
-        return False
+def dispatch_command(controllers, text, intent, entities, timings, wait=True, base=None):
+    """
+    Map an interpreted command to each motor and queue the writes (see process_command).
+    `base` (motor name -> (speed, direction)) maps from those states instead of the current
+    ones, to replace a command already applied from them (a corrected speculative commit).
+    """
+    # Map to command and queue the write on each motor; writes to different motors run concurrently
+    motor_results = {}
+    futures = []
+    for controller in controllers:
+        # Map and serial-write times of this motor, merged into its log record once the write is done
+        motor_timings = {}
+        queued = time.perf_counter()
+        previous, (new_speed, new_direction), future = controller.apply(
+            intent, entities, base.get(controller.name) if base else None, timings=motor_timings)
+        record = {
+            "text": text,
+            "motor": controller.name,
+            "port": controller.port,
+            "intent": intent,
+            "entities": entities,
+            "speed_before": previous[0],
+            "direction_before": previous[1],
+            "speed": new_speed,
+            "direction": new_direction,
+        }
+
+        def done(f, record=record, motor_timings=motor_timings, queued=queued):
+            write_done_ms = 1000 * (time.perf_counter() - queued)
+            log_command({**record, "timings": {**timings, **motor_timings, "write_done_ms": write_done_ms},
+                         "success": f.result()})
 
-def process_command(text):
-    """Full pipeline: Predict intent, extract entities, map to command, send to ESP32."""
-    global current_speed, current_direction
+        future.add_done_callback(done)
+        motor_results[controller.name] = {"speed": new_speed, "direction": new_direction, "success": None,
+                                          "speed_before": previous[0], "direction_before": previous[1]}
+        futures.append((controller.name, future))
+    
+    success = None
+    if wait:
+        for name, future in futures:
+            motor_results[name]["success"] = future.result()
+        success = all(motor_result["success"] for motor_result in motor_results.values())
     
+    first = motor_results[controllers[0].name]
+    return {
+        "intent": intent,
+        "entities": entities,
+        "speed": first["speed"],
+        "direction": first["direction"],
+        "success": success,
+        "motors": motor_results,
+        "timings": timings
+    }
+
+@latency.timed('process_command')
+def process_command(text, wait=True):
+    """
+    Full pipeline: Route to the addressed motor(s), predict intent, extract entities, map to command, send to ESP32.
+    Args:
+        text (str): Command, optionally addressing motors ("motor two reverse", "all motors stop").
+        wait (bool): Wait for the serial writes. Without waiting, "success" is None and each
+            motor's result is logged once its write finishes.
+    Returns:
+        dict: Intent, entities, timings, overall success and per-motor results under "motors";
+            "speed"/"direction" are those of the first addressed motor. None if the command failed.
+    """
     if not text or not text.strip():
         logging.warning("Empty or invalid command received")
         print("Error: Please enter a valid command")
         return None
     
-    logging.info(f"Processing command: '{text}', current state: speed={current_speed}, direction={current_direction}")
-    
-    # Predict intent
-    intent = predict_intent(text)
-    if not intent:
+    interpreted = interpret_command(text)
+    if interpreted is None:
         return None
-    
-    # Extract entities
+    return dispatch_command(*interpreted, wait=wait)
+
+def _log_exit_stats():
+    logging.info(f"Exiting motor control, motor stats: {motors.stats()}, "
+                 f"command cache stats: {command_cache.stats()}, "
+                 f"phrase index stats: {phrase_index.stats() if phrase_index else None}")
+
+def run_continuous(transcriber, max_queue, drop_policy):
+    """Listen continuously, overlapping capture of the next command with processing of the previous one."""
+    from streaming_listener import StreamingListener
+
+    capture_fn = None if transcriber.uses_microphone else transcriber.capture
+    # Don't wait for serial writes: a slow port must not hold up commands for the other motors
+    listener = StreamingListener(functools.partial(process_command, wait=False), transcribe_fn=transcriber.transcribe, max_queue=max_queue,
+                                 drop_policy=drop_policy, capture_fn=capture_fn)
+    listener.start()
+    if capture_fn is None:
+        print("Listening continuously (press Enter to stop)")
+        input()
+        listener.stop()
+    else:
+        listener.join()
+    print(f"Listener stats: {listener.stats()}")
+
+def run_replay(transcriber):
+    """Feed every command from a finite transcriber (recordings or text file) through the pipeline."""
+    processed = failed = 0
+    while not transcriber.exhausted:
+        text = transcriber.next_text()
+        result = process_command(text) if text else None
+        if result:
+            processed += 1
+            print(f"Result: {result}")
+        else:
+            failed += 1
+            print(f"Command failed: {text!r}")
+    print(f"Replayed {processed + failed} commands: {processed} processed, {failed} failed")
+
+def run_speculative(transcriber, stable_updates, word_ms, endpoint_ms):
+    """
+    Replay each transcript word by word as a streaming transcriber's partial hypotheses, committing
+    a command to the motors once its prediction is stable (see speculative_intent.py).
+    """
+    from speculative_intent import pipeline_committer, replay_partials, run_utterance, summarize
+
+    committer = pipeline_committer(sys.modules[__name__], stable_updates)
+    outcomes = []
+    while not transcriber.exhausted:
+        text = transcriber.next_text()
+        if not text:
+            continue
+        outcome = run_utterance(committer, replay_partials(text, word_ms, endpoint_ms))
+        outcomes.append(outcome)
+        if outcome['early']:
+            note = (f"committed after {outcome['commit_update']}/{outcome['updates']} words, "
+                    f"{outcome['saved_ms']:.0f} ms early" + (", corrected" if outcome['corrected'] else "")
+                    + (f", restored {', '.join(outcome['restored'])}" if outcome['restored'] else ""))
+        else:
+            note = "committed on the final transcript"
+        print(f"{text!r}: {note}" if outcome['result'] else f"Command failed: {text!r}")
+    summary = summarize(outcomes)
+    print(f"Speculative commits: {summary['early_commits']}/{summary['utterances']} early, "
+          f"{summary['saved_ms_mean']:.0f} ms saved per early commit, {summary['corrected']} corrected, "
+          f"{summary['restored']} with motors restored")
+    logging.info(f"Speculative summary: {summary}")
+
+def serve_daemon(args):
+    """--serve: models and serial links are loaded once, then commands come from socket clients."""
+    from motor_daemon import serve
+
+    if args.motor or args.protocol or args.ramp:
+        configure_motors(','.join(args.motor) if args.motor else MOTOR_PORTS, args.protocol, args.ramp)
+    if args.latency_dump:
+        latency.enable(args.latency_dump)
+        latency.dump_on_signal(args.latency_dump)
+    warm_up(calibrate_microphone=False)
+    print(startup_report())
+    logging.info(startup_report())
+    if startup_errors:
+        exit(1)
+    stats = serve(process_command, args.serve, motors.stats, args.workers)
+    logging.info(f"Daemon stats: {stats}")
+    if latency.enabled:
+        print(latency.format_table())
+    _log_exit_stats()
+
+def main():
+    parser = argparse.ArgumentParser(description="Voice-controlled motor driver.")
+    parser.add_argument("--transcriber", default='google', choices=TRANSCRIBERS,
+                        help="Where command text comes from: microphone + Google API, microphone + offline "
+                             "engine, a directory of recordings, or a text file")
+    parser.add_argument("--source", help="Recordings directory for --transcriber replay, file for --transcriber text")
+    parser.add_argument("--engine", help="speech_recognition engine override, e.g. sphinx, google or sidecar")
+    parser.add_argument("--continuous", action="store_true",
+                        help="Listen continuously instead of once per Enter key press")
+    parser.add_argument("--max-queue", type=int, default=4,
+                        help="Captured phrases waiting for transcription in continuous mode")
+    parser.add_argument("--latency-dump", metavar="PATH",
+                        help="Record per-stage latency histograms and write them to PATH as JSON on exit "
+                             "(and on SIGUSR1)")
+    parser.add_argument("--motor", action="append", metavar="NAME=PORT",
+                        help="Register a motor (repeatable); overrides MOTOR_PORTS. Address it in commands as "
+                             "\"motor NAME\", by port or by position (\"motor two\")")
+    parser.add_argument("--protocol", choices=PROTOCOLS,
+                        help="Serial wire format; overrides SERIAL_PROTOCOL. 'binary' waits for an ack per "
+                             "command and retransmits on loss (needs the binary decoder on the ESP32)")
+    parser.add_argument("--ramp", choices=('off',) + RAMP_PROFILES,
+                        help="Ramp speed changes at a fixed tick rate instead of jumping; overrides RAMP_PROFILE")
+    parser.add_argument("--serve", metavar="SOCKET", nargs='?', const='/tmp/motor_control.sock',
+                        help="Run as a daemon: load everything once and serve commands as JSON lines on this Unix "
+                             "socket (see motor_daemon.py) instead of listening")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent commands in --serve mode")
+    parser.add_argument("--speculate", type=int, metavar="N",
+                        help="With --transcriber replay/text: feed each transcript word by word and commit once "
+                             "N consecutive partials agree, before the final transcript")
+    parser.add_argument("--word-ms", type=float, default=300.0, help="Replayed time between words for --speculate")
+    parser.add_argument("--endpoint-ms", type=float, default=600.0,
+                        help="Replayed delay from the last word to the final transcript for --speculate")
+    parser.add_argument("--drop-policy", default='drop_oldest', choices=['block', 'drop_oldest', 'drop_newest'],
+                        help="What to do with new audio when the continuous-mode queue is full")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_daemon(args)
+        return
+
     try:
-        entities = extract_entities(text, intent)
-        logging.info(f"Extracted entities: {entities}")
-    except Exception as e:
-        logging.error(f"Entity extraction failed for '{text}': {e}")
-        print(f"Error: Entity extraction failed: {e}")
-        return None
-    
-    # Map to command
-    new_speed, new_direction = map_to_command(intent, entities, current_speed, current_direction)
-    
-    # Update state
-    logging.info(f"Updating state: current_speed={current_speed} -> {new_speed}, current_direction={current_direction} -> {new_direction}")
-    current_speed = new_speed
-    current_direction = new_direction
-    
-    # Send to ESP32
-    success = send_to_esp32(new_speed, new_direction)
-    
-    result = {
-        "intent": intent,
-        "entities": entities,
-        "speed": new_speed,
-        "direction": new_direction,
-        "success": success
-    }
-    logging.info(f"Processed command '{text}': {result}")
-    return result
+        transcriber = make_transcriber(args.transcriber, args.source, args.engine)
+    except ValueError as e:
+        parser.error(str(e))
 
-if __name__ == "__main__":
-    print("Voice-Controlled Motor (type 'exit' to quit)")
-    while True:
-        command = input("Press Enter to speak or type 'exit' to quit: ")
-        if command.lower() == 'exit':
-            logging.info("Exiting motor control")
-            break
-        text = voice_to_text()
-        if text:
-            result = process_command(text)
-            if result:
-                print(f"Result: {result}")
+    if args.motor or args.protocol or args.ramp:
+        configure_motors(','.join(args.motor) if args.motor else MOTOR_PORTS, args.protocol, args.ramp)
+
+    if args.latency_dump:
+        latency.enable(args.latency_dump)
+        latency.dump_on_signal(args.latency_dump)
+
+    warm_up(calibrate_microphone=transcriber.uses_microphone)
+    print(startup_report())
+    logging.info(startup_report())
+    if startup_errors:
+        exit(1)
+
+    if args.speculate:
+        if transcriber.uses_microphone:
+            parser.error("--speculate needs --transcriber replay or text (the microphone engines do not stream)")
+        run_speculative(transcriber, args.speculate, args.word_ms, args.endpoint_ms)
+    elif args.continuous:
+        run_continuous(transcriber, args.max_queue, args.drop_policy)
+    elif not transcriber.uses_microphone:
+        run_replay(transcriber)
+    else:
+        print("Voice-Controlled Motor (type 'exit' to quit)")
+        while True:
+            command = input("Press Enter to speak or type 'exit' to quit: ")
+            if command.lower() == 'exit':
+                break
+            text = transcriber.next_text()
+            if text:
+                result = process_command(text)
+                if result:
+                    print(f"Result: {result}")
+                else:
+                    print("Command failed. Check logs for details.")
             else:
-                print("Command failed. Check logs for details.")
-        else:
-            print("No command detected. Try again.")
\ No newline at end of file
+                print("No command detected. Try again.")
+    print(f"Transcriber stats: {transcriber.stats()}")
+    logging.info(f"Transcriber stats: {transcriber.stats()}")
+    if latency.enabled:
+        print(latency.format_table())
+    _log_exit_stats()
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,60 @@
-import spacy
-import re
+import os
+import sys
+import time
 import logging
+import threading
+import latency
+from rule_entities import (UNIT_TABLE, DIRECTION_TABLE, MISLABELLED_DIRECTION_UNITS, MAX_RE, MIN_RE,
+                           parse_value, rule_spans, is_confident)
 
-# Setup logging
-logging.basicConfig(
-    filename='motor_control.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Load fine-tuned spaCy model
-try:
-    nlp = spacy.load("./fine_tuned_spacy_ner")
-except Exception as e:
-    logging.error(f"Failed to load spaCy model: {e}")
-    raise RuntimeError(f"Failed to load spaCy model: {e}")
-
-def extract_entities(text, intent=None):
+SPACY_MODEL_DIR = "./fine_tuned_spacy_ner"
+EMPTY_ENTITIES = {'value': None, 'unit': None, 'direction': None}
+
+# 'spacy' (fine-tuned NER), 'rules' (lookup tables only, see rule_entities.py) or
+# 'prefilter' (rules when they account for every word, spaCy otherwise)
+ENTITY_ENGINE = os.environ.get('ENTITY_ENGINE', 'spacy')
+
+# Fine-tuned spaCy model, loaded on first use (or by control_motor.warm_up)
+nlp = None
+_nlp_lock = threading.Lock()
+
+def ner_only_exclusions(model_dir, config=None):
+    """
+    Names of every pipeline component the NER does not need (tagger, parser, lemmatizer, ...).
+    A shared tok2vec is kept only if the ner component listens to it.
+    """
+    import spacy
+    config = config or spacy.util.load_config(f"{model_dir}/config.cfg")
+    keep = {'ner'}
+    ner_tok2vec = config['components'].get('ner', {}).get('model', {}).get('tok2vec', {})
+    if 'Listener' in ner_tok2vec.get('@architectures', ''):
+        keep.add('tok2vec')
+    return [name for name in config['nlp']['pipeline'] if name not in keep]
+
+def load_nlp(slim=True):
+    """
+    Load the fine-tuned spaCy model once and return it. Safe to call from several threads.
+    With slim=True (the default) every component except the NER is excluded at load time.
+    """
+    global nlp
+    with _nlp_lock:
+        if nlp is None:
+            try:
+                import spacy
+                exclude = ner_only_exclusions(SPACY_MODEL_DIR) if slim else []
+                nlp = spacy.load(SPACY_MODEL_DIR, exclude=exclude)
+            except Exception as e:
+                logging.error(f"Failed to load spaCy model: {e}")
+                raise RuntimeError(f"Failed to load spaCy model: {e}")
+    return nlp
+
+def extract_entities(text, intent=None, engine=None):
     """
     Extract entities (value, unit, direction) from text using spaCy NER model with regex fallback.
     Args:
         text (str): Input command (e.g., "set the speed to 90%").
         intent (str, optional): Intent from predict_intent (e.g., "set_speed").
+        engine (str, optional): Override ENTITY_ENGINE ('spacy', 'rules' or 'prefilter').
     Returns:
         dict: {'value': int/float/None, 'unit': str/None, 'direction': str/None}
     """
@@ -32,73 +65,187 @@ def extract_entities(text, intent=None):
     try:
         # Lowercase for consistency
         text = text.lower()
-        doc = nlp(text)
-        entities = {'value': None, 'unit': None, 'direction': None}
-        
-        for ent in doc.ents:
-            if ent.label_ == "VALUE":
-                try:
-                    # Handle percentage or numeric values
-                    value_text = ent.text.replace('%', '').strip()
-                    entities['value'] = float(value_text) if '.' in value_text else int(value_text)
-                except ValueError:
-                    logging.warning(f"Invalid VALUE entity: '{ent.text}'")
-                    entities['value'] = None
-            elif ent.label_ == "UNIT":
-                unit = ent.text.lower()
-                if unit in ['percent', '%']:
-                    entities['unit'] = '%'
-                elif unit in ['half']:
-                    entities['unit'] = 'half'
-                elif unit in ['quarter']:
-                    entities['unit'] = 'quarter'
-                elif unit in ['double']:
-                    entities['unit'] = 'double'
-                elif unit in ['max', 'maximum']:
-                    entities['unit'] = 'max'
-                elif unit in ['min', 'minimum']:
-                    entities['unit'] = 'min'
-                else:
-                    logging.warning(f"Unknown UNIT entity: '{unit}'")
-                    entities['unit'] = None
-            elif ent.label_ == "DIRECTION":
-                direction = ent.text.lower()
-                if direction in ['clockwise', 'clc']:
-                    entities['direction'] = 'clc'
-                elif direction in ['anticlockwise', 'anticlc', 'counterclockwise']:
-                    entities['direction'] = 'anticlc'
-                elif direction in ['reverse']:
-                    entities['direction'] = 'reverse'
-                elif direction in ['max', 'maximum', 'min', 'minimum']:
-                    logging.warning(f"Misclassified DIRECTION entity: '{direction}', correcting to UNIT")
-                    entities['direction'] = None
-                    entities['unit'] = 'max' if direction in ['max', 'maximum'] else 'min'
-                else:
-                    logging.warning(f"Unknown DIRECTION entity: '{direction}'")
-                    entities['direction'] = None
-        
-        # Regex fallback for max/min
-        if entities['unit'] is None:
-            if re.search(r'\b(max|maximum)\b', text):
-                entities['unit'] = 'max'
-                logging.info(f"Regex fallback: Set unit to 'max' for '{text}'")
-            elif re.search(r'\b(min|minimum)\b', text):
-                entities['unit'] = 'min'
-                logging.info(f"Regex fallback: Set unit to 'min' for '{text}'")
-        
-        # Intent-based fallback for direction
-        if intent == "change_direction" and entities['direction'] is None:
-            entities['direction'] = 'reverse'
-            logging.info(f"Fallback: Set direction to 'reverse' for intent 'change_direction'")
-
-        logging.info(f"Extracted entities from '{text}': {entities}")
+        engine = engine or ENTITY_ENGINE
+        if engine != 'spacy':
+            entities = _extract_with_rules(text, require_confident=engine == 'prefilter')
+            if entities is not None:
+                apply_intent_fallback(entities, intent)
+                logging.debug("Extracted entities by rules from '%s': %s", text, entities)
+                return entities
+        nlp = load_nlp()
+        with latency.stage('entities.ner'):
+            doc = nlp(text)
+        with latency.stage('entities.normalize'):
+            entities = entities_from_spans([(ent.label_, ent.text) for ent in doc.ents], text)
+
+        apply_intent_fallback(entities, intent)
+
+        logging.debug("Extracted entities from '%s': %s", text, entities)
         return entities
     
     except Exception as e:
-        logging.error(f"Entity extraction failed for '{text}': {e}")
+        logging.error("Entity extraction failed for '%s': %s", text, e)
         return {'value': None, 'unit': None, 'direction': None}
 
+def extract_entities_batch(texts, intents=None, batch_size=64, n_process=1):
+    """
+    Batched extract_entities: runs the NER over all texts with nlp.pipe.
+    Args:
+        texts (list[str]): Input commands.
+        intents (list[str], optional): Intent per text, for the intent-based fallback.
+        batch_size (int): Texts per nlp.pipe batch.
+        n_process (int): Worker processes for nlp.pipe (1 = in-process).
+    Returns:
+        list[dict]: One entities dict per text, in input order.
+    """
+    intents = intents or [None] * len(texts)
+    results = [dict(EMPTY_ENTITIES) for _ in texts]
+    indexed = []
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        text = text.lower()
+        entities = None
+        if ENTITY_ENGINE != 'spacy':
+            entities = _extract_with_rules(text, require_confident=ENTITY_ENGINE == 'prefilter')
+        if entities is not None:
+            results[i] = apply_intent_fallback(entities, intents[i])
+        else:
+            indexed.append((i, text))
+    if not indexed:
+        return results
+    try:
+        model = load_nlp()
+        with latency.stage('entities.ner_batch'):
+            docs = list(model.pipe((text for _, text in indexed), batch_size=batch_size, n_process=n_process))
+        for (i, text), doc in zip(indexed, docs):
+            entities = entities_from_spans([(ent.label_, ent.text) for ent in doc.ents], text)
+            results[i] = apply_intent_fallback(entities, intents[i])
+    except Exception as e:
+        logging.error("Batched entity extraction failed for %s text(s): %s", len(texts), e)
+    return results
+
+def _extract_with_rules(text, require_confident):
+    """Entities from the lookup-table engine, or None when require_confident and the rules are unsure."""
+    with latency.stage('entities.rules'):
+        spans, unknown = rule_spans(text)
+        if require_confident and not is_confident(spans, unknown):
+            return None
+        return entities_from_spans(spans, text)
+
+def entities_from_spans(spans, text):
+    """
+    Normalize labelled spans into the entities dict, then apply the regex fallback for max/min.
+    Shared by the spaCy path and anything else that produces (label, text) spans.
+    Args:
+        spans (list[tuple]): (label, span_text) pairs, label in VALUE/UNIT/DIRECTION.
+        text (str): The full lowercased command, used by the regex fallback.
+    Returns:
+        dict: {'value': int/float/None, 'unit': str/None, 'direction': str/None}
+    """
+    entities = dict(EMPTY_ENTITIES)
+    
+    for label, span in spans:
+        if label == "VALUE":
+            # Handle percentage, numeric and number-word values
+            entities['value'] = parse_value(span)
+            if entities['value'] is None:
+                logging.warning("Invalid VALUE entity: '%s'", span)
+        elif label == "UNIT":
+            unit = span.lower()
+            entities['unit'] = UNIT_TABLE.get(unit)
+            if entities['unit'] is None:
+                logging.warning("Unknown UNIT entity: '%s'", unit)
+        elif label == "DIRECTION":
+            direction = span.lower()
+            if direction in DIRECTION_TABLE:
+                entities['direction'] = DIRECTION_TABLE[direction]
+            elif direction in MISLABELLED_DIRECTION_UNITS:
+                logging.warning("Misclassified DIRECTION entity: '%s', correcting to UNIT", direction)
+                entities['direction'] = None
+                entities['unit'] = MISLABELLED_DIRECTION_UNITS[direction]
+            else:
+                logging.warning("Unknown DIRECTION entity: '%s'", direction)
+                entities['direction'] = None
+    
+    # Regex fallback for max/min
+    if entities['unit'] is None:
+        if MAX_RE.search(text):
+            entities['unit'] = 'max'
+            logging.debug("Regex fallback: Set unit to 'max' for '%s'", text)
+        elif MIN_RE.search(text):
+            entities['unit'] = 'min'
+            logging.debug("Regex fallback: Set unit to 'min' for '%s'", text)
+    return entities
+
+def apply_intent_fallback(entities, intent):
+    """
+    Fill entities that can be inferred from the intent alone. Cheap, so it can run
+    after intent prediction and entity extraction have finished in parallel.
+    Returns:
+        dict: The same entities dict, updated in place.
+    """
+    # Intent-based fallback for direction
+    if intent == "change_direction" and entities['direction'] is None:
+        entities['direction'] = 'reverse'
+        logging.debug("Fallback: Set direction to 'reverse' for intent 'change_direction'")
+    return entities
+
+def _measure(slim, data_file='ner_commands.csv', batch_size=64):
+    """Per-utterance latency and peak RSS for the full or slim pipeline. Run in its own process."""
+    import csv
+    import resource
+
+    with open(data_file, newline='') as f:
+        texts = [row['sentence'] for row in csv.DictReader(f)]
+    start = time.perf_counter()
+    model = load_nlp(slim=slim)
+    load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for text in texts:
+        extract_entities(text)
+    single_s = time.perf_counter() - start
+    start = time.perf_counter()
+    extract_entities_batch(texts, batch_size=batch_size)
+    batch_s = time.perf_counter() - start
+    return {
+        'pipeline': 'slim' if slim else 'full',
+        'components': model.pipe_names,
+        'load_s': load_s,
+        'single_ms': 1000 * single_s / len(texts),
+        'batch_ms': 1000 * batch_s / len(texts),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def report_savings():
+    """Compare the full pipeline against the NER-only one, each in a fresh process so RSS is isolated."""
+    import json
+    import subprocess
+
+    results = []
+    for mode in ('full', 'slim'):
+        out = subprocess.run([sys.executable, __file__, '--measure', mode],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    for r in results:
+        print(f"{r['pipeline']:<5} components={r['components']}")
+        print(f"      load {1000 * r['load_s']:.1f} ms, nlp(text) {r['single_ms']:.3f} ms/utterance, "
+              f"nlp.pipe {r['batch_ms']:.3f} ms/utterance, peak RSS {r['peak_rss_mb']:.1f} MB")
+    full, slim = results
+    # Component stripping and batching are reported apart, each with the other held fixed
+    print(f"Slim vs full: {full['single_ms'] - slim['single_ms']:.3f} ms/utterance with nlp(text), "
+          f"{full['batch_ms'] - slim['batch_ms']:.3f} ms/utterance with nlp.pipe, "
+          f"{full['peak_rss_mb'] - slim['peak_rss_mb']:.1f} MB RSS")
+    print(f"nlp.pipe vs nlp(text) on the slim pipeline: {slim['single_ms'] - slim['batch_ms']:.3f} ms/utterance")
+
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--measure':
+        import json
+        print(json.dumps(_measure(slim=sys.argv[2] == 'slim')))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        report_savings()
+        sys.exit(0)
     print("SpaCy NER Entity Extractor Tester (type 'exit' to quit)")
     while True:
         text = input("Enter command: ")
@@ -1,62 +1,181 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments
-from datasets import load_dataset
+from transformers import (AutoTokenizer, AutoModelForSequenceClassification, DataCollatorWithPadding,
+                          Trainer, TrainingArguments)
+from datasets import load_dataset, load_from_disk
 from sklearn.metrics import accuracy_score, f1_score
 
-# Load dataset (offline)
-dataset = load_dataset('csv', data_files='commands.csv')
-dataset = dataset['train'].train_test_split(test_size=0.2)  # 80/20 split
+DATA_FILE = 'commands.csv'
+BASE_MODEL = 'distilbert-base-uncased'
+MAX_LENGTH = 32  # Short commands
+CACHE_DIR = '.cache/intent_tokenized'
+
+# Map intents to labels
+label_map = {"increase": 0, "decrease": 1, "stop": 2, "set_speed": 3, "change_direction": 4}
 
-# Tokenizer (downloaded offline)
-tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
 
-def tokenize_function(examples):
-    return tokenizer(examples['sentence'], padding='max_length', truncation=True, max_length=32)  # Short commands
+def dataset_fingerprint(data_file, tokenizer, pad_to_max_length):
+    """Hash of the corpus bytes, the tokenizer vocabulary and the tokenization settings."""
+    digest = hashlib.sha256()
+    with open(data_file, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    digest.update(json.dumps({'tokenizer': type(tokenizer).__name__, 'max_length': MAX_LENGTH,
+                              'pad_to_max_length': pad_to_max_length, 'labels': label_map}).encode())
+    return digest.hexdigest()[:16]
 
-tokenized_datasets = dataset.map(tokenize_function, batched=True)
 
-# Map intents to labels
-label_map = {"increase": 0, "decrease": 1, "stop": 2, "set_speed": 3, "change_direction": 4}
-tokenized_datasets = tokenized_datasets.map(lambda examples: {'labels': label_map[examples['intent']]})
-
-# Model (small, fine-tune on GPU)
-model = AutoModelForSequenceClassification.from_pretrained('distilbert-base-uncased', num_labels=5)
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model.to(device)
-
-# Training args
-training_args = TrainingArguments(
-    output_dir='./results',
-    num_train_epochs=20,
-    per_device_train_batch_size=8,
-    per_device_eval_batch_size=8,
-    warmup_steps=10,
-    weight_decay=0.01,
-    logging_dir='./logs',
-    eval_strategy='epoch',  # Updated from evaluation_strategy
-    save_strategy='epoch',
-    load_best_model_at_end=True,
-    metric_for_best_model='f1',
-    logging_steps=10,  # Log more frequently for small dataset
-    save_total_limit=2,  # Save only best 2 checkpoints
-)
+def load_tokenized(data_file, tokenizer, pad_to_max_length=False, cache_dir=CACHE_DIR):
+    """
+    Tokenize data_file with labels, reusing the copy under cache_dir when corpus and tokenizer are unchanged.
+    Without pad_to_max_length sequences are left unpadded for DataCollatorWithPadding.
+    Returns:
+        tuple: (Dataset, cache_hit)
+    """
+    path = os.path.join(cache_dir, dataset_fingerprint(data_file, tokenizer, pad_to_max_length)) if cache_dir else None
+    if path and os.path.isdir(path):
+        return load_from_disk(path), True
+
+    def tokenize_function(examples):
+        encoded = tokenizer(examples['sentence'], truncation=True, max_length=MAX_LENGTH,
+                            padding='max_length' if pad_to_max_length else False)
+        encoded['labels'] = [label_map[intent] for intent in examples['intent']]
+        return encoded
+
+    dataset = load_dataset('csv', data_files=data_file)['train']
+    tokenized = dataset.map(tokenize_function, batched=True, remove_columns=dataset.column_names)
+    if path:
+        tokenized.save_to_disk(path)
+    return tokenized, False
+
 
 def compute_metrics(pred):
     labels = pred.label_ids
     preds = pred.predictions.argmax(-1)
     return {'accuracy': accuracy_score(labels, preds), 'f1': f1_score(labels, preds, average='weighted')}
 
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=tokenized_datasets['train'],
-    eval_dataset=tokenized_datasets['test'],
-    compute_metrics=compute_metrics,
-)
 
-# Fine-tune (runs on GPU, ~5-10 min)
-trainer.train()
+def train(args, tokenizer, pad_to_max_length, group_by_length):
+    """
+    One fine-tuning run with the given padding setup.
+    Returns:
+        tuple: (Trainer, timing dict as written to results/train_timing.json)
+    """
+    start = time.perf_counter()
+    tokenized, cache_hit = load_tokenized(args.data, tokenizer, pad_to_max_length,
+                                          None if args.no_cache else CACHE_DIR)
+    tokenize_s = time.perf_counter() - start
+    print(f"Tokenized dataset {'loaded from cache' if cache_hit else 'built'} in {tokenize_s:.2f} s")
+    tokenized_datasets = tokenized.train_test_split(test_size=0.2, seed=args.seed)  # 80/20 split
+
+    # Model (small, fine-tune on GPU)
+    model = AutoModelForSequenceClassification.from_pretrained(BASE_MODEL, num_labels=5)
+
+    # Training args
+    training_args = TrainingArguments(
+        output_dir='./results',
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.eval_batch_size,
+        group_by_length=group_by_length,  # Similar lengths per batch, so dynamic padding adds little
+        use_cpu=args.cpu,
+        seed=args.seed,
+        warmup_steps=10,
+        weight_decay=0.01,
+        logging_dir='./logs',
+        eval_strategy='epoch',  # Updated from evaluation_strategy
+        save_strategy='epoch',
+        load_best_model_at_end=True,
+        metric_for_best_model='f1',
+        logging_steps=10,  # Log more frequently for small dataset
+        save_total_limit=2,  # Save only best 2 checkpoints
+    )
+
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized_datasets['train'],
+        eval_dataset=tokenized_datasets['test'],
+        data_collator=None if pad_to_max_length else DataCollatorWithPadding(tokenizer),
+        compute_metrics=compute_metrics,
+    )
+
+    # Fine-tune (runs on GPU, ~5-10 min)
+    start = time.perf_counter()
+    trainer.train()
+    train_s = time.perf_counter() - start
+    metrics = trainer.evaluate()
+
+    timing = {
+        'device': str(training_args.device),
+        'threads': torch.get_num_threads(),
+        'batch_size': args.batch_size,
+        'epochs': args.epochs,
+        'pad_to_max_length': pad_to_max_length,
+        'group_by_length': group_by_length,
+        'tokenize_s': tokenize_s,
+        'tokenize_cache_hit': cache_hit,
+        'train_s': train_s,
+        'eval_f1': metrics['eval_f1'],
+        'eval_accuracy': metrics['eval_accuracy'],
+    }
+    print(f"Training took {train_s:.1f} s on {timing['device']} ({timing['threads']} threads), "
+          f"eval F1 {metrics['eval_f1']:.4f}, accuracy {metrics['eval_accuracy']:.4f}")
+    return trainer, timing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune DistilBERT on commands.csv for intent classification.")
+    parser.add_argument("--data", default=DATA_FILE)
+    parser.add_argument("--output", default='./fine_tuned_intent_model')
+    parser.add_argument("--epochs", type=float, default=20)
+    parser.add_argument("--batch-size", type=int, default=8, help="Training batch size")
+    parser.add_argument("--eval-batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, help="CPU threads for PyTorch (default: PyTorch's choice)")
+    parser.add_argument("--cpu", action="store_true", help="Train on the CPU even if a GPU is available")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the train/test split and training")
+    parser.add_argument("--pad-to-max-length", action="store_true",
+                        help=f"Pad every example to {MAX_LENGTH} tokens (the old behaviour) instead of per batch")
+    parser.add_argument("--no-group-by-length", action="store_true",
+                        help="Shuffle freely instead of batching examples of similar length together")
+    parser.add_argument("--compare-padding", action="store_true",
+                        help=f"Train twice with the same settings, padded to {MAX_LENGTH} without length grouping "
+                             "and with dynamic padding and length grouping, and compare their training times")
+    parser.add_argument("--no-cache", action="store_true", help=f"Re-tokenize instead of using {CACHE_DIR}")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    # Tokenizer (downloaded offline)
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
+    os.makedirs('./results', exist_ok=True)
+
+    if args.compare_padding:
+        runs = {}
+        for name, pad_to_max_length, group_by_length in (('padded', True, False), ('dynamic', False, True)):
+            print(f"--- {name} ---")
+            trainer, runs[name] = train(args, tokenizer, pad_to_max_length, group_by_length)
+        speedup = runs['padded']['train_s'] / runs['dynamic']['train_s']
+        print(f"Padded to {MAX_LENGTH}: {runs['padded']['train_s']:.1f} s, F1 {runs['padded']['eval_f1']:.4f}; "
+              f"dynamic + grouped: {runs['dynamic']['train_s']:.1f} s, F1 {runs['dynamic']['eval_f1']:.4f} "
+              f"({speedup:.2f}x)")
+        with open('./results/padding_comparison.json', 'w') as f:
+            json.dump({**runs, 'speedup': speedup}, f, indent=2)
+    else:
+        trainer, timing = train(args, tokenizer, args.pad_to_max_length, not args.no_group_by_length)
+        with open('./results/train_timing.json', 'w') as f:
+            json.dump(timing, f, indent=2)
+
+    # Save for offline use (with --compare-padding: the dynamic-padding run)
+    trainer.save_model(args.output)
+    tokenizer.save_pretrained(args.output)
+
 
-# Save for offline use
-trainer.save_model('./fine_tuned_intent_model')
-tokenizer.save_pretrained('./fine_tuned_intent_model')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
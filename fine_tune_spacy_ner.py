@@ -1,9 +1,18 @@
-import spacy
+import argparse
+import csv
+import hashlib
 import random
+import time
+from pathlib import Path
+
+import spacy
+from spacy.tokens import DocBin
 from spacy.training import Example
 from spacy.util import minibatch
-import pandas as pd
-from pathlib import Path
+from extract_entities import ner_only_exclusions
+
+LABELS = ["VALUE", "UNIT", "DIRECTION"]
+CACHE_DIR = '.cache/ner_docbin'
 
 # Check spaCy dependencies
 try:
@@ -13,94 +22,179 @@ except ImportError:
     exit(1)
 
 # Load data
-def load_ner_data(csv_path):
-    df = pd.read_csv(csv_path)
-    training_data = []
-    for _, row in df.iterrows():
-        sentence = row['sentence']
-        labels = row['labels'].split()
-        words = sentence.split()
-        if len(words) != len(labels):
-            print(f"Warning: Mismatch in sentence: '{sentence}'")
-            continue
-        entities = []
-        start = 0
-        for word, label in zip(words, labels):
-            end = start + len(word)
-            if label.startswith('B-'):
-                entity_type = label[2:]  # VALUE, UNIT, DIRECTION
-                entities.append((start, end, entity_type))
-            elif label.startswith('I-') and entities and entities[-1][2] == label[2:]:
-                # Extend the previous entity
-                entities[-1] = (entities[-1][0], end, entities[-1][2])
-            start = end + 1  # Account for space
-        training_data.append((sentence, {"entities": entities}))
-    return training_data
-
-# Convert to spaCy format
-def convert_to_spacy_format(data):
-    return [(text, {"entities": annot["entities"]}) for text, annot in data]
-
-# Load and split data
-data = load_ner_data('ner_commands.csv')
-random.seed(42)
-random.shuffle(data)
-train_size = int(0.8 * len(data))
-train_data = data[:train_size]
-test_data = data[train_size:]
-
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")  # or en_core_web_lg for better accuracy
-except Exception as e:
-    print(f"Error loading spacy model: {e}")
-    print("Ensure en_core_web_sm is installed: python -m spacy download en_core_web_sm")
-    exit(1)
+def bio_to_entities(words, labels):
+    """Character offsets (start, end, label) for BIO word labels of a space-joined sentence."""
+    entities = []
+    start = 0
+    for word, label in zip(words, labels):
+        end = start + len(word)
+        if label.startswith('B-'):
+            entity_type = label[2:]  # VALUE, UNIT, DIRECTION
+            entities.append((start, end, entity_type))
+        elif label.startswith('I-') and entities and entities[-1][2] == label[2:]:
+            # Extend the previous entity
+            entities[-1] = (entities[-1][0], end, entities[-1][2])
+        start = end + 1  # Account for space
+    return entities
+
+def build_docbin(csv_path, nlp):
+    """Convert the BIO CSV into gold Docs (entities set) in a DocBin."""
+    doc_bin = DocBin(attrs=["ORTH", "ENT_IOB", "ENT_TYPE"])
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            sentence = row['sentence']
+            labels = row['labels'].split()
+            words = sentence.split()
+            if len(words) != len(labels):
+                print(f"Warning: Mismatch in sentence: '{sentence}'")
+                continue
+            sentence = ' '.join(words)
+            doc = nlp.make_doc(sentence)
+            spans = [doc.char_span(start, end, label=label, alignment_mode='expand')
+                     for start, end, label in bio_to_entities(words, labels)]
+            doc.ents = [span for span in spans if span is not None]
+            doc_bin.add(doc)
+    return doc_bin
+
+def load_gold_docs(csv_path, nlp, cache_dir=CACHE_DIR):
+    """
+    Gold Docs for csv_path, from a DocBin cached under cache_dir and keyed on the CSV contents,
+    the spaCy version and the tokenizer language, so the CSV is only converted when it changes.
+    Returns:
+        tuple: (list of Docs, cache_hit)
+    """
+    digest = hashlib.sha256(Path(csv_path).read_bytes())
+    digest.update(f"{spacy.__version__}/{nlp.lang}".encode())
+    path = Path(cache_dir) / f"{digest.hexdigest()[:16]}.spacy" if cache_dir else None
+    cache_hit = bool(path and path.is_file())
+    if cache_hit:
+        doc_bin = DocBin().from_disk(path)
+    else:
+        doc_bin = build_docbin(csv_path, nlp)
+        if path:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            doc_bin.to_disk(path)
+    return list(doc_bin.get_docs(nlp.vocab)), cache_hit
+
+# Evaluate on held-out data
+def evaluate_ner(nlp, gold_docs, batch_size=64):
+    """
+    Entity-level precision/recall/F1, overall and per label, with the texts run through nlp.pipe in batches.
+    'accuracy' is the share of gold entities found (the metric this script used to print).
+    """
+    counts = {label: {'tp': 0, 'fp': 0, 'fn': 0} for label in LABELS}
+    predicted_docs = nlp.pipe((doc.text for doc in gold_docs), batch_size=batch_size)
+    for gold, predicted in zip(gold_docs, predicted_docs):
+        true_entities = {(ent.start_char, ent.end_char, ent.label_) for ent in gold.ents}
+        predicted_entities = {(ent.start_char, ent.end_char, ent.label_) for ent in predicted.ents}
+        for _, _, label in predicted_entities & true_entities:
+            counts[label]['tp'] += 1
+        for _, _, label in predicted_entities - true_entities:
+            counts.setdefault(label, {'tp': 0, 'fp': 0, 'fn': 0})['fp'] += 1
+        for _, _, label in true_entities - predicted_entities:
+            counts[label]['fn'] += 1
 
-if "ner" not in nlp.pipe_names:
-    ner = nlp.create_pipe("ner")
-    nlp.add_pipe("ner", last=True)
-else:
-    ner = nlp.get_pipe("ner")
+    def prf(tp, fp, fn):
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        return {'precision': precision, 'recall': recall, 'f1': f1}
 
-# Add custom labels
-for label in ["VALUE", "UNIT", "DIRECTION"]:
-    ner.add_label(label)
+    totals = {key: sum(c[key] for c in counts.values()) for key in ('tp', 'fp', 'fn')}
+    scores = prf(**totals)
+    scores['accuracy'] = scores['recall']
+    scores['per_label'] = {label: prf(**c) for label, c in counts.items()}
+    return scores
+
+def print_scores(name, scores):
+    print(f"{name}: P {scores['precision']:.3f}  R {scores['recall']:.3f}  F1 {scores['f1']:.3f}  "
+          f"(accuracy {scores['accuracy']:.2f})")
+    for label, s in scores['per_label'].items():
+        print(f"  {label:<10} P {s['precision']:.3f}  R {s['recall']:.3f}  F1 {s['f1']:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the spaCy NER on ner_commands.csv.")
+    parser.add_argument("--data", default='ner_commands.csv')
+    parser.add_argument("--output", default='./fine_tuned_spacy_ner')
+    parser.add_argument("--base", default='en_core_web_sm',
+                        help="Pipeline to start from; 'blank' starts from an empty English pipeline")
+    parser.add_argument("--epochs", type=int, default=12, help="Maximum epochs")
+    parser.add_argument("--patience", type=int, default=3,
+                        help="Stop after this many epochs without a better held-out F1 (0 disables)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--eval-batch-size", type=int, default=64)
+    parser.add_argument("--dropout", type=float, default=0.2)
+    parser.add_argument("--no-cache", action="store_true", help=f"Convert the CSV instead of using {CACHE_DIR}")
+    args = parser.parse_args()
+
+    # Load spaCy model
+    try:
+        nlp = spacy.blank("en") if args.base == 'blank' else spacy.load(args.base)  # or en_core_web_lg for better accuracy
+    except Exception as e:
+        print(f"Error loading spacy model: {e}")
+        print("Ensure en_core_web_sm is installed: python -m spacy download en_core_web_sm")
+        exit(1)
+
+    if "ner" not in nlp.pipe_names:
+        ner = nlp.add_pipe("ner", last=True)
+    else:
+        ner = nlp.get_pipe("ner")
+
+    # Add custom labels
+    for label in LABELS:
+        ner.add_label(label)
+
+    # Remove every component the NER does not need (tagger, parser, lemmatizer, ...) so they are
+    # neither trained nor saved into the artifact, and never run at inference time
+    for name in ner_only_exclusions(None, config=nlp.config):
+        nlp.remove_pipe(name)
+    print(f"Training pipeline: {nlp.pipe_names}")
+
+    # Load and split data: 80% train (of which 1/8 is held out for early stopping), 20% test
+    start = time.perf_counter()
+    gold_docs, cache_hit = load_gold_docs(args.data, nlp, None if args.no_cache else CACHE_DIR)
+    print(f"{len(gold_docs)} gold docs {'loaded from cache' if cache_hit else 'converted'} "
+          f"in {time.perf_counter() - start:.2f} s")
+    random.seed(42)
+    random.shuffle(gold_docs)
+    train_size = int(0.8 * len(gold_docs))
+    dev_size = max(1, train_size // 8)
+    dev_docs, train_docs, test_docs = gold_docs[:dev_size], gold_docs[dev_size:train_size], gold_docs[train_size:]
+
+    # Examples are built once and reused every epoch
+    train_examples = [Example(nlp.make_doc(doc.text), doc) for doc in train_docs]
 
-# Disable other pipelines during training
-other_pipes = [pipe for pipe in nlp.pipe_names if pipe != "ner"]
-with nlp.disable_pipes(*other_pipes):
     optimizer = nlp.begin_training()
-    for itn in range(12):  # 20 epochs
-        random.shuffle(train_data)
+    best_f1, best_epoch, best_state = -1.0, 0, None
+    throughputs = []
+    for itn in range(args.epochs):
+        random.shuffle(train_examples)
         losses = {}
-        batches = minibatch(train_data, size=8)
-        for batch in batches:
-            examples = []
-            for text, annotations in batch:
-                doc = nlp.make_doc(text)
-                example = Example.from_dict(doc, annotations)
-                examples.append(example)
-            nlp.update(examples, drop=0.2, sgd=optimizer, losses=losses)
-        print(f"Iteration {itn + 1}, Losses: {losses}")
-
-# Save model
-output_dir = Path("./fine_tuned_spacy_ner")
-output_dir.mkdir(exist_ok=True)
-nlp.to_disk(output_dir)
-print(f"Model saved to {output_dir}")
-
-# Evaluate on test data
-def evaluate_ner(nlp, test_data):
-    correct = 0
-    total = 0
-    for text, annotations in test_data:
-        doc = nlp(text)
-        predicted_entities = [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
-        true_entities = annotations["entities"]
-        correct += len(set(predicted_entities) & set(true_entities))
-        total += len(true_entities)
-    accuracy = correct / total if total > 0 else 0
-    print(f"Test Accuracy: {accuracy:.2f}")
-
-evaluate_ner(nlp, test_data)
\ No newline at end of file
+        start = time.perf_counter()
+        for batch in minibatch(train_examples, size=args.batch_size):
+            nlp.update(batch, drop=args.dropout, sgd=optimizer, losses=losses)
+        throughputs.append(len(train_examples) / (time.perf_counter() - start))
+        dev_f1 = evaluate_ner(nlp, dev_docs, args.eval_batch_size)['f1']
+        print(f"Iteration {itn + 1}, Losses: {losses}, held-out F1: {dev_f1:.3f}, "
+              f"{throughputs[-1]:.0f} examples/s")
+        if dev_f1 > best_f1:
+            best_f1, best_epoch, best_state = dev_f1, itn + 1, nlp.to_bytes()
+        elif args.patience and itn + 1 - best_epoch >= args.patience:
+            print(f"Early stopping: no better held-out F1 for {args.patience} epochs")
+            break
+    nlp.from_bytes(best_state)
+    print(f"Best held-out F1 {best_f1:.3f} at iteration {best_epoch}; "
+          f"training throughput {sum(throughputs) / len(throughputs):.0f} examples/s")
+
+    # Save model
+    output_dir = Path(args.output)
+    output_dir.mkdir(exist_ok=True)
+    nlp.to_disk(output_dir)
+    print(f"Model saved to {output_dir}")
+
+    start = time.perf_counter()
+    scores = evaluate_ner(nlp, test_docs, args.eval_batch_size)
+    print_scores(f"Test ({len(test_docs)} sentences, {time.perf_counter() - start:.3f} s)", scores)
+
+if __name__ == "__main__":
+    main()
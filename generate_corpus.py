@@ -0,0 +1,199 @@
+import argparse
+import csv
+import io
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from rule_entities import DIRECTION_TABLE, NUMBER_WORDS
+
+INTENTS = ('increase', 'decrease', 'stop', 'set_speed', 'change_direction')
+DEFAULT_CHUNK_ROWS = 20000
+
+# Templates per intent. Plain words are labelled O; {slot} words come from _slot() below with their own
+# BIO labels, so every sentence and its label string have the same number of tokens by construction.
+TEMPLATES = {
+    'increase': [
+        "increase the speed by {amount}", "increase speed by {amount}", "increase by {amount}",
+        "speed up by {amount}", "raise the speed by {amount}", "boost the motor speed by {amount}",
+        "go faster by {amount}", "increase the motor speed by {amount}", "please speed up by {amount}",
+        "increase speed to {amount}", "increase the speed to {extreme}", "increase speed by {relative}",
+        "increase the speed by {relative}", "speed up to {extreme} speed", "increase to {double} speed",
+        "{double} the speed", "speed up", "increase the speed", "go faster", "make it faster",
+    ],
+    'decrease': [
+        "decrease the speed by {amount}", "decrease speed by {amount}", "decrease by {amount}",
+        "slow down by {amount}", "reduce the speed by {amount}", "reduce speed by {amount}",
+        "lower the speed by {amount}", "bring the speed down by {amount}", "please slow down by {amount}",
+        "decrease speed to {fraction}", "reduce the speed by {fraction}", "bring the speed down to {fraction}",
+        "cut the speed by {fraction}", "slow down to {extreme_low} speed", "slow down", "decrease the speed",
+        "reduce speed", "go slower", "make it slower",
+    ],
+    'stop': [
+        "stop", "stop the motor", "stop now", "please stop the motor", "stop moving", "halt",
+        "halt the motor", "turn off the motor", "shut down the motor", "stop the rotation", "stop spinning",
+        "bring the motor to a stop",
+    ],
+    'set_speed': [
+        "set the speed to {amount}", "set speed to {amount}", "set motor speed to {amount}",
+        "set the motor speed to {amount}", "run at {amount}", "run the motor at {amount}",
+        "adjust speed to {amount}", "change the speed to {amount}", "make the speed {amount}",
+        "set to {level} speed", "set speed to {level}", "set motor to {level}", "run at {level} speed",
+        "make it {level} speed", "go {level} speed", "set the motor speed to {level}",
+    ],
+    'change_direction': [
+        "rotate {direction}", "turn {direction}", "spin {direction}", "rotate the motor {direction}",
+        "change direction to {direction}", "set direction to {direction}", "switch to {direction}",
+        "change the direction to {direction}", "please rotate {direction}", "turn to {direction}",
+        "{reverse}", "{reverse} the direction", "{reverse} the motor", "change direction",
+    ],
+}
+
+PERCENT_UNITS = ['percent', 'per cent', '%']
+# Single-entity slots: name -> (entity label, phrases)
+SLOTS = {
+    'relative': ('UNIT', ['half', 'quarter', 'double']),
+    'fraction': ('UNIT', ['half', 'quarter']),
+    'double': ('UNIT', ['double']),
+    'extreme': ('UNIT', ['max', 'maximum']),
+    'extreme_low': ('UNIT', ['min', 'minimum']),
+    'level': ('UNIT', ['half', 'quarter', 'max', 'maximum', 'min', 'minimum']),
+    'direction': ('DIRECTION', list(DIRECTION_TABLE)),
+    'reverse': ('DIRECTION', ['reverse']),
+}
+_TENS = {value: word for word, value in NUMBER_WORDS.items() if value >= 20}
+_ONES = {value: word for word, value in NUMBER_WORDS.items() if value < 20}
+
+
+def number_words(n):
+    """English words for 0-100 in the forms rule_entities.parse_value reads ("forty five", "one hundred")."""
+    if n == 100:
+        return 'one hundred'
+    if n < 20:
+        return _ONES[n]
+    tens, ones = divmod(n, 10)
+    return _TENS[tens * 10] + (f" {_ONES[ones]}" if ones else '')
+
+
+def _labelled(text, entity):
+    """(words, BIO labels) for a phrase that is one entity."""
+    words = text.split()
+    return words, [f"B-{entity}"] + [f"I-{entity}"] * (len(words) - 1)
+
+
+def _slot(name, rng):
+    """Sample a slot filler as (words, labels)."""
+    if name == 'amount':
+        n = rng.randint(1, 100)
+        value = number_words(n) if rng.random() < 0.25 else str(n)
+        value_words, value_labels = _labelled(value, 'VALUE')
+        unit_words, unit_labels = _labelled(rng.choice(PERCENT_UNITS), 'UNIT')
+        return value_words + unit_words, value_labels + unit_labels
+    entity, phrases = SLOTS[name]
+    return _labelled(rng.choice(phrases), entity)
+
+
+def _compile(template):
+    """Template string -> tuple of words, with slots kept as their bare names in a 1-tuple."""
+    return tuple((word[1:-1],) if word.startswith('{') else word for word in template.split())
+
+
+_COMPILED = {intent: [_compile(t) for t in templates] for intent, templates in TEMPLATES.items()}
+
+
+def generate_row(rng):
+    """One synthetic command as (sentence, intent, labels) with len(sentence.split()) == len(labels.split())."""
+    intent = rng.choice(INTENTS)
+    words, labels = [], []
+    for part in rng.choice(_COMPILED[intent]):
+        if isinstance(part, tuple):
+            slot_words, slot_labels = _slot(part[0], rng)
+            words += slot_words
+            labels += slot_labels
+        else:
+            words.append(part)
+            labels.append('O')
+    if rng.random() < 0.3:
+        words[0] = words[0].capitalize()
+    return ' '.join(words), intent, ' '.join(labels)
+
+
+def generate_chunk(args):
+    """
+    Rows [index * chunk_rows, ...) of the corpus rendered as CSV text for both outputs. Each chunk has
+    its own RNG seeded from (seed, index), so the corpus is the same whatever the number of workers.
+    Returns:
+        tuple: (intent CSV text, BIO CSV text, row count)
+    """
+    seed, index, rows = args
+    rng = random.Random(f"{seed}/{index}")
+    intent_buf, ner_buf = io.StringIO(), io.StringIO()
+    intent_out = csv.writer(intent_buf, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    ner_out = csv.writer(ner_buf, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for _ in range(rows):
+        sentence, intent, labels = generate_row(rng)
+        intent_out.writerow((sentence, intent))
+        ner_out.writerow((sentence, labels))
+    return intent_buf.getvalue(), ner_buf.getvalue(), rows
+
+
+def generate_corpus(rows, intent_output, ner_output, seed=0, workers=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Stream `rows` generated commands to intent_output (sentence,intent like commands.csv) and ner_output
+    (sentence,labels like ner_commands.csv); row i of both files is the same sentence. Chunks are built
+    by a pool of `workers` processes (default: CPU count, 1 runs in-process) and written in order as
+    they arrive, so memory stays at a few chunks whatever the corpus size.
+    Returns:
+        int: rows written
+    """
+    tasks = [(seed, i, min(chunk_rows, rows - i * chunk_rows)) for i in range(-(-rows // chunk_rows))]
+    workers = workers or os.cpu_count() or 1
+    pool = Pool(workers) if workers > 1 and len(tasks) > 1 else None
+    written = 0
+    try:
+        chunks = pool.imap(generate_chunk, tasks) if pool else map(generate_chunk, tasks)
+        with open(intent_output, 'w', newline='') as intent_f, open(ner_output, 'w', newline='') as ner_f:
+            intent_f.write('sentence,intent\n')
+            ner_f.write('sentence,labels\n')
+            for intent_text, ner_text, count in chunks:
+                intent_f.write(intent_text)
+                ner_f.write(ner_text)
+                written += count
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return written
+
+
+def check_alignment(ner_file):
+    """Number of rows of a BIO CSV whose token and label counts differ (what chceck_nercommands.py prints)."""
+    with open(ner_file, newline='') as f:
+        return sum(len(row['sentence'].split()) != len(row['labels'].split()) for row in csv.DictReader(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate aligned intent and BIO training corpora from templates.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--intent-output", default='generated_commands.csv')
+    parser.add_argument("--ner-output", default='generated_ner_commands.csv')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="Generator processes (default: CPU count)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per worker task")
+    parser.add_argument("--check", action="store_true", help="Re-read the BIO output and count misaligned rows")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate_corpus(args.rows, args.intent_output, args.ner_output, args.seed, args.workers,
+                            args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    size_mb = (os.path.getsize(args.intent_output) + os.path.getsize(args.ner_output)) / 2 ** 20
+    print(f"Wrote {count} rows to '{args.intent_output}' and '{args.ner_output}' ({size_mb:.1f} MB) "
+          f"in {elapsed:.2f} s, {count / elapsed:.0f} rows/s")
+    if args.check:
+        print(f"Rows with mismatched token/label counts: {check_alignment(args.ner_output)}")
+
+
+if __name__ == "__main__":
+    main()
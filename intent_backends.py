@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# torch and transformers are imported inside the functions that need them, so importing this
+# module for its constants (as control_motor does) stays cheap
+INTENT_MODEL_DIR = './fine_tuned_intent_model'
+MAX_LENGTH = 32
+
+# Backend name -> exported artifact inside the model directory (None = load the HF checkpoint directly)
+BACKENDS = {
+    'eager': None,
+    'torchscript': 'intent_torchscript.pt',
+    'int8': 'intent_int8.pt',
+}
+
+# Intent label mapping
+label_map = {0: "increase", 1: "decrease", 2: "stop", 3: "set_speed", 4: "change_direction"}
+
+
+def _example_inputs(tokenizer):
+    inputs = tokenizer(["set the speed to 50 percent"], return_tensors='pt',
+                       padding='max_length', truncation=True, max_length=MAX_LENGTH)
+    return inputs['input_ids'], inputs['attention_mask']
+
+
+def export_backend(backend, model_dir=INTENT_MODEL_DIR):
+    """
+    Convert the fine-tuned checkpoint into a TorchScript graph for `backend`.
+    'int8' applies dynamic int8 quantization to every nn.Linear before tracing.
+    Returns:
+        str: Path of the written artifact.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    if not BACKENDS.get(backend):
+        raise ValueError(f"Backend '{backend}' has nothing to export")
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir, torchscript=True).eval()
+    tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
+    if backend == 'int8':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _example_inputs(tokenizer))
+    traced = torch.jit.freeze(traced.eval())
+    path = os.path.join(model_dir, BACKENDS[backend])
+    traced.save(path)
+    logging.info(f"Exported intent backend '{backend}' to {path}")
+    return path
+
+
+def load_backend(backend, model_dir=INTENT_MODEL_DIR, device='cpu'):
+    """
+    Load an intent classifier backend.
+    Returns:
+        tuple: (forward, device, pad_to_max_length). `forward(input_ids, attention_mask)` returns logits.
+        Exported graphs are traced at MAX_LENGTH, so their inputs must be padded to it.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown intent backend '{backend}', expected one of {sorted(BACKENDS)}")
+    if backend == 'eager':
+        model = AutoModelForSequenceClassification.from_pretrained(model_dir).to(device).eval()
+        return (lambda input_ids, attention_mask: model(input_ids=input_ids, attention_mask=attention_mask).logits,
+                device, False)
+    path = os.path.join(model_dir, BACKENDS[backend])
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"{path} not found, run: python intent_backends.py export --backend {backend}")
+    if backend == 'int8':
+        device = 'cpu'  # Dynamically quantized kernels are CPU-only
+    traced = torch.jit.load(path, map_location=device)
+    return (lambda input_ids, attention_mask: traced(input_ids, attention_mask)[0], device, True)
+
+
+def _measure(backend, model_dir, data_file):
+    """Accuracy, latency and peak RSS for one backend. Run in its own process so RSS is isolated."""
+    import torch
+    from transformers import AutoTokenizer
+
+    start = time.perf_counter()
+    forward, device, pad_to_max = load_backend(backend, model_dir)
+    tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
+    load_s = time.perf_counter() - start
+
+    with open(data_file, newline='') as f:
+        rows = list(csv.DictReader(f))
+    padding = 'max_length' if pad_to_max else True
+    latencies = []
+    correct = 0
+    with torch.no_grad():
+        for row in rows:
+            start = time.perf_counter()
+            inputs = tokenizer(row['sentence'], return_tensors='pt', padding=padding,
+                               truncation=True, max_length=MAX_LENGTH).to(device)
+            intent_id = torch.argmax(forward(inputs['input_ids'], inputs['attention_mask']), dim=1).item()
+            latencies.append(time.perf_counter() - start)
+            correct += label_map[intent_id] == row['intent']
+    latencies.sort()
+    return {
+        'backend': backend,
+        'accuracy': correct / len(rows),
+        'load_s': load_s,
+        'p50_ms': 1000 * latencies[len(latencies) // 2],
+        'p99_ms': 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def report(backends, model_dir, data_file):
+    results = []
+    for backend in backends:
+        out = subprocess.run(
+            [sys.executable, __file__, 'measure', '--backend', backend, '--model-dir', model_dir, '--data', data_file],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    baseline = next((r['accuracy'] for r in results if r['backend'] == 'eager'), None)
+    print(f"{'backend':<12} {'accuracy':>9} {'delta':>7} {'p50 ms':>8} {'p99 ms':>8} {'load s':>7} {'RSS MB':>8}")
+    for r in results:
+        delta = f"{r['accuracy'] - baseline:+.3f}" if baseline is not None else 'n/a'
+        print(f"{r['backend']:<12} {r['accuracy']:>9.3f} {delta:>7} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['load_s']:>7.2f} {r['peak_rss_mb']:>8.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export and compare CPU inference backends for the intent classifier."
+    )
+    parser.add_argument("command", choices=['export', 'report', 'measure'])
+    parser.add_argument("--backend", default='all', help=f"One of {sorted(BACKENDS)} or 'all'")
+    parser.add_argument("--model-dir", default=INTENT_MODEL_DIR, help="Fine-tuned intent model directory")
+    parser.add_argument("--data", default='commands.csv', help="Labelled CSV used for the accuracy report")
+    args = parser.parse_args()
+
+    backends = sorted(BACKENDS) if args.backend == 'all' else [args.backend]
+    if args.command == 'export':
+        for backend in backends:
+            if BACKENDS[backend]:
+                print(f"Exported '{backend}' to {export_backend(backend, args.model_dir)}")
+    elif args.command == 'report':
+        report(backends, args.model_dir, args.data)
+    else:
+        print(json.dumps(_measure(backends[0], args.model_dir, args.data)))
+
+
+if __name__ == "__main__":
+    main()
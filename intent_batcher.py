@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class IntentBatcher:
+    """
+    Background micro-batcher for intent inference.
+
+    Requests submitted from any thread are collected until either `max_batch_size`
+    texts are waiting or `max_wait` seconds have passed since the first one arrived,
+    then run through `predict_fn` (normally control_motor.predict_intents) as one
+    padded forward pass. Each caller gets its own (intent, confidence) back.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait=0.005):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name="intent-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queue a text for classification. Returns a Future resolving to (intent, confidence)."""
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def predict(self, text, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text).result(timeout=timeout)
+
+    def close(self):
+        """Stop the worker after it drains the requests already queued."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        mean_batch = self.items / self.batches if self.batches else 0.0
+        return {'batches': self.batches, 'items': self.items, 'mean_batch_size': mean_batch}
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # Handle after this batch is flushed
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            texts = [text for text, _ in batch]
+            try:
+                results = list(self.predict_fn(texts))
+                if len(results) != len(texts):  # zip() would leave the extra callers waiting forever
+                    raise ValueError(f"predict_fn returned {len(results)} result(s) for {len(texts)} text(s)")
+            except Exception as e:
+                logging.error(f"Batched intent prediction failed for {len(texts)} text(s): {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+if __name__ == "__main__":
+    # Throughput comparison: one predict_intent call per text vs concurrent callers through the batcher
+    import csv
+    from concurrent.futures import ThreadPoolExecutor
+    import control_motor
+
+    with open('commands.csv', newline='') as f:
+        sentences = [row['sentence'] for row in csv.DictReader(f)]
+
+    start = time.perf_counter()
+    for sentence in sentences:
+        control_motor.predict_intent(sentence)
+    single_s = time.perf_counter() - start
+
+    batcher = IntentBatcher(control_motor.predict_intents, max_batch_size=32, max_wait=0.01)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(batcher.predict, sentences))
+    batched_s = time.perf_counter() - start
+    batcher.close()
+
+    n = len(sentences)
+    print(f"Single-call path: {n / single_s:.1f} commands/sec ({1000 * single_s / n:.2f} ms/command)")
+    print(f"Micro-batched:    {n / batched_s:.1f} commands/sec ({1000 * batched_s / n:.2f} ms/command), "
+          f"stats={batcher.stats()}")
@@ -0,0 +1,301 @@
+import argparse
+import csv
+import os
+import random
+import re
+import time
+import zlib
+
+import numpy as np
+
+from intent_backends import INTENT_MODEL_DIR, label_map
+
+# Student artifact, saved next to the teacher's exported backends
+STUDENT_FILE = 'intent_student.npz'
+DIMS = 2 ** 15
+
+_WORD_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?|%")
+_DIGITS_RE = re.compile(r'\d')
+
+# Label-preserving rewrites used to augment commands.csv
+SYNONYMS = {
+    'speed': ['velocity', 'pace', 'rpm'],
+    'increase': ['raise', 'boost', 'bump up'],
+    'decrease': ['reduce', 'lower', 'cut'],
+    'stop': ['halt', 'kill'],
+    'motor': ['engine', 'fan'],
+    'percent': ['%', 'per cent'],
+    '%': ['percent'],
+    'reverse': ['flip', 'invert'],
+    'set': ['make', 'put'],
+}
+PREFIXES = ['please ', 'could you ', 'now ', 'hey, ']
+SUFFIXES = [' please', ' now', ' right away']
+FILLERS = {'the', 'to', 'by', 'please', 'a'}
+
+
+def _grams(text):
+    """Hashed feature keys: words (digits collapsed to <num>), word bigrams and char 3-5-grams of each word."""
+    words = ['<num>' if w[0].isdigit() else w for w in _WORD_RE.findall(text.lower())]
+    keys = [f"w:{w}" for w in words]
+    keys += [f"b:{a} {b}" for a, b in zip(['<s>'] + words, words + ['</s>'])]
+    for word in words:
+        padded = f"<{_DIGITS_RE.sub('0', word)}>"
+        keys += [f"c:{padded[i:i + n]}" for n in (3, 4, 5) for i in range(len(padded) - n + 1)]
+    return keys
+
+
+def featurize(texts, dims=DIMS):
+    """
+    Sparse hashed features for a batch.
+    Returns:
+        tuple: (rows, columns, values) with one entry per feature occurrence; each row is L2-normalized.
+    """
+    rows, columns, values = [], [], []
+    for row, text in enumerate(texts):
+        keys = _grams(text)
+        scale = 1.0 / np.sqrt(max(1, len(keys)))
+        for key in keys:
+            rows.append(row)
+            columns.append(zlib.crc32(key.encode()) % dims)
+            values.append(scale)
+    return (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64),
+            np.array(values, dtype=np.float32))
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class IntentStudent:
+    """
+    Hashed n-gram linear classifier (NumPy only). predict() returns (intent, confidence) like
+    control_motor.predict_intents, so it can stand in for the DistilBERT teacher.
+    """
+
+    def __init__(self, weights, bias, labels, dims=DIMS):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.dims = dims
+
+    def logits(self, texts):
+        rows, columns, values = featurize(texts, self.dims)
+        contributions = self.weights[columns] * values[:, None]
+        logits = np.tile(self.bias, (len(texts), 1))
+        for k in range(len(self.labels)):
+            logits[:, k] += np.bincount(rows, weights=contributions[:, k], minlength=len(texts))
+        return logits
+
+    def predict_proba(self, texts):
+        return _softmax(self.logits(texts))
+
+    def predict(self, texts):
+        if not texts:
+            return []
+        probabilities = self.predict_proba(texts)
+        return [(self.labels[i], float(p[i])) for i, p in zip(probabilities.argmax(axis=1), probabilities)]
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights.astype(np.float16), bias=self.bias,
+                            labels=np.array(self.labels), dims=self.dims)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['weights'].astype(np.float32), data['bias'], data['labels'].tolist(), int(data['dims']))
+
+
+def train_student(texts, targets, labels, dims=DIMS, epochs=300, lr=0.1, l2=1e-5, seed=0):
+    """
+    Fit the linear model to soft targets (n x classes) with full-batch Adam on the cross-entropy.
+    """
+    rng = np.random.default_rng(seed)
+    n, classes = targets.shape
+    rows, columns, values = featurize(texts, dims)
+    weights = rng.normal(0, 0.01, (dims, classes)).astype(np.float32)
+    bias = np.zeros(classes, dtype=np.float32)
+    params = [weights, bias]
+    moments = [np.zeros_like(p) for p in params]
+    velocities = [np.zeros_like(p) for p in params]
+    student = IntentStudent(weights, bias, labels, dims)
+    for step in range(1, epochs + 1):
+        logits = np.tile(bias, (n, 1))
+        contributions = weights[columns] * values[:, None]
+        for k in range(classes):
+            logits[:, k] += np.bincount(rows, weights=contributions[:, k], minlength=n)
+        error = (_softmax(logits) - targets) / n
+        grad_w = np.empty_like(weights)
+        for k in range(classes):
+            grad_w[:, k] = np.bincount(columns, weights=values * error[rows, k], minlength=dims)
+        grads = [grad_w + l2 * weights, error.sum(axis=0)]
+        for param, grad, m, v in zip(params, grads, moments, velocities):
+            m *= 0.9
+            m += 0.1 * grad
+            v *= 0.999
+            v += 0.001 * grad * grad
+            param -= lr * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return student
+
+
+def augment(sentence, rng):
+    """One randomly rewritten copy of sentence: synonyms, new numbers, dropped fillers, prefixes/suffixes."""
+    words = sentence.lower().split()
+    out = []
+    for word in words:
+        if word in FILLERS and rng.random() < 0.3:
+            continue
+        if word in SYNONYMS and rng.random() < 0.4:
+            word = rng.choice(SYNONYMS[word])
+        elif re.fullmatch(r'\d+(?:\.\d+)?', word):
+            word = str(rng.choice([5, 10, 15, 20, 25, 30, 40, 50, 60, 75, 80, 90, 100]))
+        out.append(word)
+    text = ' '.join(out) or sentence.lower()
+    if rng.random() < 0.2:
+        text = rng.choice(PREFIXES) + text
+    if rng.random() < 0.2:
+        text = text + rng.choice(SUFFIXES)
+    return text
+
+
+class Teacher:
+    """The fine-tuned DistilBERT (eager backend) producing soft labels."""
+
+    def __init__(self, model_dir=INTENT_MODEL_DIR):
+        import torch
+        from transformers import AutoTokenizer
+        from intent_backends import load_backend
+
+        self._torch = torch
+        start = time.perf_counter()
+        self.forward, self.device, _ = load_backend('eager', model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
+        self.load_s = time.perf_counter() - start
+        self.size_bytes = sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir)
+                              if name.endswith(('.safetensors', '.bin')))
+
+    def logits(self, texts, batch_size=64):
+        out = []
+        with self._torch.no_grad():
+            for i in range(0, len(texts), batch_size):
+                inputs = self.tokenizer(texts[i:i + batch_size], return_tensors='pt', padding=True,
+                                        truncation=True, max_length=32).to(self.device)
+                out.append(self.forward(inputs['input_ids'], inputs['attention_mask']).cpu().numpy())
+        return np.concatenate(out) if out else np.zeros((0, len(label_map)))
+
+    def predict(self, texts):
+        probabilities = _softmax(self.logits(texts))
+        return [(label_map[i], float(p[i])) for i, p in zip(probabilities.argmax(axis=1), probabilities)]
+
+
+def _read(path, column='intent'):
+    with open(path, newline='') as f:
+        return [(row['sentence'], row.get(column)) for row in csv.DictReader(f)]
+
+
+def _split(rows, test_fraction=0.2, seed=42):
+    rows = list(rows)
+    random.Random(seed).shuffle(rows)
+    cut = int(len(rows) * (1 - test_fraction))
+    return rows[:cut], rows[cut:]
+
+
+def distill(data_file='commands.csv', extra_file='ner_commands.csv', model_dir=INTENT_MODEL_DIR, output=None,
+            copies=5, temperature=2.0, alpha=0.5, use_teacher=True, seed=42):
+    """
+    Train the student on the training split of data_file plus augmented copies. With a teacher, targets
+    mix its temperature-softened probabilities with the gold label (weight alpha on the teacher), and the
+    unlabelled sentences of extra_file are added with teacher targets only. Without a teacher,
+    augmented copies inherit the gold label of their source sentence.
+    Returns:
+        tuple: (student, test_rows, teacher or None)
+    """
+    labels = [label_map[i] for i in sorted(label_map)]
+    index = {label: i for i, label in enumerate(labels)}
+    train_rows, test_rows = _split(_read(data_file), seed=seed)
+    rng = random.Random(seed)
+
+    texts = [text for text, _ in train_rows]
+    gold = [index[intent] for _, intent in train_rows]
+    for _ in range(copies):
+        for text, intent in train_rows:
+            texts.append(augment(text, rng))
+            gold.append(index[intent])
+    hard = np.eye(len(labels), dtype=np.float32)[gold]
+
+    teacher = Teacher(model_dir) if use_teacher else None
+    if teacher:
+        test_texts = {text for text, _ in test_rows}
+        extra = [text for text, _ in _read(extra_file) if text not in test_texts] if extra_file else []
+        soft = _softmax(teacher.logits(texts + extra) / temperature).astype(np.float32)
+        targets = np.concatenate([alpha * soft[:len(texts)] + (1 - alpha) * hard, soft[len(texts):]])
+        texts = texts + extra
+    else:
+        targets = hard
+
+    start = time.perf_counter()
+    student = train_student(texts, targets, labels)
+    print(f"Trained student on {len(texts)} sentences in {time.perf_counter() - start:.1f} s "
+          f"({'teacher soft labels' if teacher else 'gold labels only'})")
+    output = output or os.path.join(model_dir, STUDENT_FILE)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    student.save(output)
+    print(f"Saved student to {output}")
+    return student, test_rows, teacher
+
+
+def _latency(predict, texts):
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        predict([text])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return 1000 * latencies[len(latencies) // 2], 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+
+
+def compare(student_path, test_rows, teacher=None):
+    """Side-by-side accuracy on the held-out split, single-utterance latency, size on disk and load time."""
+    start = time.perf_counter()
+    student = IntentStudent.load(student_path)
+    models = [('student', student, time.perf_counter() - start, os.path.getsize(student_path))]
+    if teacher:
+        models.insert(0, ('teacher', teacher, teacher.load_s, teacher.size_bytes))
+    texts = [text for text, _ in test_rows]
+    gold = [intent for _, intent in test_rows]
+    predictions = {}
+    print(f"{'model':<8} {'accuracy':>9} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8} {'load s':>7}")
+    for name, model, load_s, size in models:
+        predictions[name] = [intent for intent, _ in model.predict(texts)]
+        accuracy = sum(p == g for p, g in zip(predictions[name], gold)) / len(gold)
+        p50, p99 = _latency(model.predict, texts)
+        print(f"{name:<8} {accuracy:>9.3f} {p50:>8.3f} {p99:>8.3f} {size / 2 ** 20:>8.2f} {load_s:>7.3f}")
+    if teacher:
+        agreement = sum(a == b for a, b in zip(predictions['teacher'], predictions['student'])) / len(texts)
+        print(f"Student agrees with the teacher on {agreement:.1%} of {len(texts)} held-out sentences")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the DistilBERT intent model into a hashed n-gram student.")
+    parser.add_argument("--data", default='commands.csv')
+    parser.add_argument("--extra", default='ner_commands.csv',
+                        help="Unlabelled sentences the teacher labels for the student ('' to skip)")
+    parser.add_argument("--model-dir", default=INTENT_MODEL_DIR, help="Teacher model directory")
+    parser.add_argument("--output", help=f"Student file (default: <model-dir>/{STUDENT_FILE})")
+    parser.add_argument("--copies", type=int, default=5, help="Augmented copies per training sentence")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the teacher in the targets")
+    parser.add_argument("--no-teacher", action="store_true", help="Train on gold labels only (no teacher model)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.model_dir, STUDENT_FILE)
+    _, test_rows, teacher = distill(args.data, args.extra, args.model_dir, output, args.copies,
+                                    args.temperature, args.alpha, not args.no_teacher)
+    compare(output, test_rows, teacher)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import atexit
+import bisect
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+# Geometric bucket bounds from 1 us to ~100 s, 8 buckets per doubling (~9% resolution)
+_BOUNDS_NS = [int(1000 * 2 ** (i / 8)) for i in range(8 * 27 + 1)]
+
+enabled = os.environ.get('LATENCY_TRACE', '0') == '1'
+_histograms = {}
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are the upper bound of the bucket they fall in."""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS_NS) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ns):
+        index = bisect.bisect_left(_BOUNDS_NS, elapsed_ns)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ns += elapsed_ns
+            self.min_ns = elapsed_ns if self.min_ns is None else min(self.min_ns, elapsed_ns)
+            self.max_ns = max(self.max_ns, elapsed_ns)
+
+    def percentile(self, q):
+        """Latency in ms below which a fraction q of the samples fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                upper = _BOUNDS_NS[index] if index < len(_BOUNDS_NS) else self.max_ns
+                return min(upper, self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+    def summary(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'mean_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+                'min_ms': (self.min_ns or 0) / 1e6,
+                'max_ms': self.max_ns / 1e6,
+                'p50_ms': self.percentile(0.50),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99),
+                'buckets': [[_BOUNDS_NS[i] / 1e6 if i < len(_BOUNDS_NS) else None, c]
+                            for i, c in enumerate(self.counts) if c],
+            }
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter_ns() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name):
+    """
+    Context manager timing one pipeline stage:
+
+        with latency.stage('intent.forward'):
+            ...
+
+    When tracing is disabled this returns a shared no-op context, so the cost is one
+    function call and a flag check.
+    """
+    return _Timer(name) if enabled else _NULL_TIMER
+
+
+def timed(name):
+    """Decorator form of stage() for timing a whole function."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, elapsed_ns):
+    """Add one sample (nanoseconds) to the histogram for `name`."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    histogram.record(elapsed_ns)
+
+
+def enable(dump_path=None):
+    """Turn tracing on; if dump_path is given the histograms are also written there at exit."""
+    global enabled
+    enabled = True
+    if dump_path:
+        atexit.register(dump, dump_path)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot():
+    """Per-stage summaries (count, mean, min, max, p50/p95/p99 and non-empty buckets), keyed by stage name."""
+    with _lock:
+        items = list(_histograms.items())
+    return {name: histogram.summary() for name, histogram in sorted(items)}
+
+
+def dump(path):
+    """Write snapshot() as JSON to path."""
+    with open(path, 'w') as f:
+        json.dump({'generated_at': time.time(), 'stages': snapshot()}, f, indent=2)
+    logging.info(f"Latency histograms written to {path}")
+    return path
+
+
+def dump_on_signal(path, signum=None, poll_s=0.25):
+    """
+    Write snapshot() to path whenever the process gets `signum` (default SIGUSR1). The handler
+    runs on the main thread, possibly inside record() with a lock held that dump() needs, so it
+    only sets a flag; a watcher thread polls it every `poll_s` seconds and does the dump.
+    """
+    import signal
+
+    requested = [False]
+
+    def handler(signum, frame):
+        requested[0] = True
+
+    def watch():
+        while True:
+            time.sleep(poll_s)
+            if requested[0]:
+                requested[0] = False
+                try:
+                    dump(path)
+                except OSError as e:
+                    logging.error(f"Could not write latency histograms to {path}: {e}")
+
+    threading.Thread(target=watch, name="latency-dump", daemon=True).start()
+    signal.signal(signal.SIGUSR1 if signum is None else signum, handler)
+
+
+def format_table(stages=None):
+    stages = snapshot() if stages is None else stages
+    lines = [f"{'stage':<20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for name, s in stages.items():
+        lines.append(f"{name:<20} {s['count']:>7} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} "
+                     f"{s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}")
+    return "\n".join(lines)
+
+
+if enabled and os.environ.get('LATENCY_DUMP'):
+    atexit.register(dump, os.environ['LATENCY_DUMP'])
@@ -0,0 +1,357 @@
+import functools
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+import latency
+from rule_entities import parse_value
+from serial_link import DEFAULT_PORT, SerialLink
+from serial_protocol import make_protocol
+from ramp_scheduler import RampScheduler
+
+MAX_PWM = 255
+
+
+def map_to_command(intent, entities, current_speed, current_direction):
+    """
+    Map intent and entities to ESP32 command (speed 0-255, direction clc/anticlc).
+    Returns: (new_speed, new_direction)
+    """
+    if not intent:
+        logging.warning("No intent provided, returning current state")
+        return current_speed, current_direction
+    
+    value = entities.get('value')
+    unit = entities.get('unit')
+    direction = entities.get('direction')
+    
+    new_speed = current_speed
+    new_direction = current_direction
+    
+    # Validate entities
+    if value is not None and not isinstance(value, (int, float)):
+        logging.warning("Invalid value '%s' for intent '%s'", value, intent)
+        value = None
+    if direction not in [None, 'clc', 'anticlc', 'reverse']:
+        logging.warning("Invalid direction '%s' for intent '%s'", direction, intent)
+        direction = None
+    
+    logging.debug("Input - intent: %s, entities: %s, current_speed: %s, current_direction: %s", intent, entities, current_speed, current_direction)
+
+    if intent in ['increase', 'decrease']:
+        # Incremental change based on current_speed
+        delta = 0
+        if unit == '%' and value is not None:
+            delta = int(MAX_PWM * (value / 100))
+            logging.debug("Percent unit detected, value=%s, delta=%s", value, delta)
+        elif unit == 'half':
+            delta = current_speed // 2
+            logging.debug("Half unit detected, delta=%s", delta)
+        elif unit == 'quarter':
+            delta = current_speed // 4
+            logging.debug("Quarter unit detected, delta=%s", delta)
+        elif unit == 'double':
+            delta = current_speed
+            logging.debug("Double unit detected, delta=%s", delta)
+        elif unit in ['max', 'maximum']:
+            delta = MAX_PWM - current_speed
+            logging.debug("Max/maximum unit detected, delta=%s", delta)
+        elif unit in ['min', 'minimum']:
+            delta = current_speed
+            logging.debug("Min/minimum unit detected, delta=%s", delta)
+        elif unit == 'default':
+            delta = int(MAX_PWM * (10 / 100))  # Default 10%
+            logging.debug("Default unit detected, delta=%s", delta)
+        else:
+            logging.warning("Unknown unit '%s' for intent '%s', no change", unit, intent)
+        
+        # Apply delta
+        if intent == 'increase':
+            new_speed = min(current_speed + delta, MAX_PWM)
+        else:  # decrease
+            new_speed = max(current_speed - delta, 0)
+    
+    elif intent == 'set_speed':
+        # Set absolute speed
+        if unit == '%' and value is not None:
+            new_speed = min(int(MAX_PWM * (value / 100)), MAX_PWM)
+            logging.debug("Set percent speed, value=%s, new_speed=%s", value, new_speed)
+        elif unit == 'half':
+            new_speed = MAX_PWM // 2
+            logging.debug("Set half speed, new_speed=%s", new_speed)
+        elif unit == 'quarter':
+            new_speed = MAX_PWM // 4
+            logging.debug("Set quarter speed, new_speed=%s", new_speed)
+        elif unit == 'double':
+            new_speed = MAX_PWM  # Full speed for double
+            logging.debug("Set double speed, new_speed=%s", new_speed)
+        elif unit in ['max', 'maximum']:
+            new_speed = MAX_PWM
+            logging.debug("Set max/maximum speed, new_speed=%s", new_speed)
+        elif unit in ['min', 'minimum']:
+            new_speed = 0
+            logging.debug("Set min/minimum speed, new_speed=%s", new_speed)
+        elif unit == 'default':
+            new_speed = int(MAX_PWM * 0.1)  # Default 10%
+            logging.debug("Set default speed, new_speed=%s", new_speed)
+        else:
+            logging.warning("Unknown unit '%s' for intent '%s', no change", unit, intent)
+    
+    elif intent == 'stop':
+        new_speed = 0
+        logging.debug("Stop command, new_speed=0")
+    
+    elif intent == 'change_direction':
+        if direction == 'clc':
+            new_direction = 'clc'
+        elif direction == 'anticlc':
+            new_direction = 'anticlc'
+        elif direction == 'reverse':
+            new_direction = 'anticlc' if current_direction == 'clc' else 'clc'
+        else:
+            logging.warning("No valid direction for 'change_direction', toggling direction")
+            new_direction = 'anticlc' if current_direction == 'clc' else 'clc'
+        logging.debug("Direction set to: %s", new_direction)
+    
+    logging.debug("Output - new_speed=%s, new_direction=%s", new_speed, new_direction)
+    return new_speed, new_direction
+
+
+class MotorController:
+    """
+    One motor: its speed/direction state and its serial link.
+
+    State changes are applied in the caller's thread, in order, under the controller's lock.
+    Writes go to a single worker thread per motor, so they stay in order for this motor while
+    a slow or reconnecting port only holds up its own queue.
+
+    With `ramp` (RampScheduler keyword arguments, e.g. {'profile': 'linear', 'rate': 510}),
+    the state is the target and a ramp scheduler thread writes setpoints toward it instead.
+    A stop is never ramped: it is written at once.
+    """
+
+    def __init__(self, name, port=DEFAULT_PORT, link=None, speed=0, direction='clc', protocol='ascii', ramp=None):
+        self.name = name
+        self.link = link if link is not None else SerialLink(port)
+        self.port = self.link.port
+        self.protocol = make_protocol(protocol)  # 'ascii' lines or acknowledged 'binary' frames (serial_protocol.py)
+        self.speed = speed
+        self.direction = direction
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"motor-{name}")
+        self.ramp = None
+        if ramp:
+            self.ramp = RampScheduler(functools.partial(self.send, announce=False), speed, direction, name=name, **ramp)
+
+    def apply(self, intent, entities, base=None, timings=None):
+        """
+        Update the state with map_to_command and queue the write to the device.
+        With `base` ((speed, direction)), map from that state instead of the current one.
+        A `timings` dict gets map_ms, and serial_write_ms once the write has finished
+        (not with a ramp, whose setpoint writes are not tied to one command).
+        Returns:
+            tuple: (previous_state, new_state, future); states are (speed, direction) and the
+                future resolves to True/False once the write has finished (with a ramp: once
+                the first setpoint toward the new state has been written).
+        """
+        with self._lock:
+            previous = (self.speed, self.direction)
+            start = time.perf_counter()
+            with latency.stage('map'):
+                self.speed, self.direction = map_to_command(intent, entities, *(base or previous))
+            if timings is not None:
+                timings['map_ms'] = 1000 * (time.perf_counter() - start)
+            logging.debug("Motor %s: speed=%s -> %s, direction=%s -> %s",
+                          self.name, previous[0], self.speed, previous[1], self.direction)
+            return previous, (self.speed, self.direction), self._queue_write_locked(timings, immediate=intent == 'stop')
+
+    def restore(self, speed, direction):
+        """Put the state back to (speed, direction) and queue its write, e.g. to undo a speculative command."""
+        with self._lock:
+            logging.debug("Motor %s: restoring speed=%s, direction=%s", self.name, speed, direction)
+            self.speed, self.direction = speed, direction
+            return self._queue_write_locked()
+
+    def _queue_write_locked(self, timings=None, immediate=False):
+        if self.ramp:
+            # A stop is not ramped: it is written at once and drops the target being ramped to
+            print(f"Motor {self.name} {'stopping' if immediate else 'ramping'} to speed {self.speed}, "
+                  f"direction {self.direction}")
+            return self.ramp.set_target(self.speed, self.direction, immediate=immediate)
+        return self._writer.submit(self.send, self.speed, self.direction, timings=timings)
+
+    def send(self, speed, direction, announce=True, timings=None):
+        """
+        Send one command over this motor's serial link (blocking). Returns True on success.
+        A `timings` dict gets serial_write_ms, the time spent in the protocol's send.
+        """
+        start = time.perf_counter()
+        try:
+            with latency.stage('serial.write'):
+                self.protocol.send(self.link, speed, direction)
+            if timings is not None:
+                timings['serial_write_ms'] = 1000 * (time.perf_counter() - start)
+            logging.debug("Sent to motor %s on %s (%s): %s,%s", self.name, self.port, self.protocol.name, speed, direction)
+            if announce:
+                print(f"Motor {self.name} set to speed {speed}, direction {direction}")
+            return True
+        except serial.SerialException as e:
+            logging.error("Serial error on %s (motor %s): %s", self.port, self.name, e)
+            print(f"Error: Could not send to motor {self.name}: {e}")
+            return False
+        except Exception as e:
+            logging.error("Unexpected error on %s (motor %s): %s", self.port, self.name, e)
+            print(f"Error: Unexpected serial error on motor {self.name}: {e}")
+            return False
+
+    def close(self):
+        """Finish queued writes, then close the link."""
+        if self.ramp:
+            self.ramp.stop()
+        self._writer.shutdown(wait=True)
+        self.link.close()
+
+    def stats(self):
+        return {'port': self.port, 'speed': self.speed, 'direction': self.direction,
+                'serial': self.link.stats(), 'protocol': self.protocol.stats(),
+                'ramp': self.ramp.stats() if self.ramp else None}
+
+
+# "motor two", "motor 2", "motor /dev/ttyACM1" ... and "(on the) left motor", "all motors"
+_MOTOR_FIRST = re.compile(r'(?:\b(?:on|for)\s+)?(?:\bthe\s+)?\bmotors?\s+(?:number\s+)?([^\s,]+)', re.IGNORECASE)
+_NAME_FIRST = re.compile(r'(?:\b(?:on|for)\s+)?(?:\bthe\s+)?([^\s,]+)\s+motors?\b', re.IGNORECASE)
+ALL_MOTORS = ('all', 'every', 'both')
+
+
+def parse_motor_spec(spec):
+    """
+    Parse "left=/dev/ttyACM0,right=/dev/ttyACM1" into [(name, port), ...].
+    Entries without a name are named by position ("1", "2", ...).
+    """
+    motors = []
+    for position, item in enumerate(filter(None, (part.strip() for part in spec.split(','))), start=1):
+        name, _, port = item.rpartition('=')
+        motors.append((name or str(position), port))
+    return motors
+
+
+class MotorRegistry:
+    """
+    Motors addressed by name, port or position. The first motor added is the default for
+    commands that do not name one.
+    """
+
+    def __init__(self):
+        self.controllers = []
+        self._by_key = {}
+
+    @classmethod
+    def from_spec(cls, spec, protocol='ascii', ramp=None):
+        registry = cls()
+        for name, port in parse_motor_spec(spec):
+            registry.add(name, port, protocol=protocol, ramp=ramp)
+        return registry
+
+    def add(self, name, port=DEFAULT_PORT, link=None, protocol='ascii', ramp=None):
+        if self.get(name) is not None:
+            raise ValueError(f"Motor '{name}' is already registered")
+        controller = MotorController(name, port, link, protocol=protocol, ramp=ramp)
+        self.controllers.append(controller)
+        for key in (name, controller.port, controller.port.rsplit('/', 1)[-1]):
+            self._by_key.setdefault(key.lower(), controller)
+        return controller
+
+    @property
+    def default(self):
+        return self.controllers[0] if self.controllers else None
+
+    def get(self, key):
+        return self._by_key.get(str(key).lower())
+
+    def resolve(self, token):
+        """
+        Controllers addressed by one word: 'all'/'every'/'both', a name, a port (or its
+        basename), or a position as digits or words ("2", "two"). Empty list if none match.
+        """
+        token = token.lower().strip('.!?')
+        if token in ALL_MOTORS:
+            return list(self.controllers)
+        controller = self.get(token)
+        if controller is not None:
+            return [controller]
+        position = parse_value(token)
+        if isinstance(position, int) and 1 <= position <= len(self.controllers):
+            return [self.controllers[position - 1]]
+        return []
+
+    def route(self, text):
+        """
+        Find which motors a command is for and strip the address, so "motor two reverse"
+        becomes ([<motor 2>], "reverse"). Commands that name no known motor go to the default.
+        Returns:
+            tuple: (controllers, command_text)
+        """
+        for pattern in (_MOTOR_FIRST, _NAME_FIRST):
+            for match in pattern.finditer(text):
+                controllers = self.resolve(match.group(1))
+                if controllers:
+                    command = f"{text[:match.start()]} {text[match.end():]}"
+                    return controllers, ' '.join(command.split())
+        return [self.default], text
+
+    def close(self):
+        for controller in self.controllers:
+            controller.close()
+
+    def stats(self):
+        return {controller.name: controller.stats() for controller in self.controllers}
+
+
+if __name__ == "__main__":
+    # Three pty stand-ins, the second one slow: its writes must not hold up the other two
+    import os
+    import pty
+
+    class SlowLink(SerialLink):
+        def write(self, data, **kwargs):
+            time.sleep(0.5)
+            return super().write(data, **kwargs)
+
+    ptys = [pty.openpty() for _ in range(3)]
+    registry = MotorRegistry()
+    for position, (master, slave) in enumerate(ptys, start=1):
+        port = os.ttyname(slave)
+        registry.add(['left', 'middle', 'right'][position - 1], port,
+                     SlowLink(port) if position == 2 else None)
+
+    def received(position):
+        return os.read(ptys[position - 1][0], 64).decode().strip()
+
+    for text in ("motor two reverse", "set the left motor to half", "motor 3 increase by 20 percent",
+                 f"motor {registry.controllers[2].port} stop", "all motors stop"):
+        controllers, command = registry.route(text)
+        print(f"{text!r:40} -> {[c.name for c in controllers]} {command!r}")
+
+    start = time.perf_counter()
+    _, _, slow = registry.get('middle').apply('change_direction', {'direction': 'reverse'})
+    _, _, fast = registry.get('left').apply('set_speed', {'value': None, 'unit': 'half', 'direction': None})
+    fast.result()
+    print(f"left written after {1000 * (time.perf_counter() - start):.1f} ms while middle was still writing: "
+          f"{not slow.done()}")
+    slow.result()
+    print(f"middle written after {1000 * (time.perf_counter() - start):.1f} ms")
+
+    start = time.perf_counter()
+    futures = [c.apply('stop', {})[2] for c in registry.resolve('all')]
+    results = [f.result() for f in futures]
+    print(f"'all motors stop' written to 3 motors in {1000 * (time.perf_counter() - start):.1f} ms "
+          f"(slowest single write, not the sum): {results}")
+    print(f"left={received(1)!r} middle={received(2)!r} right={received(3)!r}")
+    registry.close()
+    for master, slave in ptys:
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,330 @@
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import os
+import signal
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SOCKET = '/tmp/motor_control.sock'
+MAX_REQUEST_BYTES = 2 ** 16
+OPS = ('command', 'ping', 'stats')
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else 0.0
+
+
+class MotorDaemon:
+    """
+    Serves `process_fn` (normally control_motor.process_command) over a Unix domain socket.
+
+    The protocol is one JSON object per line in each direction. A request is
+    {"id": ..., "op": "command", "text": "..."}, where "op" defaults to "command" and "id"
+    is echoed back; a missing id gets a server-assigned one. "ping" and "stats" need no text.
+    Each response is {"id", "ok", "result" or "error", "timings"}, with timings in ms:
+        queue_ms   : from the request line being read to a worker thread starting on it
+        process_ms : time spent in process_fn
+        total_ms   : from the request line being read to the response being written
+
+    The asyncio loop only does socket I/O. Commands run on a pool of `max_workers` threads,
+    so clients are served concurrently, and so are several requests pipelined on one
+    connection. Responses are written as each finishes and may come back out of order.
+    A request line longer than `max_request_bytes` gets a bad-request response and the
+    connection is closed, since the rest of that line cannot be told from the next request.
+    """
+
+    def __init__(self, process_fn, stats_fn=None, max_workers=8, max_request_bytes=MAX_REQUEST_BYTES):
+        self.process_fn = process_fn
+        self.stats_fn = stats_fn
+        self.max_workers = max_workers
+        self.max_request_bytes = max_request_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="daemon")
+        self._ids = itertools.count(1)
+        self._server = None
+        self._writers = set()
+        self._handlers = set()
+        self.socket_path = None
+        self.clients = 0
+        self.max_clients = 0
+        self.counts = {'connections': 0, 'requests': 0, 'failed': 0, 'bad_requests': 0}
+        self._total_ms = collections.deque(maxlen=10000)
+
+    async def start(self, socket_path=DEFAULT_SOCKET, mode=0o600):
+        """Bind the socket (replacing a stale one) and start accepting clients."""
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_client, path=socket_path,
+                                                       limit=self.max_request_bytes)
+        os.chmod(socket_path, mode)
+        self.socket_path = socket_path
+        logging.info(f"Motor daemon listening on {socket_path} with {self.max_workers} workers")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()  # wait_closed() also waits for connected clients
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._executor.shutdown(wait=True)
+
+    async def _handle_client(self, reader, writer):
+        self.counts['connections'] += 1
+        self.clients += 1
+        self.max_clients = max(self.max_clients, self.clients)
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError) as e:
+                    logging.warning(f"Daemon request over {self.max_request_bytes} bytes, closing the connection: {e}")
+                    self.counts['bad_requests'] += 1
+                    error = f"Bad request: line longer than {self.max_request_bytes} bytes"
+                    await self._write(writer, write_lock, {'id': None, 'ok': False, 'error': error})
+                    break
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._serve(line, time.perf_counter(), writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.warning(f"Daemon client disconnected: {e}")
+        finally:
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            self.clients -= 1
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _run(self, text):
+        started = time.perf_counter()
+        result = self.process_fn(text)
+        return result, started, time.perf_counter()
+
+    async def _serve(self, line, received, writer, write_lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get('id', f"srv-{next(self._ids)}")
+            op = request.get('op', 'command')
+            if op not in OPS:
+                raise ValueError(f"unknown op '{op}', expected one of {OPS}")
+            if op == 'command' and not isinstance(request.get('text'), str):
+                raise ValueError("command needs a 'text' string")
+        except ValueError as e:
+            self.counts['bad_requests'] += 1
+            response = {'id': request_id, 'ok': False, 'error': f"Bad request: {e}"}
+        else:
+            self.counts['requests'] += 1
+            response = {'id': request_id, 'ok': True}
+            timings = {}
+            if op == 'ping':
+                response['result'] = 'pong'
+            elif op == 'stats':
+                # stats_fn takes the serial link locks, which a write can hold for its timeout
+                loop = asyncio.get_running_loop()
+                response['result'] = await loop.run_in_executor(self._executor, self.stats)
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    result, started, finished = await loop.run_in_executor(self._executor, self._run, request['text'])
+                except Exception as e:
+                    logging.error(f"Daemon request {request_id!r} failed: {e}")
+                    result, started, finished = None, received, time.perf_counter()
+                    response['error'] = str(e)
+                timings = {'queue_ms': 1000 * (started - received), 'process_ms': 1000 * (finished - started)}
+                response['result'] = result
+                if result is None:
+                    response['ok'] = False
+                    response.setdefault('error', "Command failed")
+                    self.counts['failed'] += 1
+            timings['total_ms'] = 1000 * (time.perf_counter() - received)
+            response['timings'] = timings
+            self._total_ms.append(timings['total_ms'])
+        await self._write(writer, write_lock, response)
+
+    async def _write(self, writer, write_lock, response):
+        async with write_lock:
+            writer.write(json.dumps(response, default=str).encode() + b'\n')
+            await writer.drain()
+
+    def stats(self):
+        total = sorted(self._total_ms)
+        stats = {
+            **self.counts,
+            'clients': self.clients,
+            'max_clients': self.max_clients,
+            'total_p50_ms': _percentile(total, 0.50),
+            'total_p99_ms': _percentile(total, 0.99),
+        }
+        if self.stats_fn:
+            stats['pipeline'] = self.stats_fn()
+        return stats
+
+
+class DaemonClient:
+    """asyncio client for MotorDaemon; several calls may be in flight at once on one connection."""
+
+    def __init__(self):
+        self._reader = self._writer = self._listener = None
+        self._waiting = {}
+        self._ids = itertools.count(1)
+
+    async def connect(self, socket_path=DEFAULT_SOCKET):
+        self._reader, self._writer = await asyncio.open_unix_connection(socket_path)
+        self._listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def _listen(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._waiting.pop(response.get('id'), None)
+            if future and not future.done():
+                future.set_result(response)
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Daemon closed the connection"))
+        self._waiting.clear()
+
+    async def call(self, text=None, op='command'):
+        """Send one request and wait for its response dict."""
+        request_id = f"c{id(self):x}-{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        request = {'id': request_id, 'op': op}
+        if text is not None:
+            request['text'] = text
+        self._writer.write(json.dumps(request).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        self._writer.close()
+        await self._listener
+
+
+def request(text=None, op='command', socket_path=DEFAULT_SOCKET):
+    """Blocking one-shot call, e.g. request("set speed to half")."""
+    async def run():
+        client = await DaemonClient().connect(socket_path)
+        try:
+            return await client.call(text, op)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def serve(process_fn, socket_path=DEFAULT_SOCKET, stats_fn=None, max_workers=8):
+    """Run a MotorDaemon until SIGINT or SIGTERM. Returns its final stats."""
+    async def run():
+        daemon = MotorDaemon(process_fn, stats_fn, max_workers)
+        await daemon.start(socket_path)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        print(f"Serving motor commands on {socket_path} (Ctrl+C to stop)")
+        await stop.wait()
+        await daemon.close()
+        return daemon.stats()
+    return asyncio.run(run())
+
+
+async def _selftest(clients, commands, max_workers):
+    import contextlib
+    import io
+
+    import control_motor
+    from benchmark_pipeline import load_corpus
+    from serial_protocol import EmulatedESP32
+
+    esp32 = EmulatedESP32()
+    control_motor.configure_motors(esp32.port)
+    errors = control_motor.warm_up(calibrate_microphone=False)
+    if errors:
+        print(f"Models not loaded ({', '.join(errors)}): only phrases in the phrase index will succeed")
+
+    sentences = load_corpus()
+    socket_path = f"/tmp/motor_daemon_selftest_{os.getpid()}.sock"
+    daemon = MotorDaemon(control_motor.process_command, control_motor.motors.stats, max_workers)
+    await daemon.start(socket_path)
+    connections = [await DaemonClient().connect(socket_path) for _ in range(clients)]
+
+    async def client_loop(client, index):
+        responses = []
+        for i in range(index, commands, clients):
+            responses.append(await client.call(sentences[i % len(sentences)]))
+        return responses
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        per_client = await asyncio.gather(*(client_loop(c, i) for i, c in enumerate(connections)))
+    elapsed = time.perf_counter() - start
+    responses = [r for rs in per_client for r in rs]
+    stats = (await connections[0].call(op='stats'))['result']
+    for client in connections:
+        await client.close()
+    await daemon.close()
+
+    motor = control_motor.motors.default
+    deadline = time.perf_counter() + 1.0
+    while (esp32.speed, esp32.direction) != (motor.speed, motor.direction) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    ok = sum(r['ok'] for r in responses)
+    written = sum(bool(r['ok'] and r['result']['success']) for r in responses)
+    total = sorted(r['timings']['total_ms'] for r in responses)
+    queued = sorted(r['timings']['queue_ms'] for r in responses)
+    print(f"{len(responses)} requests from {clients} concurrent clients in {elapsed:.2f} s "
+          f"({len(responses) / elapsed:.0f} requests/s): {ok} ok ({written} written to serial), "
+          f"{len(responses) - ok} failed")
+    print(f"total p50 {_percentile(total, 0.5):.2f} ms  p99 {_percentile(total, 0.99):.2f} ms  "
+          f"queue p99 {_percentile(queued, 0.99):.2f} ms  max clients {stats['max_clients']}")
+    print(f"Emulated ESP32 applied {esp32.applied} writes, ends at {esp32.speed},{esp32.direction}; "
+          f"motor state {motor.speed},{motor.direction}")
+    control_motor.motors.close()
+    esp32.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Client for the motor control daemon (start it with: python control_motor.py --serve PATH).")
+    parser.add_argument("text", nargs='*', help="Commands to send, one request each")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--op", choices=OPS, default='command')
+    parser.add_argument("--selftest", action="store_true",
+                        help="Serve in-process against a pty ESP32 emulator and replay the corpus from concurrent clients")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8, help="Daemon worker threads for --selftest")
+    args = parser.parse_args()
+
+    if args.selftest:
+        asyncio.run(_selftest(args.clients, args.commands, args.workers))
+        return
+    if args.op == 'command' and not args.text:
+        parser.error("give at least one command, or --op ping/stats")
+    for text in args.text or [None]:
+        print(json.dumps(request(text, args.op, args.socket), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
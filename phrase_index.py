@@ -0,0 +1,146 @@
+import csv
+import logging
+import re
+import threading
+
+from extract_entities import entities_from_spans
+from rule_entities import bio_spans
+
+_NUMBER = re.compile(r'^\d+(?:\.\d+)?$')
+_TRAILING_PUNCT = re.compile(r'[.!?,]+$')
+_AMBIGUOUS = object()
+NUM_SLOT = '<num>'
+
+
+def _tokens(text):
+    """Lowercased tokens with trailing punctuation stripped, '50.0' -> '50' and 'percent' -> '%'."""
+    tokens = []
+    for token in text.lower().split():
+        token = _TRAILING_PUNCT.sub('', token).replace(',', '')
+        if not token:
+            continue
+        if token == 'percent':
+            token = '%'
+        elif _NUMBER.match(token) and token.endswith('.0'):
+            token = token[:-2]
+        tokens.append(token)
+    return tokens
+
+
+def _key(tokens):
+    """Delexicalized lookup key: digits become a slot so "set to 40 %" and "set to 95 %" share a key."""
+    return tuple(NUM_SLOT if _NUMBER.match(token) else token for token in tokens)
+
+
+def _add(table, key, value):
+    existing = table.get(key)
+    if existing is None:
+        table[key] = value
+    elif existing is not _AMBIGUOUS and existing != value:
+        table[key] = _AMBIGUOUS  # Same phrase shape, different answers: leave it to the models
+
+
+class PhraseIndex:
+    """
+    Hashed phrase-shape index built from commands.csv and ner_commands.csv.
+
+    Each corpus sentence is tokenized and delexicalized (numbers become a slot) into a
+    key. Intents are looked up by key in one hash table. BIO label sequences are looked
+    up in another and re-applied to the query's own tokens, so a known phrase shape
+    yields its entities without running spaCy. Keys whose corpus rows disagree are
+    marked ambiguous and always fall through to the models.
+    """
+
+    def __init__(self, intent_csv='commands.csv', ner_csv='ner_commands.csv'):
+        self.intents = {}
+        self.labels = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.intent_hits = 0
+        self.entity_hits = 0
+        self.checked = 0
+        self.intent_drift = 0
+        self.entity_drift = 0
+        if intent_csv:
+            self._load_intents(intent_csv)
+        if ner_csv:
+            self._load_labels(ner_csv)
+        logging.info(f"Phrase index built: {len(self.intents)} intent keys, {len(self.labels)} entity keys")
+
+    def _load_intents(self, path):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                _add(self.intents, _key(_tokens(row['sentence'])), row['intent'])
+
+    def _load_labels(self, path):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                tokens = _tokens(row['sentence'])
+                labels = tuple(row['labels'].split())
+                if len(tokens) != len(labels):
+                    continue  # Same check as chceck_nercommands.py
+                _add(self.labels, _key(tokens), labels)
+
+    def lookup(self, text):
+        """
+        Resolve text from the index.
+        Returns:
+            tuple: (intent, entities); either is None when the index has no confident answer.
+            Entities are before apply_intent_fallback, like extract_entities(text) without an intent.
+        """
+        tokens = _tokens(text)
+        key = _key(tokens)
+        intent = self.intents.get(key)
+        if intent is _AMBIGUOUS:
+            intent = None
+        labels = self.labels.get(key)
+        entities = None
+        if labels is not None and labels is not _AMBIGUOUS:
+            entities = entities_from_spans(bio_spans(tokens, labels), ' '.join(tokens))
+        with self._lock:
+            self.lookups += 1
+            self.intent_hits += intent is not None
+            self.entity_hits += entities is not None
+        return intent, entities
+
+    def record_check(self, text, indexed, predicted):
+        """Compare an index answer against the models' answer for drift reporting."""
+        indexed_intent, indexed_entities = indexed
+        intent, entities = predicted
+        intent_drift = indexed_intent is not None and indexed_intent != intent
+        entity_drift = indexed_entities is not None and indexed_entities != entities
+        with self._lock:
+            self.checked += 1
+            self.intent_drift += intent_drift
+            self.entity_drift += entity_drift
+        if intent_drift or entity_drift:
+            logging.warning(f"Phrase index drift for '{text}': index={indexed}, models={predicted}")
+        return not (intent_drift or entity_drift)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'intent_hit_ratio': self.intent_hits / self.lookups if self.lookups else 0.0,
+                'entity_hit_ratio': self.entity_hits / self.lookups if self.lookups else 0.0,
+                'checked': self.checked,
+                'intent_drift': self.intent_drift,
+                'entity_drift': self.entity_drift,
+            }
+
+
+if __name__ == "__main__":
+    # Drift check: run every corpus sentence through both the index and the models
+    from control_motor import predict_intent
+    from extract_entities import extract_entities
+
+    index = PhraseIndex()
+    sentences = []
+    for path in ('commands.csv', 'ner_commands.csv'):
+        with open(path, newline='') as f:
+            sentences.extend(row['sentence'] for row in csv.DictReader(f))
+    for sentence in sentences:
+        indexed = index.lookup(sentence)
+        if indexed != (None, None):
+            index.record_check(sentence, indexed, (predict_intent(sentence), extract_entities(sentence)))
+    print(f"Phrase index stats: {index.stats()}")
@@ -0,0 +1,225 @@
+import collections
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future
+
+PROFILES = ('linear', 'exponential', 'step')
+
+
+class RampScheduler:
+    """
+    Sits between map_to_command and the serial writer of one motor.
+
+    Targets from set_target() are not sent as-is: a tick thread emits speed setpoints at
+    `tick_hz` along the chosen profile until the output reaches the latest target. A target
+    that is replaced before any tick acted on it is merged into the newer one, so bursts of
+    commands cost at most one serial write per tick. A direction change first ramps down to 0.
+    An immediate target (a stop) skips all of this: the tick thread is woken at once, writes it
+    in a single setpoint and drops whatever target was pending.
+
+    Profiles:
+        linear      : at most `rate` PWM units per second
+        exponential : a fraction `alpha` of the remaining distance per tick (at least 1 unit)
+        step        : jump straight to the target (coalescing and tick pacing only)
+    """
+
+    def __init__(self, send_fn, speed=0, direction='clc', profile='linear', rate=510.0, tick_hz=50.0,
+                 alpha=0.2, name='motor'):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown ramp profile '{profile}', expected one of {PROFILES}")
+        self.send_fn = send_fn
+        self.profile = profile
+        self.rate = rate
+        self.tick_hz = tick_hz
+        self.alpha = alpha
+        self.period = 1.0 / tick_hz
+        self.speed, self.direction = speed, direction  # Last setpoint sent
+        self._position = float(speed)
+        self._goal = (speed, direction)
+        self._pending = None
+        self._immediate = None
+        self._waiters = []
+        self._cond = threading.Condition()
+        self._running = True
+        self._jitter = collections.deque(maxlen=10000)
+        self.counts = {'submitted': 0, 'merged': 0, 'retargeted': 0, 'immediate': 0, 'setpoints': 0,
+                       'ticks': 0, 'missed_ticks': 0, 'failed_writes': 0}
+        self._thread = threading.Thread(target=self._run, name=f"ramp-{name}", daemon=True)
+        self._thread.start()
+
+    def set_target(self, speed, direction, immediate=False):
+        """
+        Ramp toward (speed, direction), replacing any target not yet acted on. With `immediate`,
+        write it as one setpoint without waiting for the next tick (used for stop); a target set
+        after it but before it was written is ramped to afterwards.
+        Returns:
+            Future: True/False once the first setpoint toward this target (or the target that
+                replaced it) has been written; True at once if the output is already there.
+        """
+        future = Future()
+        with self._cond:
+            self.counts['submitted'] += 1
+            if self._waiters:
+                self.counts['merged'] += 1
+            elif self._goal != (self.speed, self.direction):
+                self.counts['retargeted'] += 1
+            if immediate:
+                self.counts['immediate'] += 1
+                self._immediate, self._pending = (speed, direction), None
+            else:
+                self._pending = (speed, direction)
+            self._waiters.append(future)
+            self._cond.notify()
+        return future
+
+    def _idle(self):
+        return self._pending is None and self._immediate is None and self._goal == (self.speed, self.direction)
+
+    def _advance(self, target):
+        distance = target - self._position
+        if self.profile == 'step' or distance == 0:
+            return float(target)
+        if self.profile == 'linear':
+            step = self.rate * self.period
+        else:
+            step = max(1.0, abs(distance) * self.alpha)
+        return float(target) if abs(distance) <= step else self._position + math.copysign(step, distance)
+
+    def _next_setpoint(self):
+        goal_speed, goal_direction = self._goal
+        if goal_direction != self.direction:
+            if self.speed > 0:
+                return self._advance(0), self.direction  # Slow to a stop before reversing
+            return 0.0, goal_direction
+        return self._advance(goal_speed), self.direction
+
+    def _run(self):
+        next_tick = None
+        while True:
+            with self._cond:
+                while self._running and self._idle():
+                    next_tick = None
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+            if next_tick is None:
+                next_tick = time.perf_counter()
+            else:
+                with self._cond:  # Sleep until the tick, unless an immediate target wakes us
+                    while self._running and self._immediate is None and time.perf_counter() < next_tick:
+                        self._cond.wait(next_tick - time.perf_counter())
+                    woken = self._immediate is not None
+                if not woken:
+                    self._jitter.append(time.perf_counter() - next_tick)
+
+            with self._cond:
+                if not self._running:
+                    return
+                waiters, self._waiters = self._waiters, []
+                if self._immediate is not None:
+                    self._goal, self._immediate = self._immediate, None
+                    position, direction = float(self._goal[0]), self._goal[1]
+                else:
+                    if self._pending is not None:
+                        self._goal, self._pending = self._pending, None
+                    position, direction = self._next_setpoint()
+            self.counts['ticks'] += 1
+
+            speed = round(position)
+            if (speed, direction) == (self.speed, self.direction):
+                ok = True
+            else:
+                try:
+                    ok = bool(self.send_fn(speed, direction))
+                except Exception as e:
+                    logging.error(f"Ramp setpoint {speed},{direction} failed: {e}")
+                    ok = False
+                with self._cond:
+                    if ok:
+                        self._position, self.speed, self.direction = position, speed, direction
+                        self.counts['setpoints'] += 1
+                    else:
+                        self._goal = (self.speed, self.direction)  # Give up on this target until the next command
+                        self.counts['failed_writes'] += 1
+            for waiter in waiters:
+                waiter.set_result(ok)
+
+            next_tick += self.period
+            late = time.perf_counter() - next_tick
+            if late > 0:
+                missed = int(late // self.period) + 1
+                self.counts['missed_ticks'] += missed
+                next_tick += missed * self.period
+
+    def stop(self):
+        """Stop the tick thread; targets still pending are resolved as not sent."""
+        with self._cond:
+            self._running = False
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify()
+        self._thread.join()
+        for waiter in waiters:
+            waiter.set_result(False)
+
+    def stats(self):
+        jitter = sorted(self._jitter)
+        pick = lambda q: 1000 * jitter[min(len(jitter) - 1, int(q * len(jitter)))] if jitter else 0.0
+        return {
+            'profile': self.profile,
+            'tick_hz': self.tick_hz,
+            'speed': self.speed,
+            'direction': self.direction,
+            **self.counts,
+            'jitter_p50_ms': pick(0.50),
+            'jitter_p99_ms': pick(0.99),
+            'jitter_max_ms': 1000 * jitter[-1] if jitter else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    # A burst of 500 commands in ~0.25 s against a link that takes 2 ms per write
+    import random
+
+    writes = []
+
+    def slow_send(speed, direction):
+        time.sleep(0.002)
+        writes.append((time.perf_counter(), speed, direction))
+        return True
+
+    rng = random.Random(0)
+    for profile in PROFILES:
+        writes.clear()
+        scheduler = RampScheduler(slow_send, profile=profile)
+        start = time.perf_counter()
+        for i in range(500):
+            scheduler.set_target(rng.randint(0, 255), 'anticlc' if i == 499 else 'clc')
+            time.sleep(0.0005)
+        scheduler.set_target(255, 'clc').result()
+        while scheduler.speed != 255:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        scheduler.stop()
+        stats = scheduler.stats()
+        print(f"{profile:<12} 501 commands -> {len(writes)} serial writes in {elapsed:.2f} s "
+              f"({len(writes) / elapsed:.0f}/s at {stats['tick_hz']:.0f} Hz ticks), merged {stats['merged']}, "
+              f"retargeted {stats['retargeted']}, missed ticks {stats['missed_ticks']}, "
+              f"jitter p50 {stats['jitter_p50_ms']:.3f} ms p99 {stats['jitter_p99_ms']:.3f} ms")
+
+    # A stop at full speed, mid-ramp, with a target pending: one write of 0, well within a tick
+    scheduler = RampScheduler(slow_send, speed=255, profile='linear', tick_hz=10)
+    scheduler.set_target(100, 'clc').result()
+    scheduler.set_target(180, 'clc')
+    writes.clear()
+    before = scheduler.speed
+    start = time.perf_counter()
+    ok = scheduler.set_target(0, 'clc', immediate=True).result()
+    stop_ms = 1000 * (time.perf_counter() - start)
+    time.sleep(3 * scheduler.period)
+    scheduler.stop()
+    print(f"stop from {before} mid-ramp at 10 Hz ticks: {[w[1:] for w in writes]} in {stop_ms:.1f} ms")
+    assert ok and [w[1:] for w in writes] == [(0, 'clc')], writes
+    assert stop_ms < 1000 * scheduler.period / 2, stop_ms
@@ -0,0 +1,199 @@
+import re
+
+# Lookup tables shared by the spaCy path (extract_entities.entities_from_spans) and the rule engine below
+
+UNIT_TABLE = {
+    'percent': '%', 'per cent': '%', '%': '%',
+    'half': 'half',
+    'quarter': 'quarter',
+    'double': 'double',
+    'max': 'max', 'maximum': 'max',
+    'min': 'min', 'minimum': 'min',
+}
+
+DIRECTION_TABLE = {
+    'clockwise': 'clc', 'clc': 'clc',
+    'anticlockwise': 'anticlc', 'anti clockwise': 'anticlc', 'anticlc': 'anticlc',
+    'counterclockwise': 'anticlc', 'counter clockwise': 'anticlc',
+    'reverse': 'reverse',
+}
+
+# Words the NER sometimes labels DIRECTION that are really units
+MISLABELLED_DIRECTION_UNITS = {'max': 'max', 'maximum': 'max', 'min': 'min', 'minimum': 'min'}
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14,
+    'fifteen': 15, 'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50, 'sixty': 60, 'seventy': 70,
+    'eighty': 80, 'ninety': 90,
+}
+NUMBER_SCALES = {'hundred': 100}
+
+# Words that carry no entity; any other word makes the rule engine unsure (see rule_spans)
+FILLER_WORDS = frozenset("""
+    a adjust and at boost by change current decrease direction down go increase it make motor
+    now of please reduce rotate rotation run set slow speed spin stop switch the to turn up
+""".split())
+
+MAX_RE = re.compile(r'\b(max|maximum)\b')
+MIN_RE = re.compile(r'\b(min|minimum)\b')
+_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?|%|[a-z]+')
+_NUMBER_RE = re.compile(r'^\d+(?:\.\d+)?$')
+
+
+def parse_value(text):
+    """
+    Parse a VALUE span: digits ("40", "40%", "12.5") or number words ("forty", "forty five",
+    "one hundred"). Returns int/float, or None if the span is not a number.
+    """
+    text = text.replace('%', '').strip().lower()
+    if _NUMBER_RE.match(text):
+        return float(text) if '.' in text else int(text)
+    words = [word for word in text.replace('-', ' ').split() if word != 'and']
+    if not words:
+        return None
+    total = current = 0
+    for word in words:
+        if word in NUMBER_WORDS:
+            current += NUMBER_WORDS[word]
+        elif word in NUMBER_SCALES:
+            current = max(current, 1) * NUMBER_SCALES[word]
+            total += current
+            current = 0
+        else:
+            return None
+    return total + current
+
+
+def _is_number_word(token):
+    return token in NUMBER_WORDS or token in NUMBER_SCALES
+
+
+def rule_spans(text):
+    """
+    Find VALUE, UNIT and DIRECTION spans with the lookup tables, longest phrase first.
+    Returns:
+        tuple: ([(label, span_text), ...], unknown) where `unknown` counts words that are
+        neither entities nor known filler. unknown == 0 means every word was accounted for.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    spans = []
+    unknown = 0
+    i = 0
+    while i < len(tokens):
+        pair = ' '.join(tokens[i:i + 2])
+        token = tokens[i]
+        if pair in DIRECTION_TABLE:
+            spans.append(('DIRECTION', pair))
+            i += 2
+        elif pair in UNIT_TABLE:
+            spans.append(('UNIT', pair))
+            i += 2
+        elif _NUMBER_RE.match(token):
+            spans.append(('VALUE', token))
+            i += 1
+        elif _is_number_word(token):
+            j = i + 1
+            while j < len(tokens) and (_is_number_word(tokens[j]) or
+                                       (tokens[j] == 'and' and j + 1 < len(tokens) and _is_number_word(tokens[j + 1]))):
+                j += 1
+            spans.append(('VALUE', ' '.join(tokens[i:j])))
+            i = j
+        elif token in UNIT_TABLE:
+            spans.append(('UNIT', token))
+            i += 1
+        elif token in DIRECTION_TABLE:
+            spans.append(('DIRECTION', token))
+            i += 1
+        else:
+            unknown += token not in FILLER_WORDS
+            i += 1
+    return spans, unknown
+
+
+def is_confident(spans, unknown):
+    """Rules are trusted on their own when every word is known and no entity type appears twice."""
+    labels = [label for label, _ in spans]
+    return unknown == 0 and len(labels) == len(set(labels))
+
+
+def bio_spans(tokens, labels):
+    """Group BIO labels over tokens into (label, text) spans."""
+    spans = []
+    for token, label in zip(tokens, labels):
+        if label.startswith('B-'):
+            spans.append([label[2:], token])
+        elif label.startswith('I-') and spans and spans[-1][0] == label[2:]:
+            spans[-1][1] += f" {token}"
+    return [tuple(span) for span in spans]
+
+
+def compare_with_spacy(data_file='ner_commands.csv'):
+    """
+    Accuracy and speed of the rule engine, the spaCy model and the pre-filter combination
+    against the BIO labels in data_file (exact match of the normalized entities dict).
+    FILLER_WORDS was written against ner_commands.csv, so the pre-filter's coverage there
+    is optimistic; run it on held-out sentences too (see __main__).
+    """
+    import csv
+    import time
+    import extract_entities as ee
+
+    rows = []
+    with open(data_file, newline='') as f:
+        for row in csv.DictReader(f):
+            text = row['sentence'].lower()
+            tokens, labels = text.split(), row['labels'].split()
+            if len(tokens) != len(labels):
+                continue
+            rows.append((text, ee.entities_from_spans(bio_spans(tokens, labels), text)))
+
+    ee.load_nlp()
+    engines = {
+        'spacy': lambda text: ee.extract_entities(text, engine='spacy'),
+        'rules': lambda text: ee.extract_entities(text, engine='rules'),
+        'prefilter': lambda text: ee.extract_entities(text, engine='prefilter'),
+    }
+    print(f"{'engine':<10} {'exact':>7} {'value':>7} {'unit':>7} {'dir':>7} {'us/utt':>9}")
+    results = {}
+    for name, extract in engines.items():
+        start = time.perf_counter()
+        predictions = [extract(text) for text, _ in rows]
+        micros = 1e6 * (time.perf_counter() - start) / len(rows)
+        field = lambda key: sum(p[key] == g[key] for p, (_, g) in zip(predictions, rows)) / len(rows)
+        exact = sum(p == g for p, (_, g) in zip(predictions, rows)) / len(rows)
+        results[name] = {'exact': exact, 'us_per_utterance': micros}
+        print(f"{name:<10} {exact:>7.3f} {field('value'):>7.3f} {field('unit'):>7.3f} "
+              f"{field('direction'):>7.3f} {micros:>9.1f}")
+    confident = [(text, gold) for text, gold in rows if is_confident(*rule_spans(text))]
+    correct = sum(engines['rules'](text) == gold for text, gold in confident)
+    print(f"Pre-filter answered {len(confident)}/{len(rows)} sentences without spaCy, {correct} of them exactly")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import shutil
+    import tempfile
+
+    from generate_corpus import generate_corpus
+
+    parser = argparse.ArgumentParser(description="Compare the rule engine, spaCy and the pre-filter on BIO data.")
+    parser.add_argument("--data", help="BIO CSV to score (default: a generated corpus, held out from FILLER_WORDS)")
+    parser.add_argument("--rows", type=int, default=2000, help="Generated sentences when --data is not given")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.data:
+        compare_with_spacy(args.data)
+    else:
+        workdir = tempfile.mkdtemp(prefix='rule_entities_')
+        try:
+            ner_file = os.path.join(workdir, 'ner.csv')
+            generate_corpus(args.rows, os.path.join(workdir, 'intents.csv'), ner_file, args.seed, workers=1)
+            print(f"{args.rows} generated sentences (seed {args.seed})")
+            compare_with_spacy(ner_file)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+
+import serial
+
+DEFAULT_PORT = '/dev/ttyACM0'
+DEFAULT_BAUDRATE = 115200
+
+
+class SerialLink:
+    """
+    Long-lived serial connection to the ESP32.
+
+    The port is opened once and kept for the whole session instead of being
+    reopened for every command (reopening toggles DTR, which resets some boards).
+    Dropped devices are reconnected with exponential backoff on the next write.
+    Any path pyserial can open works as `port`, including the slave side of a pty,
+    so the link can be exercised without real hardware (see __main__ below).
+    """
+
+    def __init__(self, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, timeout=1,
+                 max_retries=3, initial_backoff=0.1, max_backoff=5.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._ser = None
+        self._lock = threading.Lock()
+        self._backoff = initial_backoff
+        self.timings = {name: {'count': 0, 'total_s': 0.0, 'last_s': 0.0, 'max_s': 0.0}
+                        for name in ('open', 'write', 'close')}
+        self.reconnects = 0  # Reopens after a drop that succeeded
+        self.reconnect_failures = 0  # Reopens after a drop that failed
+
+    def _record(self, name, elapsed):
+        stat = self.timings[name]
+        stat['count'] += 1
+        stat['total_s'] += elapsed
+        stat['last_s'] = elapsed
+        stat['max_s'] = max(stat['max_s'], elapsed)
+
+    @property
+    def is_open(self):
+        return self._ser is not None and self._ser.is_open
+
+    def _open_locked(self):
+        start = time.perf_counter()
+        ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout, write_timeout=self.timeout)
+        ser.reset_input_buffer()  # Clear any stale data once per connection
+        self._ser = ser
+        self._record('open', time.perf_counter() - start)
+        self._backoff = self.initial_backoff
+        logging.info(f"Opened serial link on {self.port}")
+
+    def _close_locked(self):
+        if self._ser is None:
+            return
+        start = time.perf_counter()
+        try:
+            self._ser.close()
+        except Exception as e:
+            logging.warning(f"Error closing serial link on {self.port}: {e}")
+        self._ser = None
+        self._record('close', time.perf_counter() - start)
+
+    def open(self):
+        """Open the port if it is not already open. Raises serial.SerialException on failure."""
+        with self._lock:
+            if not self.is_open:
+                self._open_locked()
+
+    def close(self):
+        """Close the port. Safe to call more than once."""
+        with self._lock:
+            self._close_locked()
+
+    def write(self, data, drain_input=False):
+        """
+        Write raw bytes, reconnecting with exponential backoff if the device dropped.
+        With drain_input, pending input (e.g. unread echoes) is discarded first. The backoff
+        sleep happens without holding the link, so reads, stats and close are not blocked.
+        Returns:
+            int: Number of bytes written.
+        Raises:
+            serial.SerialException: If the write still fails after max_retries reconnects.
+        """
+        attempt = 0
+        while True:
+            with self._lock:
+                try:
+                    if not self.is_open:
+                        self._open_locked()
+                        if attempt:
+                            self.reconnects += 1
+                    start = time.perf_counter()
+                    if drain_input:
+                        self._ser.reset_input_buffer()
+                    written = self._ser.write(data)
+                    self._ser.flush()  # Wait for the OS to drain the buffer, no fixed sleep
+                    self._record('write', time.perf_counter() - start)
+                    return written
+                except (serial.SerialException, OSError) as e:
+                    if attempt and not self.is_open:
+                        self.reconnect_failures += 1
+                    self._close_locked()
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        logging.error(f"Serial link on {self.port} failed after {self.max_retries} retries: {e}")
+                        raise serial.SerialException(str(e)) from e
+                    backoff, error = self._backoff, e
+                    self._backoff = min(self._backoff * 2, self.max_backoff)
+            logging.warning(f"Serial link on {self.port} dropped ({error}), reconnecting in {backoff:.2f}s")
+            time.sleep(backoff)
+
+    def write_line(self, line):
+        """
+        Write one newline-terminated ASCII command. The board echoes every line, so input
+        is drained first; otherwise unread echoes fill the buffer until the board stalls.
+        """
+        return self.write(f"{line}\n".encode(), drain_input=True)
+
+    def read(self, size=1, timeout=None):
+        """Read up to `size` bytes, waiting at most `timeout` seconds (default: the link timeout)."""
+        with self._lock:
+            if not self.is_open:
+                self._open_locked()
+            timeout = self.timeout if timeout is None else timeout
+            if self._ser.timeout != timeout:
+                self._ser.timeout = timeout
+            return self._ser.read(size)
+
+    def read_line(self):
+        """Read one line from the device (empty bytes on timeout)."""
+        with self._lock:
+            if not self.is_open:
+                self._open_locked()
+            if self._ser.timeout != self.timeout:
+                self._ser.timeout = self.timeout
+            return self._ser.readline()
+
+    def stats(self):
+        """Return open/write/close timing counters and the successful and failed reconnect counts."""
+        with self._lock:
+            stats = {name: dict(stat) for name, stat in self.timings.items()}
+        stats['reconnects'] = self.reconnects
+        stats['reconnect_failures'] = self.reconnect_failures
+        return stats
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    # Loopback check against a pty standing in for the ESP32
+    import os
+    import pty
+
+    master_fd, slave_fd = pty.openpty()
+    slave_name = os.ttyname(slave_fd)
+    print(f"Using pty {slave_name} as ESP32 stand-in")
+    with SerialLink(slave_name) as link:
+        for speed in range(0, 256, 51):
+            link.write_line(f"{speed},clc")
+            print(f"ESP32 received: {os.read(master_fd, 64).decode().strip()}")
+    stats = link.stats()
+    for name in ('open', 'write', 'close'):
+        stat = stats[name]
+        mean_ms = 1000 * stat['total_s'] / stat['count'] if stat['count'] else 0.0
+        print(f"{name}: count={stat['count']} mean={mean_ms:.3f} ms max={1000 * stat['max_s']:.3f} ms")
+    os.close(master_fd)
+    os.close(slave_fd)
@@ -0,0 +1,316 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import serial
+
+# Binary command frame, host -> ESP32 (6 bytes):
+#   0xA5 | version | seq | speed | flags | crc8
+# flags bit 0 is the direction (0 = clc, 1 = anticlc); bit 1 (FLAG_SYNC) marks a host session's
+# frames until its first ack, and the board applies those whatever its last seq was, so a restarted
+# host whose first seq happens to equal the board's last one is not taken for a duplicate.
+# crc8 covers version..flags.
+# Acknowledgement, ESP32 -> host (5 bytes):
+#   0x5A | version | seq | status | crc8
+# status is ACK_APPLIED, or ACK_DUPLICATE when a retransmitted frame had already been applied.
+# Start bytes are outside printable ASCII, so the board can accept both formats on one port.
+FRAME_VERSION = 1
+FRAME_START = 0xA5
+ACK_START = 0x5A
+FRAME_SIZE = 6
+ACK_SIZE = 5
+ACK_APPLIED = 0
+ACK_DUPLICATE = 1
+DIRECTION_BITS = {'clc': 0, 'anticlc': 1}
+FLAG_SYNC = 0x02
+PROTOCOLS = ('ascii', 'binary')
+
+
+def _crc8_table(poly=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+_CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """CRC-8 (polynomial 0x07, initial value 0), as in the ESP32 reference decoder."""
+    crc = 0
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(seq, speed, direction, sync=False):
+    flags = DIRECTION_BITS[direction] | (FLAG_SYNC if sync else 0)
+    body = bytes((FRAME_VERSION, seq & 0xFF, max(0, min(int(speed), 255)), flags))
+    return bytes((FRAME_START,)) + body + bytes((crc8(body),))
+
+
+def encode_ack(seq, status=ACK_APPLIED):
+    body = bytes((FRAME_VERSION, seq & 0xFF, status))
+    return bytes((ACK_START,)) + body + bytes((crc8(body),))
+
+
+def _scan(buffer, start_byte, size):
+    """
+    Pop the first valid frame starting with start_byte from buffer (a bytearray).
+    Bytes before it, and frames with a bad CRC or version, are discarded.
+    Returns:
+        bytes: The frame body without start byte and CRC, or None if no complete frame is buffered.
+    """
+    while True:
+        index = buffer.find(start_byte)
+        if index < 0:
+            buffer.clear()
+            return None
+        del buffer[:index]
+        if len(buffer) < size:
+            return None
+        frame = bytes(buffer[:size])
+        if frame[1] == FRAME_VERSION and crc8(frame[1:-1]) == frame[-1]:
+            del buffer[:size]
+            return frame[1:-1]
+        del buffer[:1]  # Corrupt: resync on the next start byte
+
+
+class AsciiProtocol:
+    """The original "{speed},{direction}\\n" line, written without waiting for a reply."""
+
+    name = 'ascii'
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, link, speed, direction):
+        link.write_line(f"{speed},{direction}")
+        self.sent += 1
+
+    def stats(self):
+        return {'protocol': self.name, 'sent': self.sent}
+
+
+class BinaryProtocol:
+    """
+    Binary frames with sequence numbers and CRC. Each frame is retransmitted until its
+    acknowledgement arrives, up to `max_retransmits` times with `ack_timeout` seconds per attempt.
+    Sequence numbers start at a random value, and frames carry FLAG_SYNC until the first ack, so
+    the board's last seq from an earlier host session can never swallow this session's first command.
+    """
+
+    name = 'binary'
+
+    def __init__(self, ack_timeout=0.05, max_retransmits=3):
+        self.ack_timeout = ack_timeout
+        self.max_retransmits = max_retransmits
+        self.seq = random.randrange(256)
+        self.synced = False
+        self._buffer = bytearray()
+        self.counts = {'sent': 0, 'acked': 0, 'retransmits': 0, 'failed': 0, 'stale_acks': 0}
+        self.last_rtt_s = 0.0
+
+    def _wait_for_ack(self, link, seq, deadline):
+        while True:
+            body = _scan(self._buffer, ACK_START, ACK_SIZE)
+            if body is not None:
+                if body[1] == seq:
+                    return body[2]
+                self.counts['stale_acks'] += 1  # Late ack for an earlier attempt
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self._buffer += link.read(ACK_SIZE, timeout=remaining)
+
+    def send(self, link, speed, direction):
+        """
+        Send one command and wait until the board acknowledges it.
+        Raises:
+            serial.SerialException: If no acknowledgement arrives after max_retransmits retransmissions.
+        """
+        self.seq = (self.seq + 1) & 0xFF
+        frame = encode_frame(self.seq, speed, direction, sync=not self.synced)
+        start = time.perf_counter()
+        for attempt in range(self.max_retransmits + 1):
+            if attempt:
+                self.counts['retransmits'] += 1
+                logging.warning(f"No ack for frame {self.seq} on {link.port}, retransmitting ({attempt}/{self.max_retransmits})")
+            link.write(frame)
+            self.counts['sent'] += 1
+            if self._wait_for_ack(link, self.seq, time.perf_counter() + self.ack_timeout) is not None:
+                self.counts['acked'] += 1
+                self.synced = True
+                self.last_rtt_s = time.perf_counter() - start
+                return self.last_rtt_s
+        self.counts['failed'] += 1
+        raise serial.SerialException(f"No ack for frame {self.seq} on {link.port} after {self.max_retransmits} retransmits")
+
+    def stats(self):
+        return {'protocol': self.name, **self.counts, 'last_rtt_ms': 1000 * self.last_rtt_s}
+
+
+def make_protocol(name, **kwargs):
+    if name == 'ascii':
+        return AsciiProtocol()
+    if name == 'binary':
+        return BinaryProtocol(**kwargs)
+    raise ValueError(f"Unknown serial protocol '{name}', expected one of {PROTOCOLS}")
+
+
+class EmulatedESP32:
+    """
+    ESP32 stand-in on a pty. It decodes ASCII lines and binary frames like the README sketch:
+    lines are echoed back as "Received command: ...", frames are acknowledged. A frame with a
+    bad CRC or version drops only its start byte; the bytes after it are decoded again, and a
+    start byte drops a partial line before it, so noisy input is applied as the sketch would.
+    `loss_rate` drops incoming frames at random (no ack), to exercise retransmission.
+    """
+
+    def __init__(self, loss_rate=0.0, seed=0):
+        self._master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self.loss_rate = loss_rate
+        self._random = random.Random(seed)
+        self.speed, self.direction = 0, 'clc'
+        self.applied = 0
+        self.dropped = 0
+        self._last_seq = None
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="esp32-emulator", daemon=True)
+        self._thread.start()
+
+    def _apply_frame(self, body):
+        _, seq, speed, flags = body
+        if self.loss_rate and self._random.random() < self.loss_rate:
+            self.dropped += 1
+            return
+        status = ACK_DUPLICATE if seq == self._last_seq and not flags & FLAG_SYNC else ACK_APPLIED
+        if status == ACK_APPLIED:
+            self.speed, self.direction = speed, 'anticlc' if flags & 1 else 'clc'
+            self._last_seq = seq
+            self.applied += 1
+        os.write(self._master, encode_ack(seq, status))
+
+    def _run(self):
+        buffer = bytearray()
+        while self._running:
+            try:
+                buffer += os.read(self._master, 256)
+            except OSError:
+                return
+            while buffer:
+                if buffer[0] == FRAME_START:
+                    if len(buffer) < FRAME_SIZE:
+                        break  # Wait for the rest of the frame
+                    frame = bytes(buffer[:FRAME_SIZE])
+                    if frame[1] == FRAME_VERSION and crc8(frame[1:-1]) == frame[-1]:
+                        del buffer[:FRAME_SIZE]
+                        self._apply_frame(frame[1:-1])
+                    else:
+                        del buffer[:1]  # Corrupt: resync from the byte after the start byte
+                    continue
+                end = buffer.find(b'\n')
+                start = buffer.find(FRAME_START)
+                if end < 0 or 0 <= start < end:
+                    if start < 0:
+                        break  # Partial line
+                    del buffer[:start]  # Garbage before a frame
+                    continue
+                line = bytes(buffer[:end]).decode(errors='replace').strip()
+                del buffer[:end + 1]
+                speed, _, direction = line.partition(',')
+                if speed.isdigit():
+                    self.speed, self.direction = int(speed), direction
+                    self.applied += 1
+                    os.write(self._master, f"Received command: {line}\n".encode())
+
+    def close(self):
+        self._running = False
+        os.close(self._slave)
+        os.close(self._master)
+
+
+def benchmark(commands=2000, loss_rate=0.0):
+    """
+    Commands/sec and round-trip latency over a pty emulator for both formats. ASCII round trips
+    are timed to the echoed line; in normal use ASCII does not wait for anything.
+    """
+    from serial_link import SerialLink
+
+    results = {}
+    for name in PROTOCOLS:
+        esp32 = EmulatedESP32(loss_rate=loss_rate if name == 'binary' else 0.0)
+        link = SerialLink(esp32.port)
+        protocol = make_protocol(name)
+        rtts = []
+        start = time.perf_counter()
+        for i in range(commands):
+            speed, direction = i % 256, ('clc', 'anticlc')[i % 2]
+            sent = time.perf_counter()
+            protocol.send(link, speed, direction)
+            if name == 'ascii':
+                link.read_line()
+            rtts.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+        link.close()
+        esp32.close()
+        rtts.sort()
+        results[name] = {
+            'commands_per_s': commands / elapsed,
+            'rtt_p50_ms': 1000 * rtts[len(rtts) // 2],
+            'rtt_p99_ms': 1000 * rtts[min(len(rtts) - 1, int(0.99 * len(rtts)))],
+            'bytes_per_command': FRAME_SIZE if name == 'binary' else len(f"{speed},{direction}\n"),
+            'applied': esp32.applied,
+            'dropped_by_emulator': esp32.dropped,
+            **protocol.stats(),
+        }
+    results['binary']['restart_ok'] = restart_check()
+    return results
+
+
+def restart_check():
+    """
+    Host restart: a new BinaryProtocol whose first seq equals the last seq the board applied must
+    still get its command applied. Returns True if the board ends at the new session's command.
+    """
+    from serial_link import SerialLink
+
+    esp32 = EmulatedESP32()
+    link = SerialLink(esp32.port)
+    try:
+        first = make_protocol('binary')
+        first.send(link, 200, 'clc')
+        second = make_protocol('binary')
+        second.seq = (first.seq - 1) & 0xFF  # Its next frame reuses the board's last seq
+        second.send(link, 0, 'clc')
+        return (esp32.speed, esp32.direction) == (0, 'clc')
+    finally:
+        link.close()
+        esp32.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark ASCII and binary serial framing against a pty ESP32 emulator.")
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--loss", type=float, default=0.0, help="Fraction of binary frames the emulator drops")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)  # Retransmit warnings are counted below
+    for name, result in benchmark(args.commands, args.loss).items():
+        print(f"{name:<7} {result['commands_per_s']:8.0f} commands/s  rtt p50 {result['rtt_p50_ms']:.3f} ms  "
+              f"p99 {result['rtt_p99_ms']:.3f} ms  {result['bytes_per_command']} B/command  "
+              f"applied {result['applied']}")
+        if name == 'binary':
+            print(f"        retransmits {result['retransmits']}, failed {result['failed']}, "
+                  f"dropped by emulator {result['dropped_by_emulator']}, stale acks {result['stale_acks']}")
+            print(f"        host restart reusing the board's last seq applied: {result['restart_ok']}")
@@ -1,13 +1,63 @@
 import argparse
+import json
+import logging
+import math
 import os
 import random
-from typing import List
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import BinaryIO, List, Optional
 
+DEFAULT_MAX_MEMORY = 64 * 2 ** 20
+MAX_BUCKETS = 1024
+FD_HEADROOM = 32  # Descriptors left for the input, outputs and whatever else the process has open
 
-def shuffle_file_lines_preserve_bytes(input_file: str, output_file: str) -> int:
+
+def _rng(seed: Optional[int]):
+    return random.Random(seed) if seed is not None else random
+
+
+def _newline(header: bytes) -> bytes:
+    return b'\r\n' if header.endswith(b'\r\n') else b'\n'
+
+
+def _terminated(row: bytes, newline: bytes) -> bytes:
+    """A last row without a line ending gets one, so it cannot run into the next row once moved."""
+    return row if row.endswith(b'\n') else row + newline
+
+
+def _bucket_limit() -> int:
+    """MAX_BUCKETS, lowered so that all bucket files fit under the open-file limit (RLIMIT_NOFILE)."""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_BUCKETS
+    return max(1, min(MAX_BUCKETS, soft - FD_HEADROOM))
+
+
+def _split_count(rows: int, test_fraction: float) -> int:
+    return int(round(rows * test_fraction))
+
+
+def _write_split(rows: List[bytes], n_test: int, train: BinaryIO, test: Optional[BinaryIO]) -> int:
+    """Write rows to test until it holds n_test rows, the rest to train. Returns how many went to test."""
+    taken = min(n_test, len(rows)) if test else 0
+    if taken:
+        test.writelines(rows[:taken])
+    train.writelines(rows[taken:])
+    return taken
+
+
+def shuffle_file_lines_preserve_bytes(input_file: str, output_file: str, seed: Optional[int] = None,
+                                      test_output: Optional[str] = None, test_fraction: float = 0.0) -> int:
     """
     Shuffle CSV rows while preserving the file content exactly (quotes, spaces, line endings).
     Assumes the first line is a header and keeps it at the top.
+    With test_output, the first round(rows * test_fraction) shuffled rows go there (after a copy
+    of the header) instead of to output_file.
 
     Returns:
         Number of shuffled data rows.
@@ -23,22 +73,160 @@ def shuffle_file_lines_preserve_bytes(input_file: str, output_file: str) -> int:
 
     header = lines[:1]
     rows = lines[1:]
+    if rows:
+        rows[-1] = _terminated(rows[-1], _newline(header[0]))
 
-    random.shuffle(rows)
+    _rng(seed).shuffle(rows)
 
-    with open(output_file, 'wb') as out:
-        out.writelines(header + rows)
+    test = open(test_output, 'wb') if test_output else None
+    try:
+        with open(output_file, 'wb') as out:
+            out.writelines(header)
+            if test:
+                test.writelines(header)
+            _write_split(rows, _split_count(len(rows), test_fraction), out, test)
+    finally:
+        if test:
+            test.close()
 
     return len(rows)
 
 
+def shuffle_file_lines_external(input_file: str, output_file: str, seed: Optional[int] = None,
+                                test_output: Optional[str] = None, test_fraction: float = 0.0,
+                                max_memory: int = DEFAULT_MAX_MEMORY, tmp_dir: Optional[str] = None) -> int:
+    """
+    Bounded-memory version of shuffle_file_lines_preserve_bytes with the same byte-exact,
+    header-preserving output and the same optional train/test split.
+
+    Pass 1 streams the rows, sending each to one of K temp files picked uniformly at random,
+    with K chosen so that one temp file is expected to take a quarter of max_memory on disk (a
+    list of Python bytes objects takes roughly twice the raw size, plus the shuffle). K is capped
+    by MAX_BUCKETS and the open-file limit; a warning is logged when the cap makes temp files
+    bigger than that, since pass 2 then holds more than max_memory. Pass 2
+    shuffles each temp file in memory and appends it to the output. Both passes together give
+    a uniform random permutation. The same seed and max_memory give the same output.
+
+    Returns:
+        Number of shuffled data rows.
+    """
+    data_bytes = os.path.getsize(input_file)
+    wanted = max(1, math.ceil(4 * data_bytes / max_memory))
+    buckets = min(wanted, _bucket_limit())
+    if buckets < wanted:
+        logging.warning(f"Shuffle needs {wanted} temp files to stay within {max_memory / 2 ** 20:.1f} MB but can "
+                        f"open {buckets}; each holds about {data_bytes / buckets / 2 ** 20:.1f} MB, so memory "
+                        f"use will exceed the budget (raise 'ulimit -n' or --max-memory-mb)")
+    rng = _rng(seed)
+    workdir = tempfile.mkdtemp(prefix='shuffle_csv_', dir=tmp_dir)
+    try:
+        paths = [os.path.join(workdir, f"bucket_{i:04d}") for i in range(buckets)]
+        with open(input_file, 'rb') as f:
+            header = f.readline()
+            if not header:
+                with open(output_file, 'wb') as out:
+                    pass
+                return 0
+            newline = _newline(header)
+            files = [open(path, 'wb') for path in paths]
+            try:
+                count = 0
+                for row in f:
+                    files[rng.randrange(buckets)].write(_terminated(row, newline))
+                    count += 1
+            finally:
+                for bucket in files:
+                    bucket.close()
+
+        remaining_test = _split_count(count, test_fraction) if test_output else 0
+        test = open(test_output, 'wb') if test_output else None
+        try:
+            with open(output_file, 'wb') as out:
+                out.write(header)
+                if test:
+                    test.write(header)
+                for path in paths:
+                    with open(path, 'rb') as bucket:
+                        rows = bucket.readlines()
+                    os.remove(path)
+                    rng.shuffle(rows)
+                    remaining_test -= _write_split(rows, remaining_test, out, test)
+        finally:
+            if test:
+                test.close()
+        return count
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _make_benchmark_csv(path: str, rows: int, source: str = 'commands.csv') -> None:
+    """Synthetic corpus: rows of source repeated (each tagged with its index) up to `rows` data rows."""
+    with open(source, 'rb') as f:
+        header, *samples = f.readlines()
+    samples = [sample.rstrip(b'\r\n') for sample in samples]
+    with open(path, 'wb') as out:
+        out.write(header)
+        for i in range(rows):
+            out.write(samples[i % len(samples)] + b',%d\n' % i)
+
+
+def _measure(mode: str, input_file: str, output_file: str, max_memory: int) -> dict:
+    start = time.perf_counter()
+    if mode == 'memory':
+        count = shuffle_file_lines_preserve_bytes(input_file, output_file, seed=0,
+                                                  test_output=output_file + '.test', test_fraction=0.2)
+    else:
+        count = shuffle_file_lines_external(input_file, output_file, seed=0, test_output=output_file + '.test',
+                                            test_fraction=0.2, max_memory=max_memory)
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'rows': count,
+        'seconds': elapsed,
+        'rows_per_s': count / elapsed if elapsed else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def benchmark(rows: int, max_memory: int = DEFAULT_MAX_MEMORY) -> List[dict]:
+    """Rows/sec and peak RSS of both paths on a synthetic corpus, each run in its own process."""
+    workdir = tempfile.mkdtemp(prefix='shuffle_bench_')
+    try:
+        input_file = os.path.join(workdir, 'input.csv')
+        _make_benchmark_csv(input_file, rows)
+        size_mb = os.path.getsize(input_file) / 2 ** 20
+        print(f"{rows} rows, {size_mb:.1f} MB, external max memory {max_memory / 2 ** 20:.0f} MB")
+        results = []
+        outputs = {}
+        for mode in ('memory', 'external'):
+            outputs[mode] = os.path.join(workdir, f"{mode}.csv")
+            out = subprocess.run(
+                [sys.executable, __file__, input_file, '-o', outputs[mode], '--measure', mode,
+                 '--max-memory-mb', str(max_memory / 2 ** 20)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        print(f"{'mode':<9} {'rows/s':>12} {'seconds':>8} {'peak RSS MB':>12}")
+        for r in results:
+            print(f"{r['mode']:<9} {r['rows_per_s']:>12.0f} {r['seconds']:>8.2f} {r['peak_rss_mb']:>12.1f}")
+        with open(input_file, 'rb') as f:
+            expected = sorted(f.readlines()[1:])
+        for mode, path in outputs.items():
+            with open(path, 'rb') as train, open(path + '.test', 'rb') as test:
+                rows_out = train.readlines()[1:] + test.readlines()[1:]
+            print(f"{mode}: same rows as input, byte for byte: {sorted(rows_out) == expected}")
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Shuffle CSV rows without changing content/quoting."
     )
-    parser.add_argument("input_file", help="Path to input CSV file")
+    parser.add_argument("input_file", nargs='?', help="Path to input CSV file")
     parser.add_argument(
-        "-o", "--output", required=True, help="Path to output CSV file"
+        "-o", "--output", help="Path to output CSV file (the train split when --test-output is given)"
     )
     parser.add_argument(
         "--seed",
@@ -46,18 +234,43 @@ def main():
         default=None,
         help="Optional random seed for reproducibility",
     )
+    parser.add_argument("--test-output", help="Also write a test split here, with its own header")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Share of rows for --test-output")
+    parser.add_argument(
+        "--max-memory-mb",
+        type=float,
+        help="Shuffle out of core through temp files, holding about this much in memory at a time",
+    )
+    parser.add_argument("--tmp-dir", help="Directory for the temp files of the out-of-core shuffle")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="Compare in-memory and out-of-core shuffles on a synthetic corpus of ROWS rows")
+    parser.add_argument("--measure", choices=['memory', 'external'], help=argparse.SUPPRESS)
 
     args = parser.parse_args()
+    max_memory = int(args.max_memory_mb * 2 ** 20) if args.max_memory_mb else None
+
+    if args.benchmark:
+        benchmark(args.benchmark, max_memory or DEFAULT_MAX_MEMORY)
+        return
+    if not args.input_file or not args.output:
+        parser.error("input_file and --output are required")
+    if args.measure:
+        print(json.dumps(_measure(args.measure, args.input_file, args.output, max_memory or DEFAULT_MAX_MEMORY)))
+        return
 
     if not os.path.isfile(args.input_file):
         raise FileNotFoundError(f"Input file not found: {args.input_file}")
 
-    if args.seed is not None:
-        random.seed(args.seed)
-
-    count = shuffle_file_lines_preserve_bytes(args.input_file, args.output)
-    print(f"Shuffled {count} rows from '{args.input_file}' to '{args.output}'")
+    test_fraction = args.test_fraction if args.test_output else 0.0
+    if max_memory:
+        count = shuffle_file_lines_external(args.input_file, args.output, args.seed, args.test_output,
+                                            test_fraction, max_memory, args.tmp_dir)
+    else:
+        count = shuffle_file_lines_preserve_bytes(args.input_file, args.output, args.seed, args.test_output,
+                                                  test_fraction)
+    print(f"Shuffled {count} rows from '{args.input_file}' to '{args.output}'"
+          + (f" and '{args.test_output}'" if args.test_output else ""))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
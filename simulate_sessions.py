@@ -0,0 +1,242 @@
+import argparse
+import json
+import logging
+import random
+import time
+
+import numpy as np
+
+from motor_controller import MAX_PWM, map_to_command
+
+# Integer encodings; code 0 is always "nothing" (padding, no intent, no unit, no direction)
+INTENTS = [None, 'increase', 'decrease', 'set_speed', 'stop', 'change_direction']
+UNITS = [None, '%', 'half', 'quarter', 'double', 'max', 'min', 'default']
+UNIT_ALIASES = {'maximum': 'max', 'minimum': 'min'}
+DIRECTIONS = [None, 'clc', 'anticlc', 'reverse']
+STATE_DIRECTIONS = ['clc', 'anticlc']
+
+INTENT_CODES = {name: code for code, name in enumerate(INTENTS)}
+UNIT_CODES = {name: code for code, name in enumerate(UNITS)}
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+
+# Non-percent units as map_to_command applies them:
+#   unit: ((num, den), const, to_max, set_speed)
+# increase/decrease delta = current_speed * num // den + const (+ MAX_PWM - current_speed if to_max),
+# set_speed sets the speed to `set_speed`. Pass overrides to simulate() to try other semantics.
+UNIT_SEMANTICS = {
+    'half': ((1, 2), 0, False, MAX_PWM // 2),
+    'quarter': ((1, 4), 0, False, MAX_PWM // 4),
+    'double': ((1, 1), 0, False, MAX_PWM),
+    'max': ((0, 1), 0, True, MAX_PWM),
+    'min': ((1, 1), 0, False, 0),
+    'default': ((0, 1), int(MAX_PWM * (10 / 100)), False, int(MAX_PWM * 0.1)),
+}
+
+
+def _unit_tables(semantics):
+    """Per-unit-code lookup arrays for delta numerator/denominator/constant/to-max and set value."""
+    size = len(UNITS)
+    num, den = np.zeros(size, dtype=np.int64), np.ones(size, dtype=np.int64)
+    const, to_max = np.zeros(size, dtype=np.int64), np.zeros(size, dtype=np.int64)
+    set_value, has_set = np.zeros(size, dtype=np.int64), np.zeros(size, dtype=bool)
+    for unit, ((n, d), c, m, s) in semantics.items():
+        code = UNIT_CODES[unit]
+        num[code], den[code], const[code], to_max[code] = n, d, c, int(m)
+        set_value[code], has_set[code] = s, True
+    return num, den, const, to_max, set_value, has_set
+
+
+def encode_sessions(sessions):
+    """
+    Encode sessions as padded integer arrays.
+    Args:
+        sessions (list): Each session is a list of (intent, entities) steps, as passed to map_to_command.
+    Returns:
+        dict: 'intent', 'unit', 'direction' (int8), 'value' (float64, NaN for missing) of shape
+            (n_sessions, max_steps), and 'length' (steps per session). Padding steps use code 0.
+    """
+    n = len(sessions)
+    steps = max((len(session) for session in sessions), default=0)
+    intent = np.zeros((n, steps), dtype=np.int8)
+    unit = np.zeros((n, steps), dtype=np.int8)
+    direction = np.zeros((n, steps), dtype=np.int8)
+    value = np.full((n, steps), np.nan)
+    for i, session in enumerate(sessions):
+        for t, (step_intent, entities) in enumerate(session):
+            intent[i, t] = INTENT_CODES.get(step_intent, 0)
+            step_unit = entities.get('unit')
+            unit[i, t] = UNIT_CODES.get(UNIT_ALIASES.get(step_unit, step_unit), 0)
+            direction[i, t] = DIRECTION_CODES.get(entities.get('direction'), 0)
+            step_value = entities.get('value')
+            if isinstance(step_value, (int, float)):
+                value[i, t] = step_value
+    return {'intent': intent, 'unit': unit, 'direction': direction, 'value': value,
+            'length': np.array([len(session) for session in sessions], dtype=np.int64)}
+
+
+def simulate(encoded, initial_speed=0, initial_direction='clc', semantics=None):
+    """
+    Run every session through the map_to_command rules at once, one step at a time across all sessions.
+    Args:
+        encoded (dict): Output of encode_sessions().
+        semantics (dict): Overrides for UNIT_SEMANTICS entries.
+    Returns:
+        tuple: (speeds, directions), each (n_sessions, max_steps): the state after every step.
+            Directions are indices into STATE_DIRECTIONS. Padding steps repeat the last state.
+    """
+    num, den, const, to_max, set_value, has_set = _unit_tables({**UNIT_SEMANTICS, **(semantics or {})})
+    intents, units, directions, values = encoded['intent'], encoded['unit'], encoded['direction'], encoded['value']
+    n, steps = intents.shape
+
+    # Percent amounts do not depend on the state, so they are computed for every step up front
+    has_value = ~np.isnan(values)
+    percent = has_value & (units == UNIT_CODES['%'])
+    percent_pwm = np.trunc(MAX_PWM * (np.where(has_value, values, 0) / 100)).astype(np.int64)
+
+    speed = np.full(n, initial_speed, dtype=np.int64)
+    direction = np.full(n, STATE_DIRECTIONS.index(initial_direction), dtype=np.int8)
+    speeds = np.empty((n, steps), dtype=np.int64)
+    direction_out = np.empty((n, steps), dtype=np.int8)
+
+    for t in range(steps):
+        intent, unit = intents[:, t], units[:, t]
+
+        delta = np.where(percent[:, t], percent_pwm[:, t],
+                         speed * num[unit] // den[unit] + const[unit] + to_max[unit] * (MAX_PWM - speed))
+        speed = np.select(
+            [intent == INTENT_CODES['increase'],
+             intent == INTENT_CODES['decrease'],
+             (intent == INTENT_CODES['set_speed']) & percent[:, t],
+             (intent == INTENT_CODES['set_speed']) & has_set[unit],
+             intent == INTENT_CODES['stop']],
+            [np.minimum(speed + delta, MAX_PWM),
+             np.maximum(speed - delta, 0),
+             np.minimum(percent_pwm[:, t], MAX_PWM),
+             set_value[unit],
+             0],
+            speed)
+
+        target = directions[:, t]
+        explicit = (target == DIRECTION_CODES['clc']) | (target == DIRECTION_CODES['anticlc'])
+        direction = np.where(intent == INTENT_CODES['change_direction'],
+                             np.where(explicit, target - 1, 1 - direction), direction).astype(np.int8)
+
+        speeds[:, t] = speed
+        direction_out[:, t] = direction
+    return speeds, direction_out
+
+
+def scalar_trajectories(sessions, initial_speed=0, initial_direction='clc'):
+    """Reference trajectories from the scalar map_to_command, one step at a time."""
+    trajectories = []
+    for session in sessions:
+        speed, direction = initial_speed, initial_direction
+        trajectory = []
+        for intent, entities in session:
+            speed, direction = map_to_command(intent, entities, speed, direction)
+            trajectory.append((speed, direction))
+        trajectories.append(trajectory)
+    return trajectories
+
+
+def verify(sessions, initial_speed=0, initial_direction='clc'):
+    """
+    Compare simulate() with map_to_command step for step.
+    Returns:
+        list: (session, step, expected, got) for every mismatch; empty when they agree.
+    """
+    logging.disable(logging.WARNING)
+    try:
+        expected = scalar_trajectories(sessions, initial_speed, initial_direction)
+    finally:
+        logging.disable(logging.NOTSET)
+    speeds, directions = simulate(encode_sessions(sessions), initial_speed, initial_direction)
+    mismatches = []
+    for i, trajectory in enumerate(expected):
+        for t, state in enumerate(trajectory):
+            got = (int(speeds[i, t]), STATE_DIRECTIONS[directions[i, t]])
+            if got != state:
+                mismatches.append((i, t, state, got))
+    return mismatches
+
+
+def load_sessions(path='motor_commands.jsonl', session_gap=300.0):
+    """
+    Split the per-command records written by process_command into sessions, one motor at a time.
+    A new session starts when more than `session_gap` seconds pass between commands to a motor,
+    or when a record's speed_before / direction_before does not follow on from that motor's
+    previous record (the controller was restarted).
+    """
+    sessions = []
+    open_sessions = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'intent' not in record:
+                continue
+            motor = record.get('motor')
+            previous, session = open_sessions.get(motor, (None, None))
+            follows = (previous is not None
+                       and record['ts'] - previous['ts'] <= session_gap
+                       and (record.get('speed_before'), record.get('direction_before')) ==
+                           (previous.get('speed'), previous.get('direction')))
+            if not follows:
+                session = []
+                sessions.append(session)
+            session.append((record['intent'], record.get('entities') or {}))
+            open_sessions[motor] = (record, session)
+    return sessions
+
+
+def random_sessions(count, steps, seed=0):
+    """Synthetic sessions covering every intent, unit and direction, including missing and invalid entities."""
+    rng = random.Random(seed)
+    intents = INTENTS + ['unknown_intent']
+    units = UNITS + ['maximum', 'minimum', 'bogus']
+    directions = DIRECTIONS + ['sideways']
+    values = [None, 0, 5, 10, 12.5, 33, 50, 99.9, 100, 150, -20, 'ten']
+    sessions = []
+    for _ in range(count):
+        session = []
+        for _ in range(rng.randint(1, steps)):
+            session.append((rng.choice(intents), {'value': rng.choice(values),
+                                                  'unit': rng.choice(units),
+                                                  'direction': rng.choice(directions)}))
+        sessions.append(session)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay command sessions through a vectorized map_to_command and check it against the scalar version."
+    )
+    parser.add_argument("--log", help="motor_commands.jsonl to replay (default: synthetic sessions)")
+    parser.add_argument("--sessions", type=int, default=5000, help="Synthetic sessions to generate")
+    parser.add_argument("--steps", type=int, default=50, help="Maximum steps per synthetic session")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.log) if args.log else random_sessions(args.sessions, args.steps, args.seed)
+    total = sum(len(session) for session in sessions)
+    print(f"{len(sessions)} sessions, {total} steps")
+
+    mismatches = verify(sessions)
+    for i, t, expected, got in mismatches[:10]:
+        print(f"Mismatch in session {i} step {t} {sessions[i][t]}: map_to_command {expected}, simulator {got}")
+    print(f"Verification: {'OK' if not mismatches else f'{len(mismatches)} mismatching steps'}")
+
+    logging.disable(logging.WARNING)
+    start = time.perf_counter()
+    scalar_trajectories(sessions)
+    scalar_s = time.perf_counter() - start
+    logging.disable(logging.NOTSET)
+    start = time.perf_counter()
+    simulate(encode_sessions(sessions))
+    vector_s = time.perf_counter() - start
+    print(f"map_to_command: {1000 * scalar_s:.1f} ms, simulator (incl. encoding): {1000 * vector_s:.1f} ms "
+          f"({scalar_s / vector_s:.1f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
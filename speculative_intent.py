@@ -0,0 +1,284 @@
+import logging
+import os
+import time
+
+from rule_entities import DIRECTION_TABLE
+
+# A partial hypothesis ending in one of these is waiting for its object ("increase by ...",
+# "set to ...", "20 per ..."), so it is not interpreted and does not count toward stability
+HOLD_WORDS = frozenset("a and at by for of on per the to".split())
+
+
+class SpeculativeCommitter:
+    """
+    Commits a command before its transcript is final.
+
+    Partial hypotheses from a streaming transcriber are fed to update() as they grow. Each
+    one is interpreted with `interpret_fn(text)`, which returns (key, payload) or None; the
+    key is what must stay the same (routing, intent, entities), the payload what gets
+    committed. `complete_fn(text, key)` can veto partials that are still missing their
+    argument. Once `stable_updates` consecutive partials give the same key, the payload is
+    handed to `commit_fn(payload)` at once. finish() takes the final transcript: it commits
+    it if nothing was committed early, and if the early key turns out different it corrects
+    with `commit_fn(final_payload, early_result)`. The correction only covers what the final
+    command addresses; `restore_fn(early_result, final_result)` undoes the rest of the early
+    commit (final_result is None when the final transcript could not be interpreted) and
+    returns what it restored.
+    """
+
+    def __init__(self, interpret_fn, commit_fn, stable_updates=2, hold_words=HOLD_WORDS, complete_fn=None,
+                 restore_fn=None):
+        if stable_updates < 1:
+            raise ValueError("stable_updates must be at least 1")
+        self.interpret_fn = interpret_fn
+        self.commit_fn = commit_fn
+        self.stable_updates = stable_updates
+        self.hold_words = hold_words
+        self.complete_fn = complete_fn
+        self.restore_fn = restore_fn
+        self.last_interpret_s = 0.0
+        self.reset()
+
+    def reset(self):
+        self.updates = 0
+        self._last_key = None
+        self._streak = 0
+        self.committed_key = None
+        self.commit_update = None
+        self.result = None
+
+    def _interpret(self, text):
+        start = time.perf_counter()
+        interpreted = self.interpret_fn(text)
+        self.last_interpret_s = time.perf_counter() - start
+        return interpreted
+
+    def update(self, text):
+        """Feed a partial hypothesis. Returns commit_fn's result if this update committed, else None."""
+        self.updates += 1
+        words = text.split()
+        if self.committed_key is not None or not words or words[-1].lower() in self.hold_words:
+            self.last_interpret_s = 0.0
+            return None
+        interpreted = self._interpret(text)
+        if interpreted is None or (self.complete_fn and not self.complete_fn(text, interpreted[0])):
+            self._last_key, self._streak = None, 0
+            return None
+        key, payload = interpreted
+        self._streak = self._streak + 1 if key == self._last_key else 1
+        self._last_key = key
+        if self._streak < self.stable_updates:
+            return None
+        self.committed_key, self.commit_update = key, self.updates
+        self.result = self.commit_fn(payload)
+        logging.debug("Speculative commit after %s updates on '%s': %s", self.updates, text, key)
+        return self.result
+
+    def finish(self, text):
+        """
+        Final transcript of the utterance; resets the committer for the next one.
+        Returns:
+            dict: early (committed before the final transcript), matched (early key == final key,
+                None without an early commit), corrected, restored (restore_fn's result, e.g. motors
+                only the early commit addressed), early_result, result (the final effect), updates
+                and commit_update (partials seen in all, and when the commit happened).
+        """
+        interpreted = self._interpret(text) if text and text.strip() else None
+        key = interpreted[0] if interpreted else None
+        early = self.committed_key is not None
+        outcome = {
+            'text': text,
+            'early': early,
+            'matched': key == self.committed_key if early else None,
+            'corrected': False,
+            'restored': [],
+            'early_result': self.result,
+            'result': self.result,
+            'updates': self.updates,
+            'commit_update': self.commit_update,
+        }
+        if early and not outcome['matched'] and interpreted:
+            logging.info(f"Speculative commit {self.committed_key} corrected to {key} for '{text}'")
+            outcome['result'] = self.commit_fn(interpreted[1], self.result)
+            outcome['corrected'] = True
+        if early and not outcome['matched'] and self.restore_fn:
+            outcome['restored'] = self.restore_fn(self.result, outcome['result'] if interpreted else None)
+        elif not early and interpreted:
+            outcome['result'] = self.commit_fn(interpreted[1])
+        self.reset()
+        return outcome
+
+
+def replay_partials(text, word_ms=300.0, endpoint_ms=600.0):
+    """
+    Replayed token stream standing in for a streaming transcriber: (arrival_s, hypothesis, is_final)
+    for each growing prefix of `text`, one word every `word_ms`, then the final transcript
+    `endpoint_ms` after the last word (the silence a recognizer waits for before finalizing).
+    """
+    words = text.split()
+    for i in range(1, len(words) + 1):
+        yield i * word_ms / 1000, ' '.join(words[:i]), False
+    yield len(words) * word_ms / 1000 + endpoint_ms / 1000, text, True
+
+
+def run_utterance(committer, events):
+    """
+    Feed one utterance's (arrival_s, hypothesis, is_final) events through the committer.
+
+    Time is kept on the events' clock: each update starts once it has arrived and the previous
+    one is done, and takes as long as it really took. A command is ready when its interpretation
+    finishes; without speculation that is the final transcript's arrival plus its interpretation.
+    Returns:
+        dict: finish()'s outcome plus saved_ms (ready time without speculation minus with it;
+            0 when nothing was committed early).
+    """
+    clock, ready = 0.0, None
+    for arrival, text, is_final in events:
+        clock = max(clock, arrival)
+        if is_final:
+            outcome = committer.finish(text)
+            baseline = arrival + committer.last_interpret_s
+            outcome['saved_ms'] = 1000 * (baseline - ready) if outcome['early'] else 0.0
+            return outcome
+        start = time.perf_counter()
+        if committer.update(text) is not None:
+            ready = clock + committer.last_interpret_s
+        clock += time.perf_counter() - start
+    raise ValueError("event stream ended without a final transcript")
+
+
+def summarize(outcomes):
+    early = [o for o in outcomes if o['early']]
+    saved = sorted(o['saved_ms'] for o in early)
+    mismatched = sum(not o['matched'] for o in early)
+    return {
+        'utterances': len(outcomes),
+        'early_commits': len(early),
+        'early_rate': len(early) / len(outcomes) if outcomes else 0.0,
+        'mismatches': mismatched,
+        'mismatch_rate': mismatched / len(early) if early else 0.0,
+        'corrected': sum(o['corrected'] for o in early),
+        'restored': sum(bool(o['restored']) for o in early),
+        'saved_ms_mean': sum(saved) / len(saved) if saved else 0.0,
+        'saved_ms_p50': saved[len(saved) // 2] if saved else 0.0,
+        'saved_ms_total_mean': sum(o['saved_ms'] for o in outcomes) / len(outcomes) if outcomes else 0.0,
+    }
+
+
+def is_complete(text, intent, entities):
+    """
+    Whether a partial command already carries its argument: "set the speed" or "decrease the speed"
+    are usually still growing ("... to 80 percent"), and "change direction" gets 'reverse' from the
+    intent fallback before its direction word arrives. Only 'stop' needs nothing.
+    """
+    if intent == 'stop':
+        return True
+    if intent == 'change_direction':
+        return any(word in DIRECTION_TABLE for word in text.lower().split())
+    return entities.get('value') is not None or entities.get('unit') is not None
+
+
+def pipeline_committer(control_motor, stable_updates=2, dispatch=True, wait=True):
+    """
+    SpeculativeCommitter over control_motor's pipeline: partials are routed and interpreted without
+    the command cache, and only complete ones (is_complete) count toward stability. Commits go to the
+    motors with dispatch_command. A correction maps the final command from the states the early
+    commit started from, so relative commands are not applied twice, and motors only the early
+    commit addressed are put back to those states. With dispatch=False nothing is sent, commits
+    return the interpreted command and `restored` lists the motors that would have been restored.
+    """
+    def interpret(text):
+        interpreted = control_motor.interpret_command(text, use_cache=False)
+        if interpreted is None:
+            return None
+        controllers, _, intent, entities, _ = interpreted
+        return (tuple(c.name for c in controllers), intent, entities), interpreted
+
+    def commit(interpreted, previous=None):
+        if not dispatch:
+            return interpreted
+        base = None
+        if previous:
+            base = {name: (m['speed_before'], m['direction_before']) for name, m in previous['motors'].items()}
+        return control_motor.dispatch_command(*interpreted, wait=wait, base=base)
+
+    def restore(early, final):
+        if not dispatch:
+            addressed = {c.name for c in final[0]} if final else set()
+            return [c.name for c in early[0] if c.name not in addressed]
+        addressed = set(final['motors']) if final else set()
+        restored, futures = [], []
+        for name, m in early['motors'].items():
+            controller = control_motor.motors.get(name)
+            if name in addressed or controller is None:
+                continue
+            logging.info(f"Speculative commit undone on motor {name}: back to {m['speed_before']},{m['direction_before']}")
+            futures.append(controller.restore(m['speed_before'], m['direction_before']))
+            restored.append(name)
+        if wait:
+            for future in futures:
+                future.result()
+        return restored
+
+    return SpeculativeCommitter(interpret, commit, stable_updates,
+                                complete_fn=lambda text, key: is_complete(text, key[1], key[2]), restore_fn=restore)
+
+
+def report(sentences, stable_updates=(1, 2, 3), word_ms=300.0, endpoint_ms=600.0, base_state=(128, 'clc')):
+    """
+    Replay sentences word by word through the pipeline (nothing sent) for each stability setting.
+    Besides differing predictions, counts early commits whose motor action differs, i.e. whose
+    map_to_command result from `base_state` is not that of the final transcript, or that addressed
+    a motor the final transcript does not (those are restored).
+    """
+    import control_motor
+
+    errors = control_motor.warm_up(calibrate_microphone=False)
+    if errors:
+        print(f"Models not loaded: {errors}")
+    print(f"{len(sentences)} utterances, {word_ms:.0f} ms/word, final transcript {endpoint_ms:.0f} ms after the last word")
+    print(f"{'stable':>6} {'early':>7} {'saved mean':>11} {'saved p50':>10} {'per utt':>8} "
+          f"{'differs':>8} {'action differs':>15} {'restored':>9}")
+    results = {}
+    for n in stable_updates:
+        committer = pipeline_committer(control_motor, n, dispatch=False)
+        outcomes = [run_utterance(committer, replay_partials(s, word_ms, endpoint_ms)) for s in sentences]
+        summary = summarize(outcomes)
+        action_differs = 0
+        for o in outcomes:
+            if o['early'] and not o['matched']:
+                early, final = o['early_result'], o['result']
+                action_differs += bool(o['restored']) or (control_motor.map_to_command(early[2], early[3], *base_state)
+                                                          != control_motor.map_to_command(final[2], final[3], *base_state))
+        summary['action_differs'] = action_differs
+        summary['action_differs_rate'] = action_differs / summary['early_commits'] if summary['early_commits'] else 0.0
+        results[n] = summary
+        print(f"{n:>6} {summary['early_rate']:>7.1%} {summary['saved_ms_mean']:>8.0f} ms {summary['saved_ms_p50']:>7.0f} ms "
+              f"{summary['saved_ms_total_mean']:>5.0f} ms {summary['mismatch_rate']:>8.1%} {summary['action_differs_rate']:>15.1%} {summary['restored']:>9}")
+    return results
+
+
+def main():
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(description="Time saved and errors made by committing intents on partial transcripts.")
+    parser.add_argument("--data", default='commands.csv', help="CSV with a 'sentence' column to replay")
+    parser.add_argument("--stable", type=int, nargs='+', default=[1, 2, 3],
+                        help="Consecutive identical partial predictions needed to commit")
+    parser.add_argument("--word-ms", type=float, default=300.0, help="Time between replayed words")
+    parser.add_argument("--endpoint-ms", type=float, default=600.0,
+                        help="Delay from the last word to the final transcript")
+    parser.add_argument("--limit", type=int, help="Only the first N sentences")
+    args = parser.parse_args()
+
+    # The phrase index answers whole corpus sentences only, which would make final transcripts
+    # look different from the model's answers on their partials
+    os.environ.setdefault('PHRASE_INDEX_MODE', 'off')
+    with open(args.data, newline='') as f:
+        sentences = [row['sentence'] for row in csv.DictReader(f)][:args.limit]
+    report(sentences, args.stable, args.word_ms, args.endpoint_ms)
+
+
+if __name__ == "__main__":
+    main()
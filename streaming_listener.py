@@ -0,0 +1,162 @@
+import logging
+import queue
+import threading
+import time
+
+import speech_recognition as sr
+
+from voice_to_text import recognizer, calibrate, transcribe
+
+DROP_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class StreamingListener:
+    """
+    Continuous listen mode: capture, transcription and command processing overlap.
+
+    A capture thread keeps the microphone open and pushes each detected phrase into a
+    bounded queue. A consumer thread transcribes queued audio and hands the text to
+    `process_fn` (normally control_motor.process_command), so the next command is
+    captured while the previous one is still being transcribed or executed.
+
+    When the queue is full, `drop_policy` decides what happens:
+        'block'       - capture waits for space (backpressure; audio spoken meanwhile is missed)
+        'drop_oldest' - discard the oldest queued phrase, keep the newest (default: latest command wins)
+        'drop_newest' - discard the phrase just captured
+
+    `capture_fn` replaces the microphone with another source (e.g. a replay transcriber's
+    capture); it returns the next item, or None once the source is exhausted.
+    """
+
+    def __init__(self, process_fn, transcribe_fn=transcribe, max_queue=4, drop_policy='drop_oldest',
+                 listen_timeout=1, phrase_time_limit=10, capture_fn=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of {DROP_POLICIES}")
+        self.process_fn = process_fn
+        self.transcribe_fn = transcribe_fn
+        self.capture_fn = capture_fn
+        self.drop_policy = drop_policy
+        self.listen_timeout = listen_timeout
+        self.phrase_time_limit = phrase_time_limit
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._capture_done = threading.Event()
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._depth_total = 0
+
+    def start(self):
+        if self.capture_fn is None and not calibrate():
+            raise RuntimeError("Microphone setup or noise adjustment failed")
+        self._stop.clear()
+        self._capture_done.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="listener-capture", daemon=True),
+            threading.Thread(target=self._consume_loop, name="listener-consume", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Streaming listener started (max_queue={self.queue.maxsize}, drop_policy={self.drop_policy})")
+
+    def stop(self):
+        """Stop capturing, let the consumer drain phrases already queued, and join both threads."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        logging.info(f"Streaming listener stopped: {self.stats()}")
+
+    def join(self):
+        """Wait until a finite capture_fn source is exhausted and every queued item is processed."""
+        for thread in self._threads:
+            thread.join()
+        logging.info(f"Streaming listener finished: {self.stats()}")
+
+    def _enqueue(self, item):
+        with self._stats_lock:
+            self.captured += 1
+        if self.drop_policy == 'block':
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += 1
+                if self.drop_policy == 'drop_newest':
+                    logging.warning("Listener queue full, dropping newest phrase")
+                    return
+                try:
+                    self.queue.get_nowait()
+                    logging.warning("Listener queue full, dropping oldest phrase")
+                except queue.Empty:
+                    pass
+                self.queue.put_nowait(item)
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+
+    def _capture_loop(self):
+        try:
+            if self.capture_fn is not None:
+                while not self._stop.is_set():
+                    item = self.capture_fn()
+                    if item is None:
+                        break
+                    self._enqueue((time.perf_counter(), item))
+                return
+            with sr.Microphone() as source:
+                while not self._stop.is_set():
+                    try:
+                        audio = recognizer.listen(source, timeout=self.listen_timeout,
+                                                  phrase_time_limit=self.phrase_time_limit)
+                    except sr.WaitTimeoutError:
+                        continue  # Silence; check the stop flag again
+                    self._enqueue((time.perf_counter(), audio))
+        except Exception as e:
+            logging.error(f"Capture error in streaming listener: {e}")
+            print(f"Error: Capture failed: {e}")
+        finally:
+            self._capture_done.set()
+
+    def _consume_loop(self):
+        while not ((self._stop.is_set() or self._capture_done.is_set()) and self.queue.empty()):
+            try:
+                captured_at, audio = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            text = self.transcribe_fn(audio)
+            result = self.process_fn(text) if text else None
+            latency_ms = 1000 * (time.perf_counter() - captured_at)
+            with self._stats_lock:
+                if result:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            logging.info(f"Streaming command '{text}' handled {latency_ms:.1f} ms after capture: {result}")
+            if result:
+                print(f"Result: {result}")
+            else:
+                print("Command failed or not understood. Check logs for details.")
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_depth,
+                'mean_queue_depth': self._depth_total / self.captured if self.captured else 0.0,
+                'captured': self.captured,
+                'dropped': self.dropped,
+                'processed': self.processed,
+                'failed': self.failed,
+            }
@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+COMMAND_LOGGER = 'motor.commands'
+
+_listeners = []
+
+
+def _frozen(value):
+    """Whether a log argument formats the same later as now (no dicts, lists or other objects)."""
+    if isinstance(value, tuple):
+        return all(_frozen(item) for item in value)
+    return value is None or isinstance(value, (str, bytes, int, float))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the message in the calling thread, which is the cost we
+    want off the hot path. Records only cross threads here, not processes, so the
+    unformatted msg/args can be handed over as-is, unless an argument is mutable (e.g.
+    an entities dict that apply_intent_fallback fills in afterwards): then the message
+    is formatted now, so the line shows the values at the time of the call.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            args = record.args.values() if isinstance(record.args, dict) else record.args
+            if not all(_frozen(arg) for arg in args):
+                record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line. Dict messages are merged in; anything else goes under 'message'."""
+
+    def format(self, record):
+        payload = {'ts': round(record.created, 6), 'level': record.levelname}
+        if isinstance(record.msg, dict):
+            payload.update(record.msg)
+        else:
+            payload['message'] = record.getMessage()
+        return json.dumps(payload, default=str)
+
+
+def _attach(logger, handler):
+    log_queue = queue.SimpleQueue()
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+        existing.close()
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+def setup_logging(filename='motor_control.log', commands_filename='motor_commands.jsonl', level=logging.INFO):
+    """
+    Route all logging through in-memory queues drained by background threads.
+
+    Free-text log lines go to `filename` with the usual format. Per-command records from
+    log_command() go to `commands_filename`, one JSON line per command. Any handlers that
+    earlier basicConfig() calls installed on the root logger are replaced. Queues are
+    flushed at exit.
+    """
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root = logging.getLogger()
+    root.setLevel(level)
+    _attach(root, file_handler)
+
+    if commands_filename:
+        command_handler = logging.FileHandler(commands_filename)
+        command_handler.setFormatter(JsonLineFormatter())
+        commands = logging.getLogger(COMMAND_LOGGER)
+        commands.setLevel(logging.INFO)
+        commands.propagate = False
+        _attach(commands, command_handler)
+
+
+def shutdown():
+    """Drain and stop every queue listener."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(shutdown)
+
+
+def log_command(record):
+    """Emit one structured per-command record (a dict); serialization happens on the listener thread."""
+    logging.getLogger(COMMAND_LOGGER).info(record)
+
+
+def measure_logging_overhead(commands=2000, path='/tmp/logging_overhead.log'):
+    """
+    Per-command cost of logging around map_to_command, in microseconds. Compares:
+      - 'disabled'       : logging off
+      - 'sync_debug'     : every step line formatted and written synchronously (the old behaviour)
+      - 'queued_info'    : this module's setup, step lines at DEBUG skipped, one JSON record per command
+    """
+    from motor_controller import map_to_command
+
+    steps = [('increase', {'value': 10, 'unit': '%', 'direction': None}),
+             ('set_speed', {'value': None, 'unit': 'half', 'direction': None}),
+             ('change_direction', {'value': None, 'unit': None, 'direction': 'reverse'}),
+             ('stop', {'value': None, 'unit': None, 'direction': None})]
+
+    def run(emit_record):
+        speed, direction = 0, 'clc'
+        start = time.perf_counter()
+        for i in range(commands):
+            intent, entities = steps[i % len(steps)]
+            speed, direction = map_to_command(intent, entities, speed, direction)
+            if emit_record:
+                log_command({'intent': intent, 'entities': entities, 'speed': speed, 'direction': direction})
+        return 1e6 * (time.perf_counter() - start) / commands
+
+    root = logging.getLogger()
+    results = {}
+
+    logging.disable(logging.CRITICAL)
+    results['disabled'] = run(False)
+    logging.disable(logging.NOTSET)
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    sync_handler = logging.FileHandler(path)
+    sync_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root.addHandler(sync_handler)
+    root.setLevel(logging.DEBUG)
+    results['sync_debug'] = run(False)
+    root.removeHandler(sync_handler)
+    sync_handler.close()
+
+    setup_logging(path, path + '.jsonl', logging.INFO)
+    results['queued_info'] = run(True)
+    shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    for mode, micros in measure_logging_overhead().items():
+        print(f"{mode:<12} {micros:8.1f} us/command")
@@ -1,7 +1,8 @@
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
 
-model = AutoModelForSequenceClassification.from_pretrained('./fine_tuned_intent_model').to('cuda')
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+model = AutoModelForSequenceClassification.from_pretrained('./fine_tuned_intent_model').to(device)
 tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
 
 # Forward map (label to ID, for training)
@@ -11,7 +12,7 @@ label_map = {"increase": 0, "decrease": 1, "stop": 2, "set_speed": 3, "change_di
 id_to_label = {v: k for k, v in label_map.items()}
 
 def predict_intent(text):
-    inputs = tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=32).to('cuda')
+    inputs = tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=32).to(device)
     with torch.no_grad():
         outputs = model(**inputs)
     intent_id = torch.argmax(outputs.logits, dim=1).item()
@@ -0,0 +1,200 @@
+import collections
+import importlib.util
+import logging
+import os
+import threading
+import time
+import wave
+from pathlib import Path
+
+import speech_recognition as sr
+
+import latency
+from voice_to_text import recognizer, calibrate, transcribe
+
+
+class Transcriber:
+    """
+    Source of command text: captures one utterance at a time and turns it into text.
+
+    capture() returns the next audio item, or None if nothing was captured. Once a
+    finite source runs out it sets `exhausted`. transcribe(item) returns text (or
+    None) and records the audio-to-text latency reported by stats(), over the last
+    10000 utterances so a long listening session does not grow without bound.
+    """
+
+    name = 'base'
+    uses_microphone = False
+
+    def __init__(self):
+        self.exhausted = False
+        self.count = 0
+        self._latencies = collections.deque(maxlen=10000)
+        self._lock = threading.Lock()
+
+    def capture(self):
+        raise NotImplementedError
+
+    def _transcribe(self, item):
+        raise NotImplementedError
+
+    def transcribe(self, item):
+        start = time.perf_counter()
+        text = self._transcribe(item)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.count += 1
+            self._latencies.append(elapsed)
+        logging.info(f"{self.name} transcriber: '{text}' in {1000 * elapsed:.1f} ms")
+        return text
+
+    def next_text(self):
+        """Capture and transcribe one utterance."""
+        item = self.capture()
+        return self.transcribe(item) if item is not None else None
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return {'backend': self.name, 'count': 0}
+        pick = lambda q: 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        return {
+            'backend': self.name,
+            'count': self.count,
+            'mean_ms': 1000 * sum(latencies) / len(latencies),
+            'p50_ms': pick(0.50),
+            'p95_ms': pick(0.95),
+        }
+
+
+class MicrophoneTranscriber(Transcriber):
+    """Live microphone capture, transcribed by a speech_recognition engine ('google' online, 'sphinx' offline)."""
+
+    uses_microphone = True
+
+    def __init__(self, engine='google', timeout=5, phrase_time_limit=10):
+        super().__init__()
+        self.engine = engine
+        self.name = f"microphone/{engine}"
+        self.timeout = timeout
+        self.phrase_time_limit = phrase_time_limit
+
+    def capture(self):
+        if not calibrate():
+            return None
+        try:
+            with sr.Microphone() as source:
+                print("Speak your command (pause to stop recording):")
+                logging.info("Listening for voice command...")
+                with latency.stage('asr.capture'):
+                    return recognizer.listen(source, timeout=self.timeout, phrase_time_limit=self.phrase_time_limit)
+        except Exception as e:
+            logging.error(f"Microphone error: {e}")
+            print(f"Error: Microphone setup failed: {e}")
+            return None
+
+    def _transcribe(self, audio):
+        return transcribe(audio, self.engine)
+
+
+class ReplayTranscriber(Transcriber):
+    """
+    Replays recorded utterances from a directory of .wav files (or raw .pcm at `sample_rate`/`sample_width`),
+    in sorted order, with no microphone.
+
+    With engine='sidecar', the transcript is read from the .txt file next to each recording
+    (e.g. 0001.wav + 0001.txt). This needs no network, so the rest of the pipeline can be
+    load-tested reproducibly. Any other engine runs the recorded audio through speech_recognition.
+    """
+
+    def __init__(self, directory, engine='sidecar', sample_rate=16000, sample_width=2):
+        super().__init__()
+        self.engine = engine
+        self.name = f"replay/{engine}"
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self._files = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in ('.wav', '.pcm'))
+        self._position = 0
+        if not self._files:
+            logging.warning(f"No .wav or .pcm files found in {directory}")
+            self.exhausted = True
+
+    def capture(self):
+        if self._position >= len(self._files):
+            self.exhausted = True
+            return None
+        path = self._files[self._position]
+        self._position += 1
+        self.exhausted = self._position >= len(self._files)
+        if path.suffix.lower() == '.pcm':
+            audio = sr.AudioData(path.read_bytes(), self.sample_rate, self.sample_width)
+        else:
+            with wave.open(str(path), 'rb') as wav:
+                audio = sr.AudioData(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getsampwidth())
+        return path, audio
+
+    def _transcribe(self, item):
+        path, audio = item
+        if self.engine == 'sidecar':
+            transcript = path.with_suffix('.txt')
+            if not transcript.is_file():
+                logging.error(f"No sidecar transcript for {path}")
+                return None
+            return transcript.read_text().strip() or None
+        return transcribe(audio, self.engine)
+
+
+class TextFileTranscriber(Transcriber):
+    """Passthrough source: one command per line of a text file, blank lines and '#' comments skipped."""
+
+    name = 'text'
+
+    def __init__(self, path):
+        super().__init__()
+        with open(path) as f:
+            self._lines = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        self._position = 0
+        self.exhausted = not self._lines
+
+    def capture(self):
+        if self._position >= len(self._lines):
+            self.exhausted = True
+            return None
+        line = self._lines[self._position]
+        self._position += 1
+        self.exhausted = self._position >= len(self._lines)
+        return line
+
+    def _transcribe(self, line):
+        return line
+
+
+TRANSCRIBERS = ('google', 'local', 'replay', 'text')
+
+
+def make_transcriber(backend, source=None, engine=None):
+    """
+    Build a transcriber by name.
+    Args:
+        backend (str): 'google' (microphone + Google API), 'local' (microphone + offline engine),
+            'replay' (directory of recordings) or 'text' (text file of commands).
+        source (str): Directory for 'replay', file for 'text'.
+        engine (str): Override the speech_recognition engine ('sphinx' by default for 'local',
+            'sidecar' by default for 'replay').
+    """
+    if backend == 'google':
+        return MicrophoneTranscriber(engine or 'google')
+    if backend == 'local':
+        engine = engine or 'sphinx'
+        if engine == 'sphinx' and importlib.util.find_spec('pocketsphinx') is None:
+            raise ValueError("Transcriber 'local' uses the sphinx engine, which needs pocketsphinx: "
+                             "pip install pocketsphinx (or pick another engine with --engine)")
+        return MicrophoneTranscriber(engine)
+    if backend in ('replay', 'text') and not (source and os.path.exists(source)):
+        raise ValueError(f"Transcriber '{backend}' needs an existing --source path, got {source!r}")
+    if backend == 'replay':
+        return ReplayTranscriber(source, engine or 'sidecar')
+    if backend == 'text':
+        return TextFileTranscriber(source)
+    raise ValueError(f"Unknown transcriber '{backend}', expected one of {TRANSCRIBERS}")
@@ -1,28 +1,64 @@
 import speech_recognition as sr
 import logging
+import latency
 
-# Setup logging
-logging.basicConfig(
-    filename='voice_control.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Initialize recognizer and adjust for ambient noise once
+# Recognizer is calibrated for ambient noise once, on first use or via calibrate()
 recognizer = sr.Recognizer()
-try:
-    with sr.Microphone() as source:
-        logging.info("Adjusting for ambient noise at startup...")
-        print("Adjusting for ambient noise... Please wait.")
-        recognizer.adjust_for_ambient_noise(source, duration=2)
-        logging.info("Ambient noise adjustment completed")
-except Exception as e:
-    logging.error(f"Microphone setup or noise adjustment failed: {e}")
-    print(f"Error: Microphone setup or noise adjustment failed: {e}")
-    exit(1)
+calibrated = False
+
+def calibrate(duration=2):
+    """
+    Adjust the recognizer for ambient noise. Blocks for `duration` seconds the first time;
+    later calls return immediately.
+    Returns:
+        bool: True if the recognizer is calibrated.
+    """
+    global calibrated
+    if calibrated:
+        return True
+    try:
+        with sr.Microphone() as source:
+            logging.info("Adjusting for ambient noise at startup...")
+            print("Adjusting for ambient noise... Please wait.")
+            recognizer.adjust_for_ambient_noise(source, duration=duration)
+            logging.info("Ambient noise adjustment completed")
+        calibrated = True
+    except Exception as e:
+        logging.error(f"Microphone setup or noise adjustment failed: {e}")
+        print(f"Error: Microphone setup or noise adjustment failed: {e}")
+    return calibrated
+
+def transcribe(audio, engine='google'):
+    """
+    Convert captured audio to text. Returns None if nothing was understood.
+    Args:
+        audio (sr.AudioData): Captured audio.
+        engine (str): speech_recognition engine, e.g. 'google' (online) or 'sphinx' (offline, needs pocketsphinx).
+    """
+    try:
+        logging.info(f"Transcribing audio with {engine}...")
+        with latency.stage('asr.transcribe'):
+            text = getattr(recognizer, f"recognize_{engine}")(audio)
+        logging.info(f"Transcribed text: '{text}'")
+        print(f"Transcribed text: {text}")
+        return text
+    except sr.UnknownValueError:
+        logging.error("Could not understand audio")
+        print("Error: Could not understand audio")
+        return None
+    except sr.RequestError as e:
+        logging.error(f"Speech recognition API error: {e}")
+        print(f"Error: Speech recognition API failed: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error during transcription: {e}")
+        print(f"Error: Unexpected transcription error: {e}")
+        return None
 
 def voice_to_text():
     """Capture a single spoken sentence and convert to text using pre-configured recognizer."""
+    if not calibrate():
+        return None
     try:
         with sr.Microphone() as source:
             # Prompt user to speak
@@ -30,33 +66,19 @@ def voice_to_text():
             logging.info("Listening for voice command...")
             
             # Listen with pause detection
-            audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            
-            # Transcribe audio
-            try:
-                logging.info("Transcribing audio...")
-                text = recognizer.recognize_google(audio)
-                logging.info(f"Transcribed text: '{text}'")
-                print(f"Transcribed text: {text}")
-                return text
-            except sr.UnknownValueError:
-                logging.error("Could not understand audio")
-                print("Error: Could not understand audio")
-                return None
-            except sr.RequestError as e:
-                logging.error(f"Speech recognition API error: {e}")
-                print(f"Error: Speech recognition API failed: {e}")
-                return None
-            except Exception as e:
-                logging.error(f"Unexpected error during transcription: {e}")
-                print(f"Error: Unexpected transcription error: {e}")
-                return None
+            with latency.stage('asr.capture'):
+                audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
     except Exception as e:
         logging.error(f"Microphone error: {e}")
         print(f"Error: Microphone setup failed: {e}")
         return None
 
+    # Transcribe audio
+    return transcribe(audio)
+
 if __name__ == "__main__":
+    if not calibrate():
+        exit(1)
     print("Voice-to-Text Converter (type 'exit' to quit)")
     while True:
         command = input("Press Enter to speak or type 'exit' to quit: ")